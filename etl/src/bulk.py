@@ -0,0 +1,180 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Batched loading of documents and edges in to the database.
+Documents and edges are buffered per collection and inserted with a single
+AQL INSERT per batch instead of one HTTP round trip per document.
+Keys are deterministic so that reloading the same data is idempotent.
+Edges may instead be upserted by _from and _to, which also matches edges
+of databases loaded before keys were deterministic.
+When updating existing documents, insert_only_fields are only set on new
+documents so that values curated since the last load are kept.
+Inserted documents and edges are stamped with the DBMS time as last_modified.
+"""
+import json
+import time
+import hashlib
+import logging
+
+
+def datapath_key(machine_id):
+    """Deterministic DataPath _key derived from the machine_id.
+    The Web UI routes DataPaths by integer _key, and JavaScript
+    consumers may parse it, so stay within 52 bits.
+    """
+    digest = hashlib.sha1(machine_id.encode('utf-8')).hexdigest()
+    return str(int(digest[:13], 16))
+
+def edge_key(from_id, to_id):
+    """Deterministic edge _key derived from the linked _ids."""
+    return hashlib.sha1(('%s|%s' % (from_id, to_id)).encode('utf-8')).hexdigest()
+
+class BulkLoader:
+    """Buffers documents and edges per collection and flushes
+    them in fixed-size batches.
+    """
+
+    def __init__(self, db, batch_size=5000, wait_for_sync=False, overwrite_mode='ignore', upsert_edges=False, insert_only_fields=()):
+        self.db = db
+        self.batch_size = batch_size
+        self.wait_for_sync = wait_for_sync
+        self.overwrite_mode = overwrite_mode
+        self.upsert_edges = upsert_edges
+        self.insert_only_fields = list(insert_only_fields)
+        self.document_buffers = {}
+        self.edge_buffers = {}
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, db, load_config=None, **kwargs):
+        """Instantiate from the "load" section of config.json."""
+        load_config = load_config or {}
+        options = {
+            'batch_size': load_config.get('batchSize', 5000),
+            'wait_for_sync': load_config.get('waitForSync', False)
+        }
+        options.update(kwargs)
+        return cls(db, **options)
+
+    def reset_stats(self):
+        self.documents_loaded = 0
+        self.edges_loaded = 0
+        self.stats_start = time.time()
+
+    def add_document(self, collection, document):
+        """Queue a document for insertion. Returns the document _id."""
+        buffer = self.document_buffers.setdefault(collection, [])
+        buffer.append(document)
+        if len(buffer) >= self.batch_size:
+            self.flush_documents(collection)
+        return '%s/%s' % (collection, document['_key'])
+
+    def add_edge(self, collection, from_id, to_id, body=None):
+        """Queue an edge for insertion. Returns the edge _id."""
+        edge = dict(body) if body else {}
+        edge['_key'] = edge_key(from_id, to_id)
+        edge['_from'] = from_id
+        edge['_to'] = to_id
+        buffer = self.edge_buffers.setdefault(collection, [])
+        buffer.append(edge)
+        if len(buffer) >= self.batch_size:
+            self.flush_edges(collection)
+        return '%s/%s' % (collection, edge['_key'])
+
+    def flush_documents(self, collection):
+        buffer = self.document_buffers.pop(collection, None)
+        if buffer:
+            if self.overwrite_mode == 'update' and self.insert_only_fields:
+                self.upsert_document_batch(collection, buffer)
+            else:
+                self.insert_batch(collection, buffer)
+            self.documents_loaded += len(buffer)
+
+    def flush_edges(self, collection):
+        buffer = self.edge_buffers.pop(collection, None)
+        if buffer:
+            if self.upsert_edges:
+                self.upsert_edge_batch(collection, buffer)
+            else:
+                self.insert_batch(collection, buffer)
+            self.edges_loaded += len(buffer)
+
+    def flush(self):
+        """Flush all buffered documents, then all buffered edges."""
+        for collection in list(self.document_buffers.keys()):
+            self.flush_documents(collection)
+        for collection in list(self.edge_buffers.keys()):
+            self.flush_edges(collection)
+
+    def insert_batch(self, collection, batch):
+        """Insert a batch in a single round trip.
+        overwriteMode ignore makes already existing _keys a no-op.
+        """
+        options = {
+            'overwriteMode': self.overwrite_mode,
+            'waitForSync': self.wait_for_sync
+        }
+        query = 'FOR doc IN @batch INSERT MERGE(doc, { last_modified: DATE_NOW() }) INTO @@collection OPTIONS %s' % json.dumps(options)
+        self.db.AQLQuery(
+            query,
+            bindVars={'batch': batch, '@collection': collection},
+            rawResults=True
+        )
+
+    def upsert_document_batch(self, collection, batch):
+        """Upsert a batch of documents by _key in a single round trip,
+        leaving the insert_only_fields of existing documents untouched.
+        """
+        query = """
+        FOR doc IN @batch
+            UPSERT { _key: doc._key }
+            INSERT MERGE(doc, { last_modified: DATE_NOW() })
+            UPDATE MERGE(UNSET(doc, @insert_only_fields), { last_modified: DATE_NOW() })
+            IN @@collection
+            OPTIONS %s
+        """ % json.dumps({'waitForSync': self.wait_for_sync})
+        self.db.AQLQuery(
+            query,
+            bindVars={'batch': batch, 'insert_only_fields': self.insert_only_fields, '@collection': collection},
+            rawResults=True
+        )
+
+    def upsert_edge_batch(self, collection, batch):
+        """Upsert a batch of edges by _from and _to in a single round trip,
+        served by the edge index, keeping the _key of existing edges.
+        """
+        query = """
+        FOR edge IN @batch
+            UPSERT { _from: edge._from, _to: edge._to }
+            INSERT MERGE(edge, { last_modified: DATE_NOW() })
+            UPDATE MERGE(UNSET(edge, '_key'), { last_modified: DATE_NOW() })
+            IN @@collection
+            OPTIONS %s
+        """ % json.dumps({'waitForSync': self.wait_for_sync})
+        self.db.AQLQuery(
+            query,
+            bindVars={'batch': batch, '@collection': collection},
+            rawResults=True
+        )
+
+    def log_stats(self, label):
+        """Flush and report the throughput since the last reset."""
+        self.flush()
+        elapsed = max(time.time() - self.stats_start, 1e-6)
+        logging.info(
+            'Loaded %s: %d document(s) (%.1f docs/s), %d edge(s) (%.1f edges/s) in %.1fs.',
+            label, self.documents_loaded, self.documents_loaded / elapsed,
+            self.edges_loaded, self.edges_loaded / elapsed, elapsed
+        )
+        self.reset_stats()
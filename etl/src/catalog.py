@@ -0,0 +1,148 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Materialize the SearchCatalog collection which backs the AQL search.
+One row per (OS, Release, DataModelLanguage, DataModel name, DataPath)
+so that searching is a single indexed, filtered and paginated query
+instead of a traversal of the whole graph.
+Rows are rebuilt a release at a time, server side, in a transaction so
+that searches see either the previous or the new rows of a release.
+"""
+import time
+import logging
+
+SEARCH_FIELDS = ['os_release', 'dml_name', 'dm_name', 'human_id', 'is_leaf', 'is_configurable']
+SUPERSEDED_SEARCH_FIELDS = ['os_release', 'dml_name', 'is_leaf', 'is_configurable', 'human_id']
+
+def drop_persistent_index(collection, fields):
+    """Drop the persistent index on exactly fields, if any, which the
+    optimizer could otherwise prefer over its replacement.
+    """
+    indexes = collection.getIndexes()
+    for index_type in ('persistent', 'skiplist'):
+        for index in list(indexes.get(index_type, {}).values()):
+            if index.infos.get('fields') == fields:
+                index.delete()
+
+def ensure_search_catalog(db):
+    """Create the SearchCatalog collection and its indexes if missing."""
+    if not db.hasCollection('SearchCatalog'):
+        db.createCollection('SearchCatalog')
+    catalog = db['SearchCatalog']
+    catalog.ensureFulltextIndex(fields=['human_id'])
+    catalog.ensureFulltextIndex(fields=['machine_id'])
+    drop_persistent_index(catalog, SUPERSEDED_SEARCH_FIELDS)
+    # Filters and sort of the search form, the flags trailing so that the
+    # search is covered by the index with or without filtering on them.
+    catalog.ensurePersistentIndex(
+        fields=SEARCH_FIELDS,
+        unique=False,
+        sparse=False
+    )
+    catalog.ensurePersistentIndex(
+        fields=['release_id'],
+        unique=False,
+        sparse=False
+    )
+    catalog.ensurePersistentIndex(
+        fields=['dp_key'],
+        unique=False,
+        sparse=False
+    )
+
+def fetch_release_ids(db):
+    release_query = """
+    FOR release IN Release
+        SORT release._id
+        RETURN release._id
+    """
+    return list(db.AQLQuery(release_query, rawResults=True, batchSize=1000))
+
+# Collections read while cataloging a release.
+CATALOG_SOURCES = [
+    'OS', 'OSHasRelease', 'Release', 'ReleaseHasDataModel', 'DataModel',
+    'OfDataModelLanguage', 'DataModelLanguage', 'DataPathFromDataModel', 'DataPath'
+]
+
+# Runs the queries of populate_release_catalog as one transaction.
+REPLACE_RELEASE_ACTION = """
+function (params) {
+    var db = require('@arangodb').db;
+    db._query(params.remove_query, { release_id: params.release_id });
+    return db._query(params.insert_query, { release_id: params.release_id }).toArray()[0];
+}
+"""
+
+def populate_release_catalog(db, release_id):
+    """Replace the SearchCatalog rows of a release atomically.
+    Returns the row count.
+    """
+    remove_query = """
+    FOR row IN SearchCatalog
+        FILTER row.release_id == @release_id
+        REMOVE row IN SearchCatalog
+    """
+    insert_query = """
+    LET release = DOCUMENT(@release_id)
+    LET os = FIRST(
+        FOR release_os IN 1..1 INBOUND release OSHasRelease
+            RETURN release_os
+    )
+    LET inserted = (
+        FOR dm IN 1..1 OUTBOUND release ReleaseHasDataModel
+            FOR dml IN 1..1 INBOUND dm OfDataModelLanguage
+                FOR dp IN 1..1 OUTBOUND dm DataPathFromDataModel
+                    COLLECT dml_name = dml.name, dm_name = dm.name, dp_id = dp._id
+                    LET dp_doc = DOCUMENT(dp_id)
+                    INSERT {
+                        "release_id": release._id,
+                        "os_name": os.name,
+                        "release_name": release.name,
+                        "os_release": CONCAT_SEPARATOR(" - ", os.name, release.name),
+                        "dml_name": dml_name,
+                        "dm_name": dm_name,
+                        "dp_key": dp_doc._key,
+                        "human_id": dp_doc.human_id,
+                        "machine_id": dp_doc.machine_id,
+                        "is_leaf": dp_doc.is_leaf,
+                        "is_configurable": dp_doc.is_configurable
+                    } INTO SearchCatalog
+                    RETURN 1
+    )
+    RETURN LENGTH(inserted)
+    """
+    return db.transaction(
+        collections={'read': CATALOG_SOURCES, 'write': ['SearchCatalog']},
+        action=REPLACE_RELEASE_ACTION,
+        params={
+            'release_id': release_id,
+            'remove_query': remove_query,
+            'insert_query': insert_query
+        }
+    )['result']
+
+def populate_search_catalog(db, release_ids=None):
+    """Entry point of (re)building the SearchCatalog, of every release
+    or only of release_ids.
+    """
+    ensure_search_catalog(db)
+    if release_ids is None:
+        release_ids = fetch_release_ids(db)
+    for release_id in sorted(release_ids):
+        start = time.time()
+        inserted = populate_release_catalog(db, release_id)
+        logging.info(
+            'Cataloged %s: %d row(s) in %.1fs.',
+            release_id, inserted, time.time() - start
+        )
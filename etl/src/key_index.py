@@ -0,0 +1,72 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Compact index of what has already been queued for loading.
+Document keys are interned to dense integer IDs and edge existence is
+tracked as a set of (from, to) pairs packed in to single 64-bit integers.
+Edges are directed, (a, b) and (b, a) are distinct.
+"""
+
+MAX_DENSE_ID = (1 << 32) - 1
+
+class KeyIndex:
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        # collection -> {key: dense id << 1 | queued bit}
+        self.documents = {}
+        # edge collection -> {from dense id << 32 | to dense id}
+        self.edges = {}
+        self.next_id = 0
+
+    def intern(self, collection, key):
+        """Intern a document key and return its dense id.
+        Integer-like keys should be passed as int to save memory.
+        """
+        return self._intern(collection, key) >> 1
+
+    def queue(self, collection, key):
+        """Intern a document key and mark it as queued for loading.
+        Returns (dense id, whether it was not queued before).
+        """
+        keys = self.documents.setdefault(collection, {})
+        entry = self._intern(collection, key)
+        keys[key] = entry | 1
+        return entry >> 1, not entry & 1
+
+    def _intern(self, collection, key):
+        """Entries are stored as dense id << 1 | queued bit."""
+        keys = self.documents.setdefault(collection, {})
+        entry = keys.get(key)
+        if entry is not None:
+            return entry
+        if self.next_id > MAX_DENSE_ID:
+            raise OverflowError('KeyIndex exhausted 32-bit dense IDs!')
+        entry = keys[key] = self.next_id << 1
+        self.next_id += 1
+        return entry
+
+    def add_edge(self, collection, from_dense_id, to_dense_id):
+        """Record a directed edge. Returns whether it is new."""
+        packed = (from_dense_id << 32) | to_dense_id
+        edges = self.edges.setdefault(collection, set())
+        if packed in edges:
+            return False
+        edges.add(packed)
+        return True
+
+    def count(self, collection):
+        return len(self.documents.get(collection, {}))
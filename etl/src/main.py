@@ -26,11 +26,12 @@ import time
 import argparse
 from urllib.parse import urlparse
 from pyArango.connection import Connection
-from models import create_schema
-from static import populate_static
-from yang import populate_yang
+from models import create_schema, create_indexes, bump_catalog_revision, fetch_db_time, touch_datapaths
+from static import populate_static, populate_os_releases
+from yang import populate_yang, populate_yang_incremental
 from snmp import populate_snmp
-from search import populate_search
+from search import populate_search, sync_search
+from catalog import populate_search_catalog
 
 def load_config(filename='config.json'):
     config = None
@@ -85,22 +86,58 @@ def main():
             time.sleep(3)
     logging.info('Creating database.')
     created, db = create_database(conn)
-    if not created:
-        logging.error('TDM database already exists! Not overwriting.')
+    # Releases whose SearchCatalog rows need rebuilding, None for all.
+    catalog_release_ids = None
+    if not created and args.stage == 'incremental':
+        logging.info('Ensuring database indexes.')
+        create_indexes(db)
+        load_start = fetch_db_time(db)
+        logging.info('Adding new OS releases.')
+        populate_os_releases(db, skip_existing=True)
+        logging.info('Incrementally populating YANG data.')
+        catalog_release_ids = populate_yang_incremental(
+            db,
+            config.get('load'),
+            args.workers,
+            config.get('yang', {}).get('parseCacheDir')
+        )
+        logging.info('Marked %d DataPath(s) as modified.', touch_datapaths(db, load_start))
+    elif not created:
+        if args.stage not in ('search', 'search-sync'):
+            logging.error('TDM database already exists! Not overwriting.')
     else:
         logging.info('Creating database schema.')
         create_schema(db)
         logging.info('Populating static data.')
         populate_static(db)
         logging.info('Populating MIB data.')
-        populate_snmp(db)
+        populate_snmp(db, config.get('snmp'), config.get('load'))
         logging.info('Populating YANG data.')
-        populate_yang(db)
+        populate_yang(
+            db,
+            config.get('load'),
+            args.workers,
+            config.get('yang', {}).get('parseCacheDir')
+        )
+    if created or args.stage == 'incremental':
+        logging.info('Populating search catalog.')
+        populate_search_catalog(db, catalog_release_ids)
+        logging.info('Catalog revision %s.', bump_catalog_revision(db))
     if created or args.stage == 'search':
         logging.info('Awaiting Search availability.')
         await_url(config['search']['searchURL'])
         logging.info('Populating search database with parsed data.')
-        populate_search(db, config['search']['searchURL'])
+        populate_search(db, config['search']['searchURL'], search_config=config['search'])
+    elif args.stage in ('search-sync', 'incremental'):
+        logging.info('Awaiting Search availability.')
+        await_url(config['search']['searchURL'])
+        logging.info('Syncing search database with modified data.')
+        sync_search(
+            db,
+            config['search']['searchURL'],
+            search_config=config['search'],
+            interval=args.interval if args.stage == 'search-sync' else None
+        )
     logging.info('ETL process complete!')
 
 def setup_args():
@@ -109,9 +146,19 @@ def setup_args():
     )
     parser.add_argument('--stage',
         nargs='?',
-        help='None | search',
+        help='None | search | search-sync | incremental',
         default=None
     )
+    parser.add_argument('--interval',
+        type=float,
+        help='Seconds between search-sync runs, runs once if not specified',
+        default=None
+    )
+    parser.add_argument('--workers',
+        type=int,
+        help='Number of processes to parse YANG releases with',
+        default=1
+    )
     return parser.parse_args()
 
 if __name__ == '__main__':
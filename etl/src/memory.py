@@ -0,0 +1,45 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Memory high-water mark reporting for the ETL stages.
+Relies on Linux /proc when available, which is the case in the ETL container.
+"""
+import resource
+
+
+def reset_peak_rss():
+    """Reset the kernel high-water mark (VmHWM) of this process.
+    Returns False if unsupported, in which case peak_rss is
+    the peak over the lifetime of the process.
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_fd:
+            clear_fd.write('5')
+    except OSError:
+        return False
+    return True
+
+def peak_rss():
+    """Peak resident set size of this process in bytes."""
+    try:
+        with open('/proc/self/status', 'r') as status_fd:
+            for line in status_fd:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def format_bytes(num_bytes):
+    return '%.1f MiB' % (num_bytes / (1024 * 1024))
@@ -38,7 +38,8 @@ class DataPath(Collection):
         'is_leaf': Field(),
         'is_variable': Field(),
         'is_configurable': Field(),
-        'verified': Field()
+        'verified': Field(),
+        'last_modified': Field()
     }
 
 class DataModel(Collection):
@@ -213,6 +214,64 @@ class Calculation(Collection):
         'author': Field()
     }
 
+class CatalogRevision(Collection):
+    """A counter bumped whenever the catalog changes,
+    which consumers use to invalidate their caches.
+    """
+
+    _validation = {
+        'on_save': False,
+        'on_set': False,
+        'allow_foreign_fields': True
+    }
+
+    _fields = {
+        'revision': Field(),
+        'updated': Field()
+    }
+
+class SearchCatalog(Collection):
+    """A denormalized row per OS, Release, DataModelLanguage,
+    DataModel and DataPath, which the search API queries.
+    Derived from the graph and rebuilt by catalog.py.
+    """
+
+    _validation = {
+        'on_save': False,
+        'on_set': False,
+        'allow_foreign_fields': True
+    }
+
+    _fields = {
+        'release_id': Field(),
+        'os_name': Field(),
+        'release_name': Field(),
+        'os_release': Field(),
+        'dml_name': Field(),
+        'dm_name': Field(),
+        'dp_key': Field(),
+        'human_id': Field(),
+        'machine_id': Field(),
+        'is_leaf': Field(),
+        'is_configurable': Field()
+    }
+
+class SearchCheckpoint(Collection):
+    """The last_modified time, per search index, up to which
+    DataPaths have been synced in to the search database.
+    """
+
+    _validation = {
+        'on_save': False,
+        'on_set': False,
+        'allow_foreign_fields': True
+    }
+
+    _fields = {
+        'checkpoint': Field(),
+        'updated': Field()
+    }
+
 class DeviceHasDataPath(Edges):
     """Indicates that it has been validated that a Device does
     have a specified DataPath available.
@@ -373,7 +432,10 @@ def create_collections(db):
         'Encoding': Encoding,
         'DataType': DataType,
         'Device': Device,
-        'Calculation': Calculation
+        'Calculation': Calculation,
+        'CatalogRevision': CatalogRevision,
+        'SearchCatalog': SearchCatalog,
+        'SearchCheckpoint': SearchCheckpoint
     }
     for collection_name in collection_classes.keys():
         db.createCollection(collection_name)
@@ -410,12 +472,32 @@ def create_edges(db):
 def create_indexes(db):
     """Create the indexes which provide uniqueness,
     searchability, etc. on certain properties of elements.
+    Existing indexes are left as is, so this is safe to rerun.
     """
     db['DataPath'].ensureSkiplistIndex(
         fields=['machine_id'],
         unique=True,
         sparse=False
     )
+    # Exact lookups by either identifier, e.g. the web tier
+    # resolving user provided paths.
+    db['DataPath'].ensurePersistentIndex(
+        fields=['human_id'],
+        unique=False,
+        sparse=False
+    )
+    db['Calculation'].ensurePersistentIndex(
+        fields=['name'],
+        unique=False,
+        sparse=False
+    )
+    # Changes since a search sync checkpoint, see touch_datapaths.
+    for collection_name in ('DataPath', 'DataPathFromDataModel', 'ReleaseHasDataModel', 'OfDataModelLanguage'):
+        db[collection_name].ensurePersistentIndex(
+            fields=['last_modified'],
+            unique=False,
+            sparse=True
+        )
     db['DataPath'].ensureFulltextIndex(
         fields=['machine_id']
     )
@@ -426,6 +508,59 @@ def create_indexes(db):
         fields=['description']
     )
 
+def bump_catalog_revision(db):
+    """Record that the catalog changed. Creates the
+    CatalogRevision collection on databases which predate it.
+    """
+    if not db.hasCollection('CatalogRevision'):
+        db.createCollection('CatalogRevision')
+    bump_query = """
+    UPSERT { _key: 'catalog' }
+        INSERT { _key: 'catalog', revision: 1, updated: DATE_NOW() }
+        UPDATE { revision: OLD.revision + 1, updated: DATE_NOW() }
+        IN CatalogRevision
+    RETURN NEW.revision
+    """
+    return db.AQLQuery(bump_query, rawResults=True)[0]
+
+def fetch_db_time(db):
+    """The DBMS clock, which last_modified is stamped with, in ms."""
+    return db.AQLQuery('RETURN DATE_NOW()', rawResults=True)[0]
+
+def touch_datapaths(db, since):
+    """Bump last_modified of the DataPaths whose DataModels, Releases or
+    DataModelLanguages were linked since the given time, as their search
+    documents change although the DataPaths themselves are unchanged.
+    Returns the number of DataPaths touched.
+    """
+    touch_query = """
+    LET now = DATE_NOW()
+    LET dm_ids = UNION_DISTINCT(
+        (FOR release_dm IN ReleaseHasDataModel
+            FILTER release_dm.last_modified >= @since
+            RETURN release_dm._to),
+        (FOR dml_dm IN OfDataModelLanguage
+            FILTER dml_dm.last_modified >= @since
+            RETURN dml_dm._to)
+    )
+    LET dp_ids = UNION_DISTINCT(
+        (FOR dm_id IN dm_ids
+            FOR dm_dp IN DataPathFromDataModel
+                FILTER dm_dp._from == dm_id
+                RETURN dm_dp._to),
+        (FOR new_dm_dp IN DataPathFromDataModel
+            FILTER new_dm_dp.last_modified >= @since
+            RETURN new_dm_dp._to)
+    )
+    LET touched = (
+        FOR dp_id IN dp_ids
+            UPDATE PARSE_IDENTIFIER(dp_id).key WITH { last_modified: now } IN DataPath
+            RETURN 1
+    )
+    RETURN LENGTH(touched)
+    """
+    return db.AQLQuery(touch_query, bindVars={'since': since}, rawResults=True)[0]
+
 def create_schema(db):
     """Create the schema!"""
     create_collections(db)
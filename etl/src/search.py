@@ -14,57 +14,153 @@ limitations under the License.
 """
 """Load a search database with TDM data for fast/efficient searches
 from search web interface. Uses ElasticSearch.
+Each load builds a new versioned index, with refresh and replicas off,
+and then atomically points the index alias at it so searches never see
+a partial index.
+Documents are identified by the DataPath _key, so sync_search can
+re-index just the DataPaths modified since the last load or sync.
 """
+import time
 import logging
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import streaming_bulk
+from elasticsearch.helpers import parallel_bulk
 from elasticsearch.exceptions import TransportError
+from models import fetch_db_time
 
 
-def populate_search(db, search_host='search:9200', index='datapath', doc_type='doc'):
+def populate_search(db, search_host='search:9200', index='datapath', doc_type='doc', search_config=None):
+    """index is the alias searched by the Web interface,
+    the documents are loaded in to a new index behind it.
+    """
+    search_config = search_config or {}
     logging.getLogger('elasticsearch').setLevel(logging.WARN)
+    checkpoint = fetch_db_time(db)
     logging.info('Acquiring DataPaths from TDM...')
     query_iterable = query_all_datapaths(db)
     logging.info('Setting up ES...')
     es = Elasticsearch(search_host)
-    setup_search_db(es, index)
-    logging.info('Populating ES with DataPaths...')
-    populate_search_db(es, query_iterable, index, doc_type)
+    versioned_index = '%s-%s' % (index, time.strftime('%Y%m%d%H%M%S'))
+    setup_search_db(es, versioned_index)
+    logging.info('Populating ES index %s with DataPaths...', versioned_index)
+    start = time.time()
+    populate_search_db(
+        es, query_iterable, versioned_index, doc_type,
+        search_config.get('indexWorkers', 4),
+        search_config.get('chunkSize', 1000)
+    )
+    logging.info('Indexed DataPaths in %.1fs.', time.time() - start)
+    finalize_search_db(es, versioned_index, search_config.get('replicas', 0))
+    logging.info('Pointing ES alias %s at %s...', index, versioned_index)
+    swap_search_alias(es, index, versioned_index)
+    save_search_checkpoint(db, index, checkpoint)
+
+def sync_search(db, search_host='search:9200', index='datapath', doc_type='doc', search_config=None, interval=None):
+    """Re-index the DataPaths modified since the stored checkpoint,
+    every interval seconds if given, otherwise once. Falls back to a
+    full populate_search if there is no checkpoint or index yet.
+    """
+    search_config = search_config or {}
+    logging.getLogger('elasticsearch').setLevel(logging.WARN)
+    es = Elasticsearch(search_host)
+    while True:
+        checkpoint = load_search_checkpoint(db, index)
+        if checkpoint is None or not es.indices.exists_alias(name=index):
+            logging.info('No search checkpoint for %s, fully populating.', index)
+            populate_search(db, search_host, index, doc_type, search_config)
+        else:
+            next_checkpoint = fetch_db_time(db)
+            start = time.time()
+            indexed = populate_search_db(
+                es, query_all_datapaths(db, since=checkpoint), index, doc_type,
+                search_config.get('indexWorkers', 4),
+                search_config.get('chunkSize', 1000)
+            )
+            save_search_checkpoint(db, index, next_checkpoint)
+            logging.info('Synced %d DataPath(s) in to %s in %.1fs.', indexed, index, time.time() - start)
+        if not interval:
+            break
+        time.sleep(interval)
+
+def load_search_checkpoint(db, index):
+    if not db.hasCollection('SearchCheckpoint'):
+        return None
+    checkpoint_query = """
+    RETURN DOCUMENT("SearchCheckpoint", @index).checkpoint
+    """
+    return db.AQLQuery(checkpoint_query, bindVars={'index': index}, rawResults=True)[0]
 
-def query_all_datapaths(db):
-    """Queries TDM and flattens the DataPath structure for our search purposes.
-    2 stage query due to not all DataPaths being linked to OS/Releases (OIDs).
+def save_search_checkpoint(db, index, checkpoint):
+    """Creates the SearchCheckpoint collection on databases which predate it."""
+    if not db.hasCollection('SearchCheckpoint'):
+        db.createCollection('SearchCheckpoint')
+    checkpoint_query = """
+    UPSERT { _key: @index }
+        INSERT { _key: @index, checkpoint: @checkpoint, updated: DATE_NOW() }
+        UPDATE { checkpoint: @checkpoint, updated: DATE_NOW() }
+        IN SearchCheckpoint
+    """
+    db.AQLQuery(checkpoint_query, bindVars={'index': index, 'checkpoint': checkpoint}, rawResults=True)
+
+def query_all_datapaths(db, since=None):
+    """Queries TDM and flattens each DataPath, with the DataModels,
+    DataModelLanguages, Releases and OSes it belongs to as keyword arrays,
+    in to one search document. DataPaths without OS/Releases (OIDs)
+    simply have empty arrays for those.
+    since limits to the DataPaths with a last_modified since then, which
+    includes those no longer in any DataModel so that their documents can
+    be removed.
     """
     query = """
-    RETURN FLATTEN(
-        FOR dp IN DataPath
-            FOR v, e, p IN 2..2 INBOUND dp DataPathFromDataModel, OfDataModelLanguage
-                LET dp_min = {
-                    "dp_key": p.vertices[0]._key,
-                    "dp_machine_id": p.vertices[0].machine_id,
-                    "dp_human_id": p.vertices[0].human_id,
-                    "dp_description": p.vertices[0].description,
-                    "dp_is_leaf": p.vertices[0].is_leaf,
-                    "dp_is_configurable": p.vertices[0].is_configurable,
-                    "dml_key": p.vertices[2]._key,
-                    "dml_name": p.vertices[2].name
-                }
-                LET dp_ext = (
-                    FOR subv, sube, subp IN 2..2 INBOUND p.vertices[1] ReleaseHasDataModel, OSHasRelease
-                        RETURN {
-                            "dm_key": subp.vertices[0]._key,
-                            "dm_name": subp.vertices[0].name,
-                            "dm_revision": subp.vertices[0].revision,
-                            "release_key": subp.vertices[1]._key,
-                            "release_name": subp.vertices[1].name,
-                            "os_key": subp.vertices[2]._key,
-                            "os_name": subp.vertices[2].name
+    FOR dp IN DataPath
+        %s
+        LET dms = (
+            FOR dm IN 1..1 INBOUND dp DataPathFromDataModel
+                RETURN dm
+        )
+        LET dmls = (
+            FOR dml_dm IN dms
+                FOR dml IN 1..1 INBOUND dml_dm OfDataModelLanguage
+                    RETURN DISTINCT dml
+        )
+        %s
+        LET releases = (
+            FOR release_dm IN dms
+                FOR release IN 1..1 INBOUND release_dm ReleaseHasDataModel
+                    FOR os IN 1..1 INBOUND release OSHasRelease
+                        RETURN DISTINCT {
+                            "release_key": release._key,
+                            "release_name": release.name,
+                            "os_key": os._key,
+                            "os_name": os.name
                         }
-                )
-                RETURN LENGTH(dp_ext) != 0 ? (FOR ext IN dp_ext RETURN MERGE(dp_min, ext)) : dp_min
+        )
+        RETURN {
+            "dp_key": dp._key,
+            "dp_machine_id": dp.machine_id,
+            "dp_human_id": dp.human_id,
+            "dp_description": dp.description,
+            "dp_is_leaf": dp.is_leaf,
+            "dp_is_configurable": dp.is_configurable,
+            "dml_key": dmls[*]._key,
+            "dml_name": dmls[*].name,
+            "dm_key": dms[*]._key,
+            "dm_name": UNIQUE(dms[*].name),
+            "dm_revision": UNIQUE(dms[*].revision),
+            "release_key": releases[*].release_key,
+            "release_name": UNIQUE(releases[*].release_name),
+            "os_key": UNIQUE(releases[*].os_key),
+            "os_name": UNIQUE(releases[*].os_name),
+            "os_release": (
+                FOR release IN releases
+                    RETURN CONCAT_SEPARATOR(" - ", release.os_name, release.release_name)
+            )
+        }
+    """ % (
+        'FILTER dp.last_modified >= @since' if since is not None else '',
+        'FILTER LENGTH(dmls) != 0' if since is None else ''
     )
-    """
-    return db.AQLQuery(query, rawResults=True, batchSize=1000)
+    bind_vars = {'since': since} if since is not None else {}
+    return db.AQLQuery(query, bindVars=bind_vars, rawResults=True, batchSize=1000)
 
 def setup_search_db(es, index):
     """Setup the index in ES for our data. Derived from:
@@ -77,20 +173,33 @@ def setup_search_db(es, index):
     Applies a custom analyzer and provides the machine_id and human_id of the DataPaths as
     fulltext search and as terms for aggregation.
     """
-    # Specifies both text and keyword for both fulltext and agg capability
+    # Specifies both text and keyword for both fulltext and agg capability,
+    # plus edge n-grams of each path element for prefix matching
+    # and trigrams of the whole path for substring matching.
     path_mapping = {
         'type': 'text',
         'analyzer': 'generic_path_analyzer',
         'fields': {
             'keyword': {
                 'type': 'keyword'
+            },
+            'prefix': {
+                'type': 'text',
+                'analyzer': 'path_prefix_analyzer',
+                'search_analyzer': 'path_prefix_search_analyzer'
+            },
+            'trigram': {
+                'type': 'text',
+                'analyzer': 'path_trigram_analyzer'
             }
         }
     }
     index_payload = {
         'settings': {
             'number_of_shards': 1,
+            # Restored by finalize_search_db once loaded.
             'number_of_replicas': 0,
+            'refresh_interval': '-1',
             'analysis': {
                 'analyzer': {
                     'generic_path_analyzer': {
@@ -101,15 +210,49 @@ def setup_search_db(es, index):
                             'lowercase',
                             'network_synonym'
                         ]
+                    },
+                    'path_prefix_analyzer': {
+                        'type': 'custom',
+                        'tokenizer': 'generic_path_tokenizer',
+                        'filter': [
+                            'preserve_word_delimiter',
+                            'lowercase',
+                            'path_edge_ngram'
+                        ]
+                    },
+                    'path_prefix_search_analyzer': {
+                        'type': 'custom',
+                        'tokenizer': 'generic_path_tokenizer',
+                        'filter': [
+                            'lowercase'
+                        ]
+                    },
+                    'path_trigram_analyzer': {
+                        'type': 'custom',
+                        'tokenizer': 'keyword',
+                        'filter': [
+                            'lowercase',
+                            'path_trigram'
+                        ]
                     }
                 },
                 'tokenizer': {
                     'generic_path_tokenizer': {
                         'type': 'simple_pattern_split',
-                        'tokenizer': '[\.\-\/\:]'
+                        'pattern': '[\.\-\/\: ]'
                     }
                 },
                 'filter': {
+                    'path_edge_ngram': {
+                        'type': 'edge_ngram',
+                        'min_gram': 1,
+                        'max_gram': 32
+                    },
+                    'path_trigram': {
+                        'type': 'ngram',
+                        'min_gram': 3,
+                        'max_gram': 3
+                    },
                     'preserve_word_delimiter': {
                         'type': 'word_delimiter',
                         'preserve_original': True
@@ -146,7 +289,8 @@ def setup_search_db(es, index):
                     'release_key': {'type': 'keyword'},
                     'release_name': {'type': 'keyword'},
                     'os_key': {'type': 'keyword'},
-                    'os_name': {'type': 'keyword'}
+                    'os_name': {'type': 'keyword'},
+                    'os_release': {'type': 'keyword'}
                 }
             }
         }
@@ -162,30 +306,81 @@ def setup_search_db(es, index):
         else:
             logging.exception('Error when creating index in ES!')
 
-def populate_search_db(es, query_iterable, index, doc_type):
+def populate_search_db(es, query_iterable, index, doc_type, workers=4, chunk_size=1000):
     """Populate ElasticSearch with the flattened DataPaths.
     Derived from https://github.com/elastic/elasticsearch-py/blob/master/example/load.py#L102
+    Returns the number of documents indexed.
+    DataPaths in no DataModel have their documents removed instead.
     """
+    unlinked_keys = []
     def iter_add_id(iterable):
-        """We need to add a uid before insertion (I think).
-        Every example seen has an _id property in the struct.
+        """The DataPath _key is the document _id, so re-indexing
+        a DataPath replaces its document.
         """
-        counter = 0
-        for result in iterable:
-            if not isinstance(result, (list,)):
-                logging.error('Expected result to be list in iterable!')
-            for element in result:
-                element['_id'] = counter
-                counter += 1
-                yield element
-    for ok, result in streaming_bulk(
+        for element in iterable:
+            if not element['dml_name']:
+                unlinked_keys.append(element['dp_key'])
+                continue
+            element['_id'] = element['dp_key']
+            yield element
+    indexed = 0
+    for ok, result in parallel_bulk(
             es,
             iter_add_id(query_iterable),
+            thread_count=workers,
+            chunk_size=chunk_size,
+            queue_size=workers,
             index=index,
             doc_type=doc_type,
             request_timeout=None
         ):
-        action, result = result.popitem()
-        doc_id = '/%s/%s/%s' % (index, doc_type, result['_id'])
         if not ok:
+            action, result = result.popitem()
+            doc_id = '/%s/%s/%s' % (index, doc_type, result['_id'])
             logging.error('Failed to %s document %s: %r' % (action, doc_id, result))
+        else:
+            indexed += 1
+    for start in range(0, len(unlinked_keys), chunk_size):
+        es.delete_by_query(
+            index=index,
+            body={'query': {'ids': {'values': unlinked_keys[start:start + chunk_size]}}},
+            conflicts='proceed'
+        )
+    if unlinked_keys:
+        logging.info('Removed %d document(s) of unlinked DataPaths from %s.', len(unlinked_keys), index)
+    return indexed
+
+def finalize_search_db(es, index, replicas=0):
+    """Restore the refresh interval and replicas turned off for loading,
+    and merge the index down now that it is complete.
+    """
+    es.indices.put_settings(
+        index=index,
+        body={
+            'index': {
+                'refresh_interval': None,
+                'number_of_replicas': replicas
+            }
+        }
+    )
+    es.indices.refresh(index=index)
+    es.indices.forcemerge(index=index, max_num_segments=1, request_timeout=None)
+    es.cluster.health(index=index, wait_for_status='yellow', request_timeout=None)
+
+def swap_search_alias(es, alias, index):
+    """Atomically point alias at index and drop the indexes it pointed at.
+    An index which is named like the alias, from before aliases were
+    used, is removed in the same step.
+    """
+    actions = []
+    old_indexes = []
+    if es.indices.exists_alias(name=alias):
+        old_indexes = [old_index for old_index in es.indices.get_alias(name=alias).keys() if old_index != index]
+        actions.extend({'remove': {'index': old_index, 'alias': alias}} for old_index in old_indexes)
+    elif es.indices.exists(index=alias):
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(body={'actions': actions})
+    for old_index in old_indexes:
+        logging.info('Deleting ES index %s.', old_index)
+        es.indices.delete(index=old_index)
@@ -16,17 +16,164 @@ limitations under the License.
 import os
 import sys
 import json
-from ftplib import FTP
+import time
+import shutil
+import hashlib
+import threading
+import re
+from itertools import repeat
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from urllib.parse import urlparse
+from ftplib import FTP, error_perm
+from ftplib import all_errors as ftp_errors
 from pysmi.reader import FileReader
 from pysmi.searcher import AnyFileSearcher, StubSearcher
 from pysmi.writer import FileWriter
 from pysmi.parser import SmiV1CompatParser
 from pysmi.codegen import JsonCodeGen
-from pysmi.compiler import MibCompiler
+from pysmi.compiler import MibCompiler, MibStatus, statusFailed
 from pysmi import error
 from pysmi import debug
 import logging
+from bulk import BulkLoader, datapath_key
 
+MANIFEST_FILENAME = '.manifest.json'
+COMPILE_MANIFEST_FILENAME = 'mib_compile_manifest.json'
+COMPILE_REPORT_FILENAME = 'mib_compile_report.json'
+
+re_asn1_comment = re.compile(r'--.*$', re.M)
+re_mib_definitions = re.compile(r'^\s*([A-Za-z][\w-]*)\s+DEFINITIONS\s*::=\s*BEGIN', re.M)
+re_mib_imports = re.compile(r'\bIMPORTS\b(.*?);', re.S)
+re_mib_from = re.compile(r'\bFROM\s+([A-Za-z][\w-]*)')
+
+def hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as file_fd:
+        for chunk in iter(lambda: file_fd.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+OIDRecord = namedtuple('OIDRecord', ['oid', 'name', 'description', 'data_type'])
+
+def write_debug_json(file_path, oid_records):
+    """Write OIDRecords as the reorganized JSON formerly loaded from newmibjson/."""
+    new_json = {}
+    for oid_record in oid_records:
+        new_json[oid_record.oid] = {
+            'oid': oid_record.oid,
+            'name': oid_record.name,
+            'description': oid_record.description,
+            'dataType': oid_record.data_type
+        }
+    with open(file_path, 'w') as json_fd:
+        json.dump(new_json, json_fd, indent=4)
+
+def create_mib_compiler(local_mib_dir, local_json_dir):
+    mib_compiler = MibCompiler(
+        SmiV1CompatParser(),
+        JsonCodeGen(),
+        FileWriter(local_json_dir).setOptions(suffix='.json')
+    )
+    mib_compiler.addSources(FileReader(local_mib_dir, recursive=True))
+    mib_stubs = JsonCodeGen.baseMibs
+    searchers = [AnyFileSearcher(local_json_dir).setOptions(exts=['.json']), StubSearcher(*mib_stubs)]
+    mib_compiler.addSearchers(*searchers)
+    return mib_compiler
+
+def compile_mib(mib_filename, local_mib_dir, local_json_dir):
+    """Compile a single MIB, as the process pool worker.
+    Dependencies are expected to be compiled already and are left untouched.
+    Returns ({MIB name: (status, attributes)}, seconds) as picklable,
+    and JSON serializable, data.
+    """
+    start = time.time()
+    try:
+        mib_compiler = create_mib_compiler(local_mib_dir, local_json_dir)
+        processed = mib_compiler.compile(
+            mib_filename,
+            **dict(
+                noDeps=False,
+                rebuild=False,
+                genTexts=True,
+                writeMibs=True,
+                ignoreErrors=True
+            )
+        )
+    except error.PySmiError:
+        processed = {mib_filename: statusFailed.setOptions(error=sys.exc_info()[1])}
+    statuses = {}
+    for name, status in processed.items():
+        attributes = {}
+        for key, value in vars(status).items():
+            if isinstance(value, (tuple, set, frozenset)):
+                attributes[key] = list(value)
+            elif isinstance(value, (str, int, float, bool, list, dict, type(None))):
+                attributes[key] = value
+            else:
+                attributes[key] = str(value)
+        statuses[name] = (str(status), attributes)
+    return statuses, time.time() - start
+
+def scan_mib_imports(local_mib_dir, mib_filenames):
+    """{MIB name: (filename, source hash, [imported MIB names])}
+    Only imports of MIBs present in mib_filenames are kept.
+    """
+    mib_graph = {}
+    for filename in mib_filenames:
+        with open(os.path.join(local_mib_dir, filename), 'rb') as mib_fd:
+            source = mib_fd.read()
+        text = re_asn1_comment.sub('', source.decode('latin-1'))
+        name_match = re_mib_definitions.search(text)
+        mib_name = name_match.group(1) if name_match else os.path.splitext(filename)[0]
+        imports_match = re_mib_imports.search(text)
+        imports = re_mib_from.findall(imports_match.group(1)) if imports_match else []
+        mib_graph[mib_name] = (filename, hashlib.sha256(source).hexdigest(), imports)
+    for mib_name, (filename, source_hash, imports) in mib_graph.items():
+        local_imports = sorted({name for name in imports if name in mib_graph and name != mib_name})
+        mib_graph[mib_name] = (filename, source_hash, local_imports)
+    return mib_graph
+
+def get_effective_hashes(mib_graph):
+    """Hash of each MIB's source combined with the hashes of its imports,
+    so that a change to an imported MIB invalidates its importers.
+    """
+    hashes = {}
+    def resolve(mib_name, visiting):
+        if mib_name in hashes:
+            return hashes[mib_name]
+        filename, source_hash, imports = mib_graph[mib_name]
+        digest = hashlib.sha256(source_hash.encode('utf-8'))
+        visiting.add(mib_name)
+        for imported in imports:
+            if imported not in visiting:
+                digest.update(resolve(imported, visiting).encode('utf-8'))
+        visiting.discard(mib_name)
+        hashes[mib_name] = digest.hexdigest()
+        return hashes[mib_name]
+    for mib_name in mib_graph.keys():
+        resolve(mib_name, set())
+    return hashes
+
+def get_dependency_levels(mib_graph):
+    """Level 0 MIBs import no local MIBs, level N MIBs import MIBs of level < N.
+    Import cycles are broken arbitrarily.
+    """
+    levels = {}
+    def resolve(mib_name, visiting):
+        if mib_name in levels:
+            return levels[mib_name]
+        visiting.add(mib_name)
+        level = 0
+        for imported in mib_graph[mib_name][2]:
+            if imported not in visiting:
+                level = max(level, resolve(imported, visiting) + 1)
+        visiting.discard(mib_name)
+        levels[mib_name] = level
+        return level
+    for mib_name in mib_graph.keys():
+        resolve(mib_name, set())
+    return levels
 
 class SNMPPopulator:
     protocol = None
@@ -40,11 +187,20 @@ class SNMPPopulator:
 
     def __init__(self, protocol='ftp', host='ftp.cisco.com', base_path='pub/mibs/v2',
                  local_mib_dir='mibs/', local_json_dir='mibjson/', new_json_dir='newmibjson/',
-                 abs_local_dir=False
+                 abs_local_dir=False, mirror=None
                  ):
+        """mirror is a local directory or file:// URL to copy MIBs from
+        instead of the FTP host.
+        """
         self.protocol = protocol
         self.host = host
         self.base_path = base_path
+        self.mirror_dir = None
+        if mirror:
+            self.mirror_dir = urlparse(mirror).path if mirror.startswith('file://') else mirror
+        self.ftp_local = threading.local()
+        self.ftp_lock = threading.Lock()
+        self.ftp_sessions = []
         local_dir = os.path.dirname(os.path.abspath(__file__))
         if not abs_local_dir:
             self.local_mib_dir = os.path.join(local_dir, local_mib_dir)
@@ -58,161 +214,405 @@ class SNMPPopulator:
     def gen_full_hostpath(self):
         return '{0}://{1}/{2}'.format(self.protocol, self.host, self.base_path)
 
-    def download_mibs(self, specific_mibs=None, exclude_mibs=[], refresh=False):
+    def download_mibs(self, specific_mibs=None, exclude_mibs=[], refresh=False,
+                      workers=8, retries=3, backoff=1.0):
+        """Download MIBs with a pool of FTP sessions, or copy them from a local mirror.
+        A manifest of the remote size/mtime and local hash of every MIB is kept
+        so that unchanged MIBs are skipped and changed or truncated MIBs are
+        fetched again. Interrupted downloads are resumed.
+        """
         logging.info(
-            'Downloading MIBs from %s/%s to %s',
-            self.host, self.base_path, self.local_mib_dir
+            'Downloading MIBs from %s to %s',
+            self.mirror_dir or '%s/%s' % (self.host, self.base_path), self.local_mib_dir
+        )
+        if not os.path.isdir(self.local_mib_dir):
+            os.makedirs(self.local_mib_dir)
+        if self.mirror_dir:
+            remote_mibs = self.list_mirror_mibs()
+        else:
+            remote_mibs = self.list_ftp_mibs()
+        if specific_mibs is not None:
+            remote_mibs = {
+                filename: remote_mibs.get(filename, (None, None))
+                for filename in specific_mibs
+            }
+        mib_filenames = sorted(
+            filename for filename in remote_mibs.keys()
+            if filename.endswith('.my') and filename not in exclude_mibs
         )
+        num_mibs = len(mib_filenames)
+        logging.debug('%i MIBs to check.', num_mibs)
+        manifest = self.load_manifest()
+        counter = 0
+        downloaded = 0
+        failed = 0
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    self.fetch_mib, filename, remote_mibs[filename],
+                    manifest.get(filename), refresh, retries, backoff
+                ): filename
+                for filename in mib_filenames
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                counter += 1
+                try:
+                    manifest[filename], was_downloaded = future.result()
+                except Exception:
+                    logging.exception('Failed to download %s!', filename)
+                    failed += 1
+                    continue
+                if was_downloaded:
+                    downloaded += 1
+                    logging.debug('MIB %i/%i: %s', counter, num_mibs, filename)
+                if counter % 100 == 0:
+                    self.save_manifest(manifest)
+        self.close_ftp_sessions()
+        self.save_manifest(manifest)
+        logging.info(
+            'Finished downloading MIBs. %i downloaded, %i up to date, %i failed.',
+            downloaded, num_mibs - downloaded - failed, failed
+        )
+        return failed == 0
+
+    def list_ftp_mibs(self):
+        """{filename: (size, mtime)} of the remote MIBs.
+        size and mtime are None if the server does not support MLSD,
+        in which case they are fetched per MIB.
+        """
+        remote_mibs = {}
         with FTP(self.host) as ftp:
             ftp.login()
-            mib_filenames = []
-            if specific_mibs is None:
+            try:
+                for filename, facts in ftp.mlsd(self.base_path, facts=['size', 'modify', 'type']):
+                    if facts.get('type', 'file') != 'file':
+                        continue
+                    size = int(facts['size']) if 'size' in facts else None
+                    remote_mibs[filename] = (size, facts.get('modify'))
+            except error_perm:
+                logging.debug('MLSD unsupported, falling back to NLST.')
                 ftp.retrlines(
                     'NLST {0}/*'.format(self.base_path),
-                    callback=lambda filename: mib_filenames.append(filename)
+                    callback=lambda filename: remote_mibs.setdefault(
+                        os.path.basename(filename), (None, None)
+                    )
                 )
-            else:
-                mib_filenames = specific_mibs.copy()
-            num_mibs = len(mib_filenames)
-            logging.debug('%i MIBs to download.', num_mibs)
-            if not os.path.isdir(self.local_mib_dir):
-                os.makedirs(self.local_mib_dir)
-            counter = 1
-            for filename in mib_filenames:
+        return remote_mibs
+
+    def list_mirror_mibs(self):
+        """{filename: (size, mtime)} of the MIBs in the local mirror."""
+        remote_mibs = {}
+        for filename in os.listdir(self.mirror_dir):
+            file_stat = os.stat(os.path.join(self.mirror_dir, filename))
+            remote_mibs[filename] = (file_stat.st_size, str(int(file_stat.st_mtime)))
+        return remote_mibs
+
+    def fetch_mib(self, filename, remote_meta, manifest_entry, refresh, retries, backoff):
+        """Fetch a single MIB unless the local copy is current.
+        Returns (manifest entry, whether it was downloaded).
+        """
+        local_path = os.path.join(self.local_mib_dir, filename)
+        for attempt in range(retries + 1):
+            try:
+                size, mtime = remote_meta
+                if size is None and mtime is None and not self.mirror_dir:
+                    size, mtime = self.get_ftp_meta(filename)
+                if not refresh and self.is_current(local_path, size, mtime, manifest_entry):
+                    return manifest_entry, False
+                if self.mirror_dir:
+                    shutil.copyfile(os.path.join(self.mirror_dir, filename), local_path)
+                else:
+                    self.retrieve_ftp_mib(filename, local_path, size)
+                return {'size': size, 'mtime': mtime, 'sha256': hash_file(local_path)}, True
+            except (OSError, EOFError, ValueError) + ftp_errors:
+                self.drop_ftp_session()
+                if attempt == retries:
+                    raise
+                delay = backoff * 2 ** attempt
+                logging.debug('Retrying %s in %.1fs.', filename, delay)
+                time.sleep(delay)
+
+    def is_current(self, local_path, size, mtime, manifest_entry):
+        """Whether the local MIB matches the remote and is not truncated or altered."""
+        if not manifest_entry or not os.path.isfile(local_path):
+            return False
+        if size is not None and manifest_entry['size'] != size:
+            return False
+        if mtime is not None and manifest_entry['mtime'] != mtime:
+            return False
+        if manifest_entry['size'] is not None and os.path.getsize(local_path) != manifest_entry['size']:
+            return False
+        return hash_file(local_path) == manifest_entry['sha256']
+
+    def retrieve_ftp_mib(self, filename, local_path, size):
+        """Retrieve a MIB, resuming a partial download if present."""
+        partial_path = '%s.part' % local_path
+        offset = os.path.getsize(partial_path) if os.path.isfile(partial_path) else 0
+        if size is None or offset > size:
+            offset = 0
+        ftp = self.get_ftp_session()
+        with open(partial_path, 'ab' if offset else 'wb') as mib_file:
+            ftp.retrbinary(
+                'RETR {0}/{1}'.format(self.base_path, filename),
+                callback=mib_file.write,
+                rest=offset or None
+            )
+        if size is not None and os.path.getsize(partial_path) != size:
+            raise ValueError('Truncated download of %s!' % filename)
+        os.replace(partial_path, local_path)
+
+    def get_ftp_meta(self, filename):
+        """(size, mtime) of a remote MIB via SIZE and MDTM."""
+        ftp = self.get_ftp_session()
+        remote_path = '{0}/{1}'.format(self.base_path, filename)
+        ftp.voidcmd('TYPE I')
+        size = ftp.size(remote_path)
+        mtime = None
+        try:
+            mtime = ftp.voidcmd('MDTM {0}'.format(remote_path)).split()[-1]
+        except error_perm:
+            pass
+        return size, mtime
+
+    def get_ftp_session(self):
+        """One long-lived FTP session per download thread."""
+        ftp = getattr(self.ftp_local, 'ftp', None)
+        if ftp is None:
+            ftp = FTP(self.host)
+            ftp.login()
+            self.ftp_local.ftp = ftp
+            with self.ftp_lock:
+                self.ftp_sessions.append(ftp)
+        return ftp
+
+    def drop_ftp_session(self):
+        ftp = getattr(self.ftp_local, 'ftp', None)
+        if ftp is not None:
+            self.ftp_local.ftp = None
+            with self.ftp_lock:
+                self.ftp_sessions.remove(ftp)
+            ftp.close()
+
+    def close_ftp_sessions(self):
+        with self.ftp_lock:
+            for ftp in self.ftp_sessions:
                 try:
-                    filename.rindex('.my', -3)
-                except:
-                    logging.debug('Not a MIB.')
-                    counter += 1
-                    continue
-                logging.debug('MIB %i/%i: %s', counter, num_mibs, filename)
-                if filename in exclude_mibs:
-                    logging.debug('Excluding.')
-                    counter += 1
-                    continue
-                if not refresh and os.path.isfile(os.path.join(self.local_mib_dir, filename)):
-                    logging.debug('Skipping.')
-                    counter += 1
-                    continue
-                with open(os.path.join(self.local_mib_dir, filename), 'wb') as mib_file:
-                    ftp.retrbinary(
-                        'RETR {0}/{1}'.format(self.base_path, filename),
-                        callback=lambda data: mib_file.write(data)
-                    )
-                counter += 1
-        logging.info('Finished downloading MIBs.')
-        return True
+                    ftp.quit()
+                except ftp_errors + (OSError, EOFError):
+                    ftp.close()
+            self.ftp_sessions = []
+        self.ftp_local = threading.local()
 
-    def transform_mibs_to_json(self, specific_mibs: object = None, exclude_mibs: object = []) -> object:
-        mib_names = []
+    def get_manifest_path(self):
+        return os.path.join(self.local_mib_dir, MANIFEST_FILENAME)
+
+    def load_manifest(self):
+        manifest_path = self.get_manifest_path()
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as manifest_fd:
+            return json.load(manifest_fd)
+
+    def save_manifest(self, manifest):
+        manifest_path = self.get_manifest_path()
+        with open('%s.tmp' % manifest_path, 'w') as manifest_fd:
+            json.dump(manifest, manifest_fd, indent=4, sort_keys=True)
+        os.replace('%s.tmp' % manifest_path, manifest_path)
+
+    def transform_mibs_to_json(self, specific_mibs=None, exclude_mibs=[], workers=None):
+        """Compile MIBs to JSON in a process pool.
+        The MIB import graph is scanned up front and MIBs are compiled level by
+        level, so a MIB is only compiled once everything it imports has been.
+        MIBs whose source, and the sources of everything they import, are
+        unchanged since they were last compiled are skipped.
+        """
+        mib_filenames = []
         if specific_mibs is None:
             for filename in os.listdir(self.local_mib_dir):
                 try:
                     filename.rindex('.my', -3)
                 except:
                     continue
-                mib_names.append(filename)
+                mib_filenames.append(filename)
         else:
-            mib_names = specific_mibs.copy()
+            mib_filenames = specific_mibs.copy()
+        mib_filenames = [filename for filename in mib_filenames if filename not in exclude_mibs]
         logging.info('Compiling MIBs to JSON.')
-        try:
-            mib_compiler = MibCompiler(
-                SmiV1CompatParser(),
-                JsonCodeGen(),
-                FileWriter(self.local_json_dir).setOptions(suffix='.json')
-            )
-            mib_compiler.addSources(FileReader(self.local_mib_dir, recursive=True))
-            mib_stubs = JsonCodeGen.baseMibs
-            searchers = [AnyFileSearcher(self.local_json_dir).setOptions(exts=['.json']), StubSearcher(*mib_stubs)]
-            mib_compiler.addSearchers(*searchers)
-            if not os.path.isdir(self.local_json_dir):
-                os.makedirs(self.local_json_dir)
-            processed = mib_compiler.compile(
-                *mib_names,
-                **dict(
-                    noDeps=False,
-                    rebuild=True,
-                    genTexts=True,
-                    writeMibs=True,
-                    ignoreErrors=True
+        if not os.path.isdir(self.local_json_dir):
+            os.makedirs(self.local_json_dir)
+        mib_graph = scan_mib_imports(self.local_mib_dir, mib_filenames)
+        mib_hashes = get_effective_hashes(mib_graph)
+        mib_levels = get_dependency_levels(mib_graph)
+        manifest = self.load_compile_manifest()
+        stale_mibs = [
+            mib_name for mib_name in sorted(mib_graph.keys())
+            if mib_name not in manifest or manifest[mib_name]['hash'] != mib_hashes[mib_name]
+            or not os.path.isfile(os.path.join(self.local_json_dir, '%s.json' % mib_name))
+        ]
+        logging.info('%i/%i MIBs require compiling.', len(stale_mibs), len(mib_graph))
+        for mib_name in stale_mibs:
+            manifest.pop(mib_name, None)
+            json_path = os.path.join(self.local_json_dir, '%s.json' % mib_name)
+            if os.path.isfile(json_path):
+                os.remove(json_path)
+        timings = []
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for level in sorted({mib_levels[mib_name] for mib_name in stale_mibs}):
+                level_mibs = [mib_name for mib_name in stale_mibs if mib_levels[mib_name] == level]
+                logging.debug('Compiling %i MIBs at dependency level %i.', len(level_mibs), level)
+                level_results = executor.map(
+                    compile_mib,
+                    [mib_graph[mib_name][0] for mib_name in level_mibs],
+                    repeat(self.local_mib_dir),
+                    repeat(self.local_json_dir)
                 )
-            )
+                for mib_name, (statuses, seconds) in zip(level_mibs, level_results):
+                    status = statuses.get(mib_name, ('missing', {}))[0]
+                    timings.append({
+                        'mib': mib_name,
+                        'level': level,
+                        'status': status,
+                        'seconds': seconds
+                    })
+                    if status in ('compiled', 'untouched'):
+                        manifest[mib_name] = {
+                            'hash': mib_hashes[mib_name],
+                            'status': statuses[mib_name]
+                        }
+                    else:
+                        logging.error('Failed to compile %s: %s', mib_name, statuses.get(mib_name, ('missing', {}))[1].get('error'))
+                self.save_compile_manifest(manifest)
+        self.build_mib_index(manifest)
+        self.write_compile_report(timings)
+        logging.info('Finished compiling MIBs to JSON.')
+
+    def build_mib_index(self, manifest):
+        """Rebuild the pysmi index from the compile statuses recorded in the
+        manifest, which cover every compiled MIB and not only those compiled
+        by this run. pysmi merges in an existing index, so it is removed first.
+        """
+        compiled = {
+            mib_name: entry['status'] for mib_name, entry in manifest.items()
+            if os.path.isfile(os.path.join(self.local_json_dir, '%s.json' % mib_name))
+        }
+        if not compiled:
+            return
+        try:
+            mib_compiler = create_mib_compiler(self.local_mib_dir, self.local_json_dir)
+            index_path = os.path.join(self.local_json_dir, '%s.json' % mib_compiler.indexFile)
+            if os.path.isfile(index_path):
+                os.remove(index_path)
             mib_compiler.buildIndex(
-                processed,
+                {
+                    name: MibStatus(status).setOptions(**attributes)
+                    for name, (status, attributes) in compiled.items()
+                },
                 ignoreErrors=True
             )
         except error.PySmiError:
             logging.error('ERROR: %s', str(sys.exc_info()[1]))
             sys.exit(1)
-        logging.info('Finished compiling MIBs to JSON.')
 
-    def transform_json_to_new(self, specific_mibs=None):
+    def get_transform_path(self, filename):
+        """Path of a file alongside, not within, the JSON directory."""
+        return os.path.join(os.path.dirname(os.path.normpath(self.local_json_dir)), filename)
+
+    def load_compile_manifest(self):
+        """{MIB name: {hash, status}} of the compiled MIBs. Entries without
+        a recorded status, written by earlier versions, are dropped so that
+        their MIBs are recompiled.
+        """
+        manifest_path = self.get_transform_path(COMPILE_MANIFEST_FILENAME)
+        if not os.path.isfile(manifest_path):
+            return {}
+        with open(manifest_path, 'r') as manifest_fd:
+            manifest = json.load(manifest_fd)
+        return {
+            mib_name: entry for mib_name, entry in manifest.items()
+            if isinstance(entry, dict) and 'status' in entry
+        }
+
+    def save_compile_manifest(self, manifest):
+        manifest_path = self.get_transform_path(COMPILE_MANIFEST_FILENAME)
+        with open('%s.tmp' % manifest_path, 'w') as manifest_fd:
+            json.dump(manifest, manifest_fd, indent=4, sort_keys=True)
+        os.replace('%s.tmp' % manifest_path, manifest_path)
+
+    def write_compile_report(self, timings):
+        """Write per-MIB compile timings, slowest first, and log the slowest."""
+        timings = sorted(timings, key=lambda timing: timing['seconds'], reverse=True)
+        with open(self.get_transform_path(COMPILE_REPORT_FILENAME), 'w') as report_fd:
+            json.dump(timings, report_fd, indent=4)
+        for timing in timings[:10]:
+            logging.info('Compiled %s in %.2fs (%s).', timing['mib'], timing['seconds'], timing['status'])
+
+    def iter_mib_records(self, specific_mibs=None, debug_json_dir=None):
+        """Stream (model name, [OIDRecord...]) per MIB from the pysmi JSON output.
+        Only one MIB is held in memory at a time. If debug_json_dir is set the
+        reorganized JSON of each MIB is also written there for inspection.
+        """
         json_names = []
-        logging.info(
-            'Reorganizing JSON MIBs and writing to %s',
-            self.new_json_dir
-        )
         if specific_mibs is None:
             for filename in os.listdir(self.local_json_dir):
                 try:
                     filename.rindex('.json', -5)
                 except:
                     continue
+                # pysmi index of all compiled MIBs, not a MIB.
+                if filename == 'index.json':
+                    continue
                 json_names.append(filename)
         else:
             json_names = specific_mibs.copy()
         num_json = len(json_names)
-        counter = 1
-        logging.debug('%i JSON to transform.', num_json)
-        if not os.path.isdir(self.new_json_dir):
-            os.makedirs(self.new_json_dir)
-        for filename in json_names:
+        logging.debug('%i JSON to stream.', num_json)
+        if debug_json_dir and not os.path.isdir(debug_json_dir):
+            os.makedirs(debug_json_dir)
+        for counter, filename in enumerate(sorted(json_names), start=1):
             file_path = os.path.join(self.local_json_dir, filename)
             logging.debug('JSON %i/%i: %s', counter, num_json, filename)
-            with open(file_path, 'r', encoding='utf8') as f:
-                data = json.load(f)
-                def create_oid_dict(data):
-                    oid = {}
-                    oidname = data['oid']
-                    oid[oidname] = {}
-                    oid[oidname]['oid'] = data['oid']
-                    oid[oidname]['name'] = data['name']
-                    if ('description') in data:
-                        oid[oidname]["description"] = data['description']
-                    else:
-                        oid[oidname]["description"] = ''
+            with open(file_path, 'r', encoding='utf8') as json_fd:
+                data = json.load(json_fd)
+            records = {}
+            for definition in data.values():
+                if 'oid' not in definition:
+                    continue
+                records[definition['oid']] = OIDRecord(
+                    definition['oid'],
+                    definition['name'],
+                    definition.get('description', ''),
+                    definition['syntax']['type'] if 'syntax' in definition else ''
+                )
+            del data
+            if debug_json_dir:
+                write_debug_json(os.path.join(debug_json_dir, filename), records.values())
+            yield filename[:-5], list(records.values())
 
-                    if ('syntax') in data:
-                        oid[oidname]['dataType'] = data['syntax']['type']
-                    else:
-                        oid[oidname]['dataType'] = ''
-                    return oid
-                newdict = {}
-                for i in data:
-                    if ('oid') in data[i]:
-                        newdict.update(create_oid_dict(data[i]))
-                new_file_path = os.path.join(self.new_json_dir, filename)
-                with open(new_file_path, 'w') as f:
-                    json.dump(newdict, f, indent=4)
-            counter += 1
-        
-    def parse_json_to_db(self, db):
-        json_filenames = []
-        for filename in os.listdir(self.new_json_dir):
-            try:
-                filename.rindex('.json', -5)
-            except:
-                continue
-            json_filenames.append(filename)
-        if not json_filenames:
-            logging.error('No files to parse into db!')
-            return
+    def transform_json_to_new(self, specific_mibs=None):
+        """Write the reorganized JSON of every MIB to new_json_dir.
+        Only a debugging artifact, loading streams from iter_mib_records.
+        """
+        logging.info(
+            'Reorganizing JSON MIBs and writing to %s',
+            self.new_json_dir
+        )
+        for _ in self.iter_mib_records(specific_mibs, debug_json_dir=self.new_json_dir):
+            pass
+
+    def parse_json_to_db(self, db, mib_records=None):
+        """Load MIBs as DataModels and their OIDs as DataPaths.
+        mib_records is an iterable of (model name, [OIDRecord...]),
+        streamed from the pysmi JSON output if not specified.
+        """
+        if mib_records is None:
+            mib_records = self.iter_mib_records()
         logging.debug('Resetting session to mitigate session timeout (???).')
         db.connection.resetSession('root', 'tdm')
         oid_cache = {}
         dml_node = db['DataModelLanguage']['SMI']
-        for filename in json_filenames:
-            model_name = filename[:-5]
+        loaded_mibs = 0
+        for model_name, oid_records in mib_records:
             """TODO: THIS IS BARE MINIMUM
             content is the RAW MIB content, not JSON.
             parsed_checksum is md5 checksum of content.
@@ -245,14 +645,12 @@ class SNMPPopulator:
                 }
             )
             db['OfDataModelLanguage'].createEdge().links(dml_node, dm_node)
-            mib_json = None
-            file_path = os.path.join(self.new_json_dir, filename)
-            with open(file_path, 'r') as json_fd:
-                mib_json = json.load(json_fd)
-            if not mib_json:
-                logging.error('Nothing in %s', filename)
+            loaded_mibs += 1
+            if not oid_records:
+                logging.error('Nothing in %s', model_name)
                 continue
-            for oid, oid_info in mib_json.items():
+            for oid_record in oid_records:
+                oid = oid_record.oid
                 """ TODO: THIS IS BARE MINIMUM
                 is_leaf should actually check if dataType is a primitive data type defined by SMI/MIB specs.
                 If it's defined, and not primitive, then we SHOULD derive the primitive data type of the defined
@@ -265,25 +663,103 @@ class SNMPPopulator:
                     logging.error('Duplicate oid %s from %s in %s!', oid, oid_cache[oid]['model'], model_name)
                     path_node = oid_cache[oid]['obj']
                 else:
-                    path_node = db['DataPath'].createDocument(
-                        {
+                    # Stamped with the DBMS clock, which search syncs checkpoint by.
+                    path_node = db.AQLQuery(
+                        'INSERT MERGE(@datapath, { last_modified: DATE_NOW() }) INTO DataPath RETURN NEW._id',
+                        bindVars={'datapath': {
                             'machine_id': oid,
-                            'human_id': oid_info['name'],
-                            'description': oid_info['description'],
-                            'is_leaf': True if oid_info['dataType'] else False,
+                            'human_id': oid_record.name,
+                            'description': oid_record.description,
+                            'is_leaf': True if oid_record.data_type else False,
                             'is_variable': False,
                             'is_configurable': False,
                             'verified': False
-                        }
-                    )
+                        }},
+                        rawResults=True
+                    )[0]
                     oid_cache[oid] = {
                         'model': model_name,
                         'obj': path_node
                     }
                 db['DataPathFromDataModel'].createEdge().links(dm_node, path_node, waitForSync=True)
+        if not loaded_mibs:
+            logging.error('No MIBs to parse into db!')
 
-def populate_snmp(db):
+    def bulk_load_mib_records(self, db, mib_records=None, load_config=None):
+        """Load MIBs as DataModels and their OIDs as DataPaths in batches.
+        The OID table of all MIBs is built first so that OIDs defined by
+        several MIBs resolve to a single DataPath regardless of MIB order.
+        """
+        if mib_records is None:
+            mib_records = self.iter_mib_records()
+        model_names, oid_table, oid_models = build_oid_table(mib_records)
+        if not model_names:
+            logging.error('No MIBs to parse into db!')
+            return
+        loader = BulkLoader.from_config(db, load_config)
+        dml_id = 'DataModelLanguage/SMI'
+        for model_name in model_names:
+            loader.add_document('DataModel', {
+                '_key': model_name,
+                'name': model_name,
+                'revision': None,
+                'content': None,
+                'parsed_checksum': None
+            })
+            loader.add_edge('OfDataModelLanguage', dml_id, 'DataModel/%s' % model_name)
+        for oid in sorted(oid_table.keys()):
+            oid_record = oid_table[oid]
+            path_key = datapath_key(oid)
+            loader.add_document('DataPath', {
+                '_key': path_key,
+                'machine_id': oid,
+                'human_id': oid_record.name,
+                'description': oid_record.description,
+                'is_leaf': True if oid_record.data_type else False,
+                'is_variable': False,
+                'is_configurable': False,
+                'verified': False
+            })
+            for model_name in oid_models[oid]:
+                loader.add_edge('DataPathFromDataModel', 'DataModel/%s' % model_name, 'DataPath/%s' % path_key)
+        loader.log_stats('MIBs')
+
+def build_oid_table(mib_records):
+    """Collect the OIDRecords of all MIBs in to
+    ([model names], {oid: OIDRecord}, {oid: [model names]}).
+    An OID defined by several MIBs is kept once, preferring the definition
+    with a data type, then with a description, then from the first MIB by name.
+    """
+    model_names = []
+    oid_table = {}
+    oid_models = {}
+    def rank(model_name, oid_record):
+        return (not oid_record.data_type, not oid_record.description, model_name)
+    # oid -> rank of the OIDRecord kept in oid_table
+    oid_ranks = {}
+    for model_name, oid_records in mib_records:
+        model_names.append(model_name)
+        if not oid_records:
+            logging.error('Nothing in %s', model_name)
+        for oid_record in oid_records:
+            oid_models.setdefault(oid_record.oid, []).append(model_name)
+            record_rank = rank(model_name, oid_record)
+            if oid_record.oid not in oid_ranks or record_rank < oid_ranks[oid_record.oid]:
+                oid_table[oid_record.oid] = oid_record
+                oid_ranks[oid_record.oid] = record_rank
+    del oid_ranks
+    duplicate_oids = 0
+    for oid, models in oid_models.items():
+        if len(models) > 1:
+            duplicate_oids += 1
+            logging.debug('Duplicate oid %s in %s.', oid, ', '.join(sorted(models)))
+    if duplicate_oids:
+        logging.warning('%i OIDs are defined in more than one MIB.', duplicate_oids)
+    return sorted(model_names), oid_table, oid_models
+
+def populate_snmp(db, snmp_config=None, load_config=None):
     """Entry point of populating SNMP data."""
+    snmp_config = snmp_config or {}
     # TODO: Remove hardcoding of paths.
     # Customized to Docker volume pathing.
     # Files will present locally in etl/cache/... for debugging.
@@ -291,12 +767,17 @@ def populate_snmp(db):
         local_mib_dir='/data/extract/mib/',
         local_json_dir='/data/transform/mibjson/',
         new_json_dir='/data/transform/newmibjson/',
-        abs_local_dir=True
+        abs_local_dir=True,
+        mirror=snmp_config.get('mirror')
     )
-    snmppop.download_mibs()
-    snmppop.transform_mibs_to_json()
-    snmppop.transform_json_to_new()
-    snmppop.parse_json_to_db(db)
+    snmppop.download_mibs(workers=snmp_config.get('downloadWorkers', 8))
+    snmppop.transform_mibs_to_json(workers=snmp_config.get('compileWorkers'))
+    debug_json_dir = snmppop.new_json_dir if snmp_config.get('writeNewJson') else None
+    mib_records = snmppop.iter_mib_records(debug_json_dir=debug_json_dir)
+    if snmp_config.get('bulkLoad', True):
+        snmppop.bulk_load_mib_records(db, mib_records, load_config)
+    else:
+        snmppop.parse_json_to_db(db, mib_records)
 
 if __name__ == '__main__':
     logging.basicConfig(level=logging.DEBUG)
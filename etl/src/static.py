@@ -15,6 +15,7 @@ limitations under the License.
 """Populate static business data that is otherwise conceptual 
 and not able to be directly parsed from data itself.
 """
+import logging
 
 def populate_data_model_languages(db):
     """Populate everything related to individual Data Model Languages.
@@ -236,10 +237,11 @@ def populate_data_model_languages(db):
         for cp_key in value['control_protocols']:
             db['HasControlProtocol'].createEdge().links(new_dml, control_protocols[cp_key])
 
-def populate_os_releases(db):
+def populate_os_releases(db, skip_existing=False):
     """Populate OSes and releases.
     Derived from YANG repository directories for now.
     https://github.com/YangModels/yang/tree/master/vendor/cisco
+    skip_existing only adds OSes and releases not already in the database.
     """
     oses = {
         'IOS XE': {
@@ -317,17 +319,27 @@ def populate_os_releases(db):
             ]
         }
     }
+    existing_keys = fetch_existing_os_release_keys(db) if skip_existing else set()
     for key, value in oses.items():
-        new_os = db['OS'].createDocument({
-            '_key': arangify_key(key),
-            'name': key,
-            'description': value['description']
-        })
-        new_os.save()
+        os_key = arangify_key(key)
+        if os_key in existing_keys:
+            new_os = db['OS'][os_key]
+        else:
+            new_os = db['OS'].createDocument({
+                '_key': os_key,
+                'name': key,
+                'description': value['description']
+            })
+            new_os.save()
         previous_release = None
         for release in value['releases']:
+            release_key = arangify_key('%s+%s' % (key, release))
+            if release_key in existing_keys:
+                previous_release = db['Release'][release_key]
+                continue
+            logging.info('Adding Release %s.', release_key)
             new_release = db['Release'].createDocument({
-                '_key': arangify_key('%s+%s' % (key, release)),
+                '_key': release_key,
                 'name': release
             })
             new_release.save()
@@ -336,6 +348,16 @@ def populate_os_releases(db):
                 db['ReleaseRevision'].createEdge().links(previous_release, new_release)
             previous_release = new_release
 
+def fetch_existing_os_release_keys(db):
+    """The _keys of all OSes and Releases already in the database."""
+    existing_query = """
+    RETURN UNION(
+        (FOR os IN OS RETURN os._key),
+        (FOR release IN Release RETURN release._key)
+    )
+    """
+    return set(db.AQLQuery(existing_query, rawResults=True)[0])
+
 def arangify_key(key):
     return key.replace(' ', '_')
 
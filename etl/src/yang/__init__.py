@@ -14,12 +14,18 @@ limitations under the License.
 """
 """Load YANG models in to the database representation
 of OS/Releases/DataModels/DataPaths/DataTypes. Heavy parsing.
-Extremely non-optimal. ~10GB memory usage.
+Releases are streamed one at a time, so peak memory is roughly
+that of the largest release plus the loader caches.
 """
 import os
 import json
 import logging
-from .yang_base import YANGBase
+from itertools import groupby
+from operator import itemgetter
+from .yang_base import YANGBase, new_checksum, update_checksum, module_checksum
+from bulk import BulkLoader, datapath_key
+from key_index import KeyIndex
+from memory import reset_peak_rss, peak_rss, format_bytes
 
 """Commented out releases have model bugs.
 TODO: Resolve model bugs.
@@ -118,102 +124,326 @@ def acquire_source():
         logging.debug('Cloned to %s.', yang_base_path)
     return cisco_yang_base_path
 
-# TODO: Optimize the caches.
-dm_cache = {}
-dp_cache = {}
-dt_cache = {}
-# This is the most memory inefficient thing I've ever done.
-dm_dp_cache = set()
-dp_dt_cache = set()
-dp_link_cache = set()
+# Keys queued for loading, interned and compact.
+key_index = KeyIndex()
+# DataPath fields curated after loading, only defaulted on new DataPaths.
+CURATED_DATAPATH_FIELDS = ('is_variable', 'verified')
 
 # TODO: Revise everything beneath this line.
-def populate_yang(db):
-    """Entry point of populating YANG data."""
+def populate_yang(db, load_config=None, workers=1, cache_dir=None):
+    """Entry point of populating YANG data.
+    Releases are streamed from parsing through to loading one at a time.
+    workers > 1 parses releases in a process pool, and cache_dir
+    enables the parse cache.
+    """
     logging.info('Acquiring YANG models for data extraction.')
     base_model_path = acquire_source()
+    loader = BulkLoader.from_config(db, load_config)
     for os_key, version_map in os_version_folder_map.items():
-        logging.info('Transforming %s data.', os_map[os_key])
-        versioned_data = YANGBase(
-            base_model_path,
-            os_key,
-            version_map
-        ).parse_versions()
+        logging.info('Transforming and loading %s data.', os_map[os_key])
         logging.debug('Resetting session to mitigate session timeout (???).')
         db.connection.resetSession('root', 'tdm')
-        for version, modules in versioned_data.items():
+        yang_base = YANGBase(
+            base_model_path,
+            os_key,
+            version_map,
+            cache_dir
+        )
+        versioned_paths = yang_base.iter_versions(workers)
+        for version, version_paths in groupby(versioned_paths, key=itemgetter(0)):
             logging.info('Loading %s %s data.', os_map[os_key], version)
-            add_version_modules(db, os_key, version, modules)
-
-def add_version_modules(db, os_key, version, modules):
-    """Add the DataModels to the corresponding OS/Release."""
-    version_key = '%s+%s' % (os_map[os_key], version)
-    version_node = db['Release'][version_key]
-    dml_node = db['DataModelLanguage']['YANG']
-    for module_name, revisions in modules.items():
-        parent_dm = None
-        for revision in sorted(revisions.keys()):
-            module = revisions[revision]
-            dm_key = '%s+%s' % (module_name, revision)
-            dm_node = None
-            if dm_key in dm_cache.keys():
-                dm_node = dm_cache[dm_key]
-            else:
-                dm_node = db['DataModel'].createDocument({
-                    '_key': dm_key,
-                    'name': module_name,
-                    'revision': revision,
-                    'content': None,
-                    'parsed_checksum': None
-                })
-                db['OfDataModelLanguage'].createEdge().links(dml_node, dm_node)
-                dm_cache[dm_key] = dm_node
-            if parent_dm is not None:
-                db['DataModelParent'].createEdge().links(dm_node, parent_dm, waitForSync=True)
-                db['DataModelChild'].createEdge().links(parent_dm, dm_node, waitForSync=True)
-            parent_dm = dm_node
-            db['ReleaseHasDataModel'].createEdge().links(version_node, dm_node, waitForSync=True)
-            add_data_paths_to_dm(db, dm_node, module)
-
-def add_data_paths_to_dm(db, dm_node, module, dp_parent=None):
-    """Add the parsed DataPaths from the corresponding DataModels."""
-    for _, path_data in module.items():
-        path_key = path_data['machine_id']
-        path_node = None
-        if path_key in dp_cache.keys():
-            path_node = dp_cache[path_key]
-        else:
-            path_node = db['DataPath'].createDocument({
-                'machine_id': path_key,
-                'human_id': path_data['xpath'],
-                'description': path_data['description'],
-                'is_leaf': False if path_data['children'] else True,
-                'is_variable': False,
-                'is_configurable': path_data['rw'],
-                'verified': False
-            })
-            dp_cache[path_key] = path_node
-        if {dm_node['_key'], path_node['_key']} not in dm_dp_cache:
-            db['DataPathFromDataModel'].createEdge().links(dm_node, path_node, waitForSync=True)
-            dm_dp_cache.add(frozenset({dm_node['_key'], path_node['_key']}))
-        if path_data['primitive_type'] is not None:
-            type_node = None
-            type_key = 'YANG+%s' % path_data['primitive_type']
-            if type_key in dt_cache.keys():
-                type_node = dt_cache[type_key]
-            else:
-                try:
-                    type_node = db['DataType'][type_key]
-                    dt_cache[type_key] = type_node
-                except KeyError:
-                    logging.error('Could not resolve DataType %s!', type_key)
-                    raise
-            if {path_node['_key'], type_node['_key']} not in dp_dt_cache:
-                db['OfDataType'].createEdge().links(path_node, type_node, waitForSync=True)
-                dp_dt_cache.add(frozenset({path_node['_key'], type_node['_key']}))
-        if dp_parent is not None and {dp_parent['_key'], path_node['_key']} not in dp_link_cache:
-            db['DataPathChild'].createEdge().links(dp_parent, path_node, waitForSync=True)
-            db['DataPathParent'].createEdge().links(path_node, dp_parent, waitForSync=True)
-            dp_link_cache.add(frozenset({dp_parent['_key'], path_node['_key']}))
-        if path_data['children']:
-            add_data_paths_to_dm(db, dm_node, path_data['children'], path_node)
+            reset_peak_rss()
+            loader.reset_stats()
+            add_version_paths(db, loader, os_key, version_paths)
+            loader.log_stats('%s %s' % (os_map[os_key], version))
+            logging.info(
+                'Peak memory for %s %s: %s.',
+                os_map[os_key], version, format_bytes(peak_rss())
+            )
+
+def populate_yang_incremental(db, load_config=None, workers=1, cache_dir=None):
+    """Load only the DataModels of each Release which are new or whose
+    parsed content changed since the last load, and unlink DataModels
+    which are no longer present in a Release.
+    The manifest of (release, module, revision, checksum) is kept on the
+    ReleaseHasDataModel edges.
+    Existing DataPaths are matched by machine_id and edges by _from and
+    _to, as databases loaded before keys were deterministic have generated
+    _keys, and keep their curated fields.
+    DataModels are shared by Releases, so DataPaths are only unlinked from
+    a DataModel once every Release linking it has had its table of the
+    DataModel, identified by checksum, loaded.
+    Returns the _ids of the Releases linking a changed or removed DataModel,
+    whose SearchCatalog rows need rebuilding.
+    """
+    logging.info('Acquiring YANG models for data extraction.')
+    base_model_path = acquire_source()
+    loader = BulkLoader.from_config(
+        db, load_config,
+        overwrite_mode='update',
+        upsert_edges=True,
+        insert_only_fields=CURATED_DATAPATH_FIELDS
+    )
+    logging.info('Fetching YANG manifest.')
+    manifest = fetch_manifest(db)
+    # Releases linking each DataModel, and those which gained or lost one.
+    dm_release_ids = {}
+    touched_release_ids = set()
+    # Checksums of each DataModel in the Releases linking it, and of those loaded.
+    dm_checksums = {}
+    loaded_checksums = {}
+    # DataPaths of each changed DataModel, across Releases.
+    loaded_dp_ids = {}
+    for os_key, version_map in os_version_folder_map.items():
+        logging.info('Diffing %s data.', os_map[os_key])
+        yang_base = YANGBase(
+            base_model_path,
+            os_key,
+            version_map,
+            cache_dir
+        )
+        for version, version_table in yang_base.iter_version_tables(workers):
+            version_id = 'Release/%s+%s' % (os_map[os_key], version)
+            release_manifest = manifest.pop(version_id, {})
+            loaded_dm_ids = set()
+            changed_modules = set()
+            checksums = {}
+            for module_name, revision, paths in version_table:
+                dm_id = 'DataModel/%s+%s' % (module_name, revision)
+                loaded_dm_ids.add(dm_id)
+                checksums[dm_id] = module_checksum(paths)
+                dm_checksums.setdefault(dm_id, set()).add(checksums[dm_id])
+                dm_release_ids.setdefault(dm_id, set()).add(version_id)
+                if release_manifest.get(dm_id) != checksums[dm_id]:
+                    changed_modules.add(module_name)
+            removed_dm_ids = set(release_manifest.keys()) - loaded_dm_ids
+            logging.info(
+                '%s %s: %d changed module(s), %d removed DataModel(s).',
+                os_map[os_key], version, len(changed_modules), len(removed_dm_ids)
+            )
+            loader.reset_stats()
+            existing_keys = fetch_datapath_keys(db, set(
+                machine_id
+                for module_name, _, paths in version_table if module_name in changed_modules
+                for path in paths
+                for machine_id in (path.machine_id, path.parent) if machine_id is not None
+            ))
+            parent_module_name = None
+            parent_dm_id = None
+            for module_name, revision, paths in version_table:
+                if module_name not in changed_modules:
+                    continue
+                if module_name != parent_module_name:
+                    parent_module_name = module_name
+                    parent_dm_id = None
+                dm_id = 'DataModel/%s+%s' % (module_name, revision)
+                add_data_model(loader, version_id, module_name, revision, checksums[dm_id], parent_dm_id)
+                parent_dm_id = dm_id
+                loaded_checksums.setdefault(dm_id, set()).add(checksums[dm_id])
+                dp_ids = loaded_dp_ids.setdefault(dm_id, set())
+                for path in paths:
+                    dp_ids.add(add_data_path(db, loader, dm_id, path, existing_keys))
+            loader.log_stats('%s %s' % (os_map[os_key], version))
+            if removed_dm_ids:
+                unlink_data_models(db, version_id, removed_dm_ids)
+                touched_release_ids.add(version_id)
+        yang_base.log_cache_stats()
+    # Releases which weren't parsed, e.g. no longer mapped, still link theirs.
+    for version_id, release_manifest in manifest.items():
+        for dm_id, parsed_checksum in release_manifest.items():
+            dm_checksums.setdefault(dm_id, set()).add(parsed_checksum)
+            dm_release_ids.setdefault(dm_id, set()).add(version_id)
+    for dm_id, dp_ids in loaded_dp_ids.items():
+        touched_release_ids.update(dm_release_ids[dm_id])
+        if not dm_checksums[dm_id] <= loaded_checksums[dm_id]:
+            logging.info('Not unlinking DataPaths of %s, other Release(s) link other versions of it.', dm_id)
+            continue
+        unlinked = unlink_data_paths(db, dm_id, dp_ids)
+        if unlinked:
+            logging.info('Unlinked %d DataPath(s) from %s.', unlinked, dm_id)
+    return touched_release_ids
+
+def fetch_manifest(db):
+    """{release _id: {DataModel _id: parsed_checksum}} of what is loaded."""
+    manifest_query = """
+    FOR release_dm IN ReleaseHasDataModel
+        RETURN [release_dm._from, release_dm._to, release_dm.parsed_checksum]
+    """
+    manifest = {}
+    for release_id, dm_id, parsed_checksum in db.AQLQuery(manifest_query, rawResults=True, batchSize=10000):
+        release_manifest = manifest.setdefault(release_id, {})
+        # Duplicate edges of earlier loads must not hide a recorded checksum.
+        if parsed_checksum is not None or dm_id not in release_manifest:
+            release_manifest[dm_id] = parsed_checksum
+    return manifest
+
+def fetch_datapath_keys(db, machine_ids, batch_size=10000):
+    """{machine_id: _key} of the existing DataPaths among machine_ids
+    whose _key is not the one datapath_key derives.
+    """
+    keys_query = """
+    FOR machine_id IN @machine_ids
+        FOR dp IN DataPath
+            FILTER dp.machine_id == machine_id
+            RETURN [dp.machine_id, dp._key]
+    """
+    machine_ids = list(machine_ids)
+    existing_keys = {}
+    for start in range(0, len(machine_ids), batch_size):
+        for machine_id, key in db.AQLQuery(
+                keys_query,
+                bindVars={'machine_ids': machine_ids[start:start + batch_size]},
+                rawResults=True,
+                batchSize=batch_size):
+            if key != datapath_key(machine_id):
+                existing_keys[machine_id] = key
+    return existing_keys
+
+def unlink_data_paths(db, dm_id, dp_ids):
+    """Remove DataPaths which are no longer in a DataModel from it, and
+    bump their last_modified as their search documents change.
+    Returns the number of DataPaths unlinked.
+    """
+    unlink_query = """
+    LET unlinked_dp_ids = (
+        FOR dm_dp IN DataPathFromDataModel
+            FILTER dm_dp._from == @dm_id
+            FILTER dm_dp._to NOT IN @dp_ids
+            REMOVE dm_dp IN DataPathFromDataModel
+            RETURN OLD._to
+    )
+    LET now = DATE_NOW()
+    FOR dp_id IN unlinked_dp_ids
+        UPDATE PARSE_IDENTIFIER(dp_id).key WITH { last_modified: now } IN DataPath
+        OPTIONS { ignoreErrors: true }
+        RETURN 1
+    """
+    return len(db.AQLQuery(
+        unlink_query,
+        bindVars={'dm_id': dm_id, 'dp_ids': list(dp_ids)},
+        rawResults=True,
+        batchSize=10000
+    ))
+
+def unlink_data_models(db, version_id, dm_ids):
+    """Remove DataModels which no longer exist from a Release, and bump
+    last_modified of their DataPaths whose search documents lose it.
+    """
+    unlink_query = """
+    LET unlinked_dm_ids = (
+        FOR release_dm IN ReleaseHasDataModel
+            FILTER release_dm._from == @release_id
+            FILTER release_dm._to IN @dm_ids
+            REMOVE release_dm IN ReleaseHasDataModel
+            RETURN OLD._to
+    )
+    LET now = DATE_NOW()
+    FOR dm_id IN unlinked_dm_ids
+        FOR dm_dp IN DataPathFromDataModel
+            FILTER dm_dp._from == dm_id
+            COLLECT dp_id = dm_dp._to
+            UPDATE PARSE_IDENTIFIER(dp_id).key WITH { last_modified: now } IN DataPath
+            OPTIONS { ignoreErrors: true }
+    """
+    db.AQLQuery(
+        unlink_query,
+        bindVars={'release_id': version_id, 'dm_ids': list(dm_ids)},
+        rawResults=True
+    )
+
+def add_version_paths(db, loader, os_key, version_paths):
+    """Add the streamed DataModels and DataPaths to the corresponding OS/Release.
+    DataModels are added once all of their DataPaths have been seen so that
+    the parsed_checksum is known.
+    """
+    version_id = None
+    module_name = None
+    revision = None
+    dm_id = None
+    parent_dm_id = None
+    checksum = None
+    def finish_module():
+        add_data_model(loader, version_id, module_name, revision, checksum.hexdigest(), parent_dm_id)
+    for version, path_module_name, path_revision, path in version_paths:
+        if path is not None:
+            add_data_path(db, loader, dm_id, path)
+            update_checksum(checksum, path)
+            continue
+        if dm_id is not None:
+            finish_module()
+            parent_dm_id = dm_id
+        version_id = 'Release/%s+%s' % (os_map[os_key], version)
+        if path_module_name != module_name:
+            module_name = path_module_name
+            parent_dm_id = None
+        revision = path_revision
+        dm_id = 'DataModel/%s+%s' % (module_name, revision)
+        checksum = new_checksum()
+    if dm_id is not None:
+        finish_module()
+
+def add_data_model(loader, version_id, module_name, revision, parsed_checksum, parent_dm_id=None):
+    """Add a DataModel to the corresponding OS/Release,
+    linked to the previous revision of the DataModel.
+    """
+    dml_id = 'DataModelLanguage/YANG'
+    dm_key = '%s+%s' % (module_name, revision)
+    dm_id = 'DataModel/%s' % dm_key
+    _, dm_new = key_index.queue('DataModel', dm_key)
+    if dm_new:
+        loader.add_document('DataModel', {
+            '_key': dm_key,
+            'name': module_name,
+            'revision': revision,
+            'content': None,
+            'parsed_checksum': parsed_checksum
+        })
+        loader.add_edge('OfDataModelLanguage', dml_id, dm_id)
+    if parent_dm_id is not None:
+        loader.add_edge('DataModelParent', dm_id, parent_dm_id)
+        loader.add_edge('DataModelChild', parent_dm_id, dm_id)
+    loader.add_edge('ReleaseHasDataModel', version_id, dm_id, {'parsed_checksum': parsed_checksum})
+
+def add_data_path(db, loader, dm_id, path, existing_keys=None):
+    """Add a parsed DataPath from the corresponding DataModel.
+    existing_keys overrides the _key of DataPaths by machine_id.
+    Returns the DataPath _id.
+    """
+    existing_keys = existing_keys or {}
+    path_key = existing_keys.get(path.machine_id) or datapath_key(path.machine_id)
+    path_id = 'DataPath/%s' % path_key
+    path_dense_id, path_new = key_index.queue('DataPath', int(path_key))
+    if path_new:
+        loader.add_document('DataPath', {
+            '_key': path_key,
+            'machine_id': path.machine_id,
+            'human_id': path.xpath,
+            'description': path.description,
+            'is_leaf': path.is_leaf,
+            'is_variable': False,
+            'is_configurable': path.rw,
+            'verified': False
+        })
+    dm_dense_id = key_index.intern('DataModel', dm_id[len('DataModel/'):])
+    if key_index.add_edge('DataPathFromDataModel', dm_dense_id, path_dense_id):
+        loader.add_edge('DataPathFromDataModel', dm_id, path_id)
+    if path.primitive_type is not None:
+        type_key = 'YANG+%s' % path.primitive_type
+        type_id = 'DataType/%s' % type_key
+        type_dense_id, type_new = key_index.queue('DataType', type_key)
+        if type_new:
+            try:
+                db['DataType'][type_key]
+            except KeyError:
+                logging.error('Could not resolve DataType %s!', type_key)
+                raise
+        if key_index.add_edge('OfDataType', path_dense_id, type_dense_id):
+            loader.add_edge('OfDataType', path_id, type_id)
+    if path.parent is not None:
+        parent_key = existing_keys.get(path.parent) or datapath_key(path.parent)
+        dp_parent_id = 'DataPath/%s' % parent_key
+        parent_dense_id = key_index.intern('DataPath', int(parent_key))
+        if key_index.add_edge('DataPathChild', parent_dense_id, path_dense_id):
+            loader.add_edge('DataPathChild', dp_parent_id, path_id)
+            loader.add_edge('DataPathParent', path_id, dp_parent_id)
+    return path_id
@@ -0,0 +1,79 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Content-addressed cache of parsed release tables.
+Entries are keyed by a hash of every YANG file in a release directory
+and the pyang version, so any change to the models or the parser
+invalidates the entry.
+"""
+import os
+import pickle
+import hashlib
+import logging
+import pyang
+
+# Bump when the layout of the parsed table changes.
+CACHE_FORMAT = 1
+PICKLE_PROTOCOL = min(5, pickle.HIGHEST_PROTOCOL)
+
+def hash_repository(repository_path):
+    """Hash the relative paths and contents of all YANG files in a directory."""
+    digest = hashlib.sha256()
+    digest.update(('tdm-parse-cache:%d:pyang:%s' % (CACHE_FORMAT, pyang.__version__)).encode('utf-8'))
+    yang_files = []
+    for dirpath, _, filenames in os.walk(repository_path):
+        for filename in filenames:
+            if filename.endswith('.yang'):
+                yang_files.append(os.path.join(dirpath, filename))
+    for file_path in sorted(yang_files):
+        digest.update(os.path.relpath(file_path, repository_path).encode('utf-8'))
+        digest.update(b'\0')
+        with open(file_path, 'rb') as yang_fd:
+            for chunk in iter(lambda: yang_fd.read(1 << 20), b''):
+                digest.update(chunk)
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+def get_cache_label(repository_path):
+    """Human readable prefix of cache entries, e.g. xr_631."""
+    return '_'.join(os.path.normpath(repository_path).split(os.sep)[-2:])
+
+def get_cache_path(cache_dir, repository_path, digest):
+    return os.path.join(cache_dir, '%s-%s.pickle' % (get_cache_label(repository_path), digest))
+
+def load_table(cache_dir, repository_path, digest):
+    """Load a cached table, None if not cached or unreadable."""
+    cache_path = get_cache_path(cache_dir, repository_path, digest)
+    if not os.path.isfile(cache_path):
+        return None
+    try:
+        with open(cache_path, 'rb') as cache_fd:
+            return pickle.load(cache_fd)
+    except Exception:
+        logging.exception('Discarding unreadable parse cache entry %s.', cache_path)
+        return None
+
+def store_table(cache_dir, repository_path, digest, version_table):
+    """Atomically store a table and prune stale entries of the same release."""
+    os.makedirs(cache_dir, exist_ok=True)
+    cache_path = get_cache_path(cache_dir, repository_path, digest)
+    temp_path = '%s.%d.tmp' % (cache_path, os.getpid())
+    with open(temp_path, 'wb') as cache_fd:
+        pickle.dump(version_table, cache_fd, protocol=PICKLE_PROTOCOL)
+    os.replace(temp_path, cache_path)
+    label_prefix = '%s-' % get_cache_label(repository_path)
+    for filename in os.listdir(cache_dir):
+        if filename.startswith(label_prefix) and filename.endswith('.pickle') \
+                and os.path.join(cache_dir, filename) != cache_path:
+            os.remove(os.path.join(cache_dir, filename))
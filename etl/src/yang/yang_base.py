@@ -16,14 +16,37 @@ limitations under the License.
 TODO: Revise with yang_parser.py
 """
 import os
+import gc
+import hashlib
 import logging
+from collections import namedtuple, deque
+from concurrent.futures import ProcessPoolExecutor
 from pyang import statements
 from . import yang_parser
+from . import parse_cache
+
+"""A single, flattened DataPath parsed from a YANG module.
+parent is the machine_id of the parent DataPath, if any.
+"""
+YANGPath = namedtuple('YANGPath', [
+    'machine_id',
+    'qualified_xpath',
+    'xpath',
+    'type',
+    'primitive_type',
+    'rw',
+    'description',
+    'is_leaf',
+    'parent'
+])
 
 class YANGBase:
 
-    def __init__(self, base_models_path, os_models_path, version_folder_map):
+    def __init__(self, base_models_path, os_models_path, version_folder_map, cache_dir=None):
         self.base_models_path = base_models_path
+        self.cache_dir = cache_dir
+        self.cache_hits = 0
+        self.cache_misses = 0
         self.os_models_path = os_models_path
         self.version_folder_map = version_folder_map
         self.fq_os_models_path = self.get_fq_os_models_path()
@@ -51,42 +74,162 @@ class YANGBase:
             raise ValueError('Version does not exist!')
         return version_path
 
-    def parse_versions(self):
-        """Parse all the Releases and their corresponding DataModels."""
-        version_module_map = {}
-        for version, version_path in self.version_path_map.items():
-            version_data = version_module_map[version] = {}
-            modules = yang_parser.parse_repository(version_path)
-            logging.info('Found %d module(s) for %s.', len(modules.keys()), version)
-            for module_key, module_revision in modules.items():
-                module_data = version_data[module_key] = {}
-                for revision_key, module in module_revision.items():
-                    module_data[revision_key] = self.parse_module_oper_attrs(module)
-                logging.debug('Parsed %d revision(s) for %s.', len(module_data.keys()), module_key)
-            logging.debug('Parsed %d module(s) for %s.', len(version_data.keys()), version)
-        logging.debug('Parsed %d version(s).', len(version_module_map.keys()))
-        return version_module_map
-
-    def parse_module_oper_attrs(self, module):
-        """Parse out the readable DataPaths from parsed data models.
+    def iter_versions(self, workers=1):
+        """Stream (release, module, revision, path) for every release.
+        A path of None marks the start of a module revision so that
+        DataModels without DataPaths are still represented.
+        With workers > 1 releases are parsed in a process pool, and with
+        a cache_dir parsed releases are cached, both streamed back in
+        release order.
         """
-        if not hasattr(module, 'i_children'):
-            return {}
-        module_children = (
-            child for child in module.i_children
-            if child.keyword in statements.data_definition_keywords
+        if (workers and workers > 1) or self.cache_dir:
+            for version, version_table in self.iter_version_tables(workers):
+                for module_key, revision_key, paths in version_table:
+                    yield (version, module_key, revision_key, None)
+                    for path in paths:
+                        yield (version, module_key, revision_key, path)
+                del version_table
+            self.log_cache_stats()
+        else:
+            for version in self.version_path_map.keys():
+                yield from self.iter_version(version)
+        logging.debug('Parsed %d version(s).', len(self.version_path_map.keys()))
+
+    def log_cache_stats(self):
+        if not self.cache_dir:
+            return
+        lookups = max(self.cache_hits + self.cache_misses, 1)
+        logging.info(
+            'Parse cache for %s: %d hit(s), %d miss(es), %.0f%% hit ratio.',
+            self.os_models_path, self.cache_hits, self.cache_misses,
+            100.0 * self.cache_hits / lookups
         )
-        parsed_modules = {}
-        for child in module_children:
-            attr_dict = {
-                'machine_id': '/%s' % ('/'.join(map(lambda x: ':'.join(x), yang_parser.mk_path_list(child)))),
-                'qualified_xpath': yang_parser.get_xpath(child, qualified=True, prefix_to_module=True),
-                'xpath': yang_parser.get_xpath(child, prefix_to_module=True),
-                'type': yang_parser.get_qualified_type(child),
-                'primitive_type': yang_parser.get_primitive_type(child),
-                'rw': True if getattr(child, 'i_config', False) else False,
-                'description': yang_parser.get_description(child),
-                'children': self.parse_module_oper_attrs(child)
-            }
-            parsed_modules[attr_dict['machine_id']] = attr_dict
-        return parsed_modules
+
+    def iter_version(self, version):
+        """Stream (release, module, revision, path) for a single release."""
+        for module_key, revision_key, path in iter_repository_paths(self.version_path_map[version]):
+            yield (version, module_key, revision_key, path)
+
+    def iter_version_tables(self, workers=1):
+        """Yield (release, table) in release order, parsing in a process pool
+        if workers > 1. At most workers releases are in flight, so parsed
+        tables do not pile up ahead of the loader.
+        """
+        def record(result):
+            version_table, cache_hit = result
+            if cache_hit:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+            return version_table
+        if not workers or workers <= 1:
+            for version, version_path in self.version_path_map.items():
+                yield version, record(load_version_table(version_path, self.cache_dir))
+            return
+        pending = deque()
+        version_paths = iter(self.version_path_map.items())
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            def submit_next():
+                for version, version_path in version_paths:
+                    pending.append((version, executor.submit(load_version_table, version_path, self.cache_dir)))
+                    return
+            for _ in range(workers):
+                submit_next()
+            while pending:
+                version, future = pending.popleft()
+                version_table = record(future.result())
+                submit_next()
+                yield version, version_table
+
+def load_version_table(repository_path, cache_dir=None):
+    """Load a release table from the parse cache, parsing and caching it
+    on a miss. Returns (table, cache_hit). Used as the process pool worker.
+    """
+    if not cache_dir:
+        return parse_version_table(repository_path), False
+    digest = parse_cache.hash_repository(repository_path)
+    version_table = parse_cache.load_table(cache_dir, repository_path, digest)
+    if version_table is not None:
+        logging.debug('Parse cache hit for %s.', repository_path)
+        return version_table, True
+    logging.debug('Parse cache miss for %s.', repository_path)
+    version_table = parse_version_table(repository_path)
+    parse_cache.store_table(cache_dir, repository_path, digest, version_table)
+    return version_table, False
+
+def parse_version_table(repository_path):
+    """Parse a release in to a compact, picklable table of
+    [(module, revision, [YANGPath, ...]), ...].
+    """
+    version_table = []
+    for module_key, revision_key, path in iter_repository_paths(repository_path):
+        if path is None:
+            version_table.append((module_key, revision_key, []))
+        else:
+            version_table[-1][2].append(path)
+    return version_table
+
+def iter_repository_paths(repository_path):
+    """Stream (module, revision, path) for a release repository.
+    The pyang Context is released once the repository is exhausted.
+    """
+    modules = yang_parser.parse_repository(repository_path)
+    logging.info('Found %d module(s) in %s.', len(modules.keys()), repository_path)
+    for module_key in sorted(modules.keys()):
+        module_revision = modules[module_key]
+        for revision_key in sorted(module_revision.keys()):
+            yield (module_key, revision_key, None)
+            for path in iter_module_oper_attrs(module_revision[revision_key]):
+                yield (module_key, revision_key, path)
+        logging.debug('Parsed %d revision(s) for %s.', len(module_revision.keys()), module_key)
+    logging.debug('Parsed %d module(s) in %s.', len(modules.keys()), repository_path)
+    modules.clear()
+    del modules
+    gc.collect()
+
+def iter_module_oper_attrs(module, parent=None):
+    """Stream the readable DataPaths from parsed data models.
+    Parents are always yielded before their children.
+    """
+    if not hasattr(module, 'i_children'):
+        return
+    module_children = (
+        child for child in module.i_children
+        if child.keyword in statements.data_definition_keywords
+    )
+    for child in module_children:
+        machine_id = '/%s' % ('/'.join(map(lambda x: ':'.join(x), yang_parser.mk_path_list(child))))
+        yield YANGPath(
+            machine_id=machine_id,
+            qualified_xpath=yang_parser.get_xpath(child, qualified=True, prefix_to_module=True),
+            xpath=yang_parser.get_xpath(child, prefix_to_module=True),
+            type=yang_parser.get_qualified_type(child),
+            primitive_type=yang_parser.get_primitive_type(child),
+            rw=True if getattr(child, 'i_config', False) else False,
+            description=yang_parser.get_description(child),
+            is_leaf=not has_data_children(child),
+            parent=parent
+        )
+        yield from iter_module_oper_attrs(child, machine_id)
+
+def new_checksum():
+    return hashlib.sha1()
+
+def update_checksum(checksum, path):
+    """Add a YANGPath to the running checksum of a DataModel."""
+    checksum.update(repr(tuple(path)).encode('utf-8'))
+    checksum.update(b'\n')
+
+def module_checksum(paths):
+    """The parsed_checksum of a DataModel from its YANGPaths."""
+    checksum = new_checksum()
+    for path in paths:
+        update_checksum(checksum, path)
+    return checksum.hexdigest()
+
+def has_data_children(stmt):
+    """Whether the statement has any readable children."""
+    return any(
+        child.keyword in statements.data_definition_keywords
+        for child in getattr(stmt, 'i_children', [])
+    )
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Benchmarks of the web tier queries against a loaded TDM database.
+Run in the web container, e.g.
+    pipenv run python benchmark.py details --samples 200
+explain checks the query plans of the web queries for full collection
+scans and exits non-zero if any are found.
+"""
+import sys
+import time
+import random
+import logging
+import argparse
+from web import app, views, search_cache
+from web.db import get_db
+from web.embedded_search import EmbeddedSearch
+from web.cache import RevisionedIndex
+from web.suggest import DATAPATH_IDS_QUERY, SuggestIndex
+from web.resolve import PathIndex
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def report(label, timings):
+    logging.info(
+        '%-24s n=%-5i mean=%7.2fms p50=%7.2fms p95=%7.2fms p99=%7.2fms',
+        label, len(timings),
+        1000 * sum(timings) / len(timings),
+        1000 * percentile(timings, 0.50),
+        1000 * percentile(timings, 0.95),
+        1000 * percentile(timings, 0.99)
+    )
+
+def time_calls(function, keys):
+    timings = []
+    for key in keys:
+        start = time.perf_counter()
+        function(key)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def sample_datapath_keys(samples):
+    sample_query = """
+    FOR dp IN DataPath
+        SORT RAND()
+        LIMIT @samples
+        RETURN TO_NUMBER(dp._key)
+    """
+    return views.query_db(sample_query, {'samples': samples}, unlist=False)
+
+def fetch_datapath_details_per_part(_key):
+    """The DataPath view as it was, one round trip per part."""
+    views.fetch_datapath(_key)
+    views.fetch_datapath_os_graph(_key)
+    views.fetch_datapath_dml_graph(_key)
+    views.fetch_datapath_parent(_key)
+    views.fetch_datapath_children(_key)
+    views.fetch_datapath_datatype(_key)
+    views.fetch_datapath_mappings(_key)
+
+def benchmark_details(args):
+    """Seven queries per DataPath view versus the consolidated query."""
+    keys = sample_datapath_keys(args.samples)
+    if not keys:
+        logging.error('No DataPaths to benchmark!')
+        return
+    random.shuffle(keys)
+    # Warm up the connection pool and the database caches.
+    time_calls(views.fetch_datapath_details, keys[:10])
+    time_calls(fetch_datapath_details_per_part, keys[:10])
+    report('details per part', time_calls(fetch_datapath_details_per_part, keys))
+    report('details consolidated', time_calls(views.fetch_datapath_details, keys))
+
+def sample_datapaths(samples):
+    sample_query = """
+    FOR dp IN DataPath
+        SORT RAND()
+        LIMIT @samples
+        RETURN {
+            "_key": TO_NUMBER(dp._key),
+            "machine_id": dp.machine_id,
+            "human_id": dp.human_id
+        }
+    """
+    return views.query_db(sample_query, {'samples': samples}, unlist=False)
+
+def benchmark_lookup(args):
+    """Bulk lookup of DataPaths by machine_id and human_id."""
+    datapaths = sample_datapaths(args.samples)
+    if not datapaths:
+        logging.error('No DataPaths to benchmark!')
+        return
+    given_dps = [dp['machine_id'] for dp in datapaths[::2]] + [dp['human_id'] for dp in datapaths[1::2]]
+    for function in (views.fetch_matches, views.fetch_calculations):
+        function(given_dps)
+        report('%s x%i' % (function.__name__, len(given_dps)), time_calls(function, [given_dps] * 10))
+
+def sample_search_strings(samples):
+    """The last element of sampled human_ids, as a user would search."""
+    return [
+        dp['human_id'].strip('/').split('/')[-1].split(':')[-1].lower()
+        for dp in sample_datapaths(samples) if dp['human_id']
+    ]
+
+def benchmark_search(args):
+    """The embedded search backend versus Elasticsearch on the same queries."""
+    filter_strs = sample_search_strings(args.samples)
+    if not filter_strs:
+        logging.error('No DataPaths to search for!')
+        return
+    embedded = EmbeddedSearch.from_config(get_db, app.config)
+    embedded.open_latest()
+    if embedded.index is None:
+        logging.info('Building embedded search index in %s.', embedded.index_dir)
+        embedded.rebuild(None)
+    def search_embedded(filter_str):
+        return embedded.search({}, [], filter_str)
+    def search_es(filter_str):
+        search_cache.clear()
+        return views.fetch_search_data_paths_es({}, [], filter_str)
+    configured_backend = views.embedded_search
+    views.embedded_search = None
+    try:
+        for label, function in (('search embedded', search_embedded), ('search es', search_es)):
+            time_calls(function, filter_strs[:10])
+            report(label, time_calls(function, filter_strs))
+        overlaps = []
+        for filter_str in filter_strs:
+            embedded_ids = set(search_embedded(filter_str)['human_id'])
+            es_ids = set(search_es(filter_str)['human_id'])
+            if embedded_ids or es_ids:
+                overlaps.append(len(embedded_ids & es_ids) / len(embedded_ids | es_ids))
+        if overlaps:
+            logging.info('Mean overlap of result human_ids: %.1f%%', 100 * sum(overlaps) / len(overlaps))
+    finally:
+        views.embedded_search = configured_backend
+
+def build_index(name, build):
+    revisioned_index = RevisionedIndex(get_db, name, DATAPATH_IDS_QUERY, build)
+    start = time.perf_counter()
+    revisioned_index.rebuild(None)
+    logging.info('%s index built in %.1fs.', name, time.perf_counter() - start)
+    return revisioned_index.index
+
+def benchmark_suggest(args):
+    """Building the suggest index and typing sampled human_ids in to it."""
+    datapaths = sample_datapaths(args.samples)
+    if not datapaths:
+        logging.error('No DataPaths to suggest!')
+        return
+    index = build_index('Suggest', SuggestIndex)
+    keystrokes = [
+        dp['human_id'][:length]
+        for dp in datapaths if dp['human_id']
+        for length in range(1, len(dp['human_id']) + 1)
+    ]
+    report('suggest x%i' % len(keystrokes), time_calls(index.suggest, keystrokes))
+
+def wire_forms(machine_id):
+    """machine_id as seen on the wire: prefixed, keyed and as a gNMI Path."""
+    elements = [element.split(':') for element in machine_id[1:].split('/')]
+    prefixed = ''.join('/%s:%s' % (parts[1], parts[-1]) for parts in elements)
+    keyed = ''.join('/%s[name=x/y]' % parts[-1] for parts in elements)
+    gnmi = {'elem': [{'name': '%s:%s' % (parts[0], parts[-1])} for parts in elements]}
+    return [prefixed, keyed, gnmi]
+
+def benchmark_resolve(args):
+    """Resolving sampled machine_ids in their wire forms, as a batch."""
+    datapaths = sample_datapaths(args.samples)
+    paths = []
+    for dp in datapaths:
+        machine_id = dp['machine_id']
+        if machine_id and machine_id.startswith('/'):
+            paths.extend(wire_forms(machine_id))
+        elif machine_id:
+            paths.append(machine_id)
+    if not paths:
+        logging.error('No DataPaths to resolve!')
+        return
+    index = build_index('Path', PathIndex)
+    start = time.perf_counter()
+    results = [index.resolve(path) for path in paths]
+    elapsed = time.perf_counter() - start
+    match_types = {}
+    for result in results:
+        match_types[result['match_type']] = match_types.get(result['match_type'], 0) + 1
+    logging.info(
+        'Resolved %i path(s) in %.3fs, %.0f paths/s: %s',
+        len(paths), elapsed, len(paths) / elapsed,
+        ', '.join('%s %i' % item for item in sorted(match_types.items()))
+    )
+
+# (fetch function, args from a sampled DataPath, collections which may be fully scanned)
+# Queries which fully scan a collection must not look a document up per row.
+EXPLAIN_CASES = [
+    (views.fetch_datapath_arbitrary_id, lambda dp: [dp['machine_id']], ()),
+    (views.fetch_matches, lambda dp: [[dp['machine_id'], dp['human_id']]], ()),
+    (views.fetch_calculations, lambda dp: [[dp['machine_id'], dp['human_id']]], ()),
+    (views.fetch_calculations_as_result, lambda dp: [[dp['machine_id'], dp['human_id']]], ()),
+    (views.fetch_calculations_as_factor, lambda dp: [[dp['machine_id'], dp['human_id']]], ()),
+    (views.fetch_datapath_details, lambda dp: [dp['_key']], ()),
+    (views.fetch_datapath, lambda dp: [dp['_key']], ()),
+    (views.fetch_search_data_paths, lambda dp: [{}, [], dp['human_id']], ()),
+    (views.fetch_collection_counts, lambda dp: [['DataPath', 'DataPathMatch']], ()),
+    (views.fetch_all_matches, lambda dp: [], ('DataModelLanguage',)),
+    (views.fetch_os_releases, lambda dp: [], ('OS',)),
+    (views.fetch_dmls, lambda dp: [], ('DataModelLanguage',)),
+    (views.fetch_dump_mappings, lambda dp: [], ('DataPathMatch',)),
+    (views.fetch_dump_mappings_native, lambda dp: [], ('DataPathMatch',)),
+    (views.fetch_dump_calculations_native, lambda dp: [], ('Calculation',))
+]
+
+def capture_queries(function, function_args):
+    """The (query, bind_vars) a fetch function issues, without running them."""
+    captured = []
+    def capture_query_db(query, bind_vars=None, *args, **kwargs):
+        captured.append((query, bind_vars))
+        return []
+    query_db = views.query_db
+    views.query_db = capture_query_db
+    try:
+        function(*function_args)
+    finally:
+        views.query_db = query_db
+    return captured
+
+def iter_plan_nodes(nodes):
+    for node in nodes:
+        yield node
+        if 'subquery' in node:
+            yield from iter_plan_nodes(node['subquery']['nodes'])
+
+def iter_function_calls(expression):
+    """Names of the functions called within a plan expression."""
+    if expression.get('type') == 'function call':
+        yield expression['name']
+    for sub_node in expression.get('subNodes', []):
+        yield from iter_function_calls(sub_node)
+
+def benchmark_explain(args):
+    """EXPLAIN the web queries and fail on full collection scans,
+    and on DOCUMENT() lookups per row of the scans which are expected.
+    """
+    datapaths = sample_datapaths(1)
+    if not datapaths:
+        logging.error('No DataPaths to explain with!')
+        sys.exit(1)
+    full_scans = 0
+    for function, get_args, scan_allowed in EXPLAIN_CASES:
+        for query, bind_vars in capture_queries(function, get_args(datapaths[0])):
+            plan = get_db().aql.explain(query, bind_vars=bind_vars)
+            scanned = set(
+                node['collection'] for node in iter_plan_nodes(plan['nodes'])
+                if node['type'] == 'EnumerateCollectionNode'
+            )
+            unexpected = scanned - set(scan_allowed)
+            lookups_per_row = scanned and any(
+                'DOCUMENT' in iter_function_calls(node['expression'])
+                for node in iter_plan_nodes(plan['nodes'])
+                if node['type'] == 'CalculationNode'
+            )
+            if unexpected:
+                full_scans += 1
+                logging.error('%s fully scans %s!', function.__name__, ', '.join(sorted(unexpected)))
+            elif lookups_per_row:
+                full_scans += 1
+                logging.error('%s looks up a document per row of a full scan!', function.__name__)
+            else:
+                logging.info('%s OK.', function.__name__)
+    if full_scans:
+        sys.exit(1)
+
+BENCHMARKS = {
+    'details': benchmark_details,
+    'lookup': benchmark_lookup,
+    'search': benchmark_search,
+    'suggest': benchmark_suggest,
+    'resolve': benchmark_resolve,
+    'explain': benchmark_explain
+}
+
+def setup_args():
+    parser = argparse.ArgumentParser(
+        description='TDM Web benchmarks'
+    )
+    parser.add_argument('benchmark',
+        choices=sorted(BENCHMARKS.keys()),
+        help='Benchmark to run'
+    )
+    parser.add_argument('--samples',
+        type=int,
+        help='Number of DataPaths to sample',
+        default=200
+    )
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    args = setup_args()
+    BENCHMARKS[args.benchmark](args)
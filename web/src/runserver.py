@@ -15,6 +15,10 @@ limitations under the License.
 """
 
 import os
+if os.environ.get('FLASK_ENV') != 'development':
+    # Cooperative sockets for the shared ArangoDB and Elasticsearch pools.
+    from gevent import monkey
+    monkey.patch_all()
 from gevent.pywsgi import WSGIServer
 from web import app
 
@@ -25,6 +25,34 @@ app.config.update(
 	SECRET_KEY="1234abcd",
 	JSON_SORT_KEYS=False
 )
+from .db import config_from_env, init_db, get_db
+from .cache import CACHE_SETTINGS, QueryCache, RevisionedIndex
+from .es import SEARCH_SETTINGS, init_es
+from .embedded_search import EMBEDDED_SEARCH_SETTINGS, EmbeddedSearch
+from .suggest import DATAPATH_IDS_QUERY, SuggestIndex
+from .resolve import PathIndex
+app.config.update(config_from_env())
+app.config.update(config_from_env(CACHE_SETTINGS))
+app.config.update(config_from_env(SEARCH_SETTINGS))
+app.config.update(config_from_env(EMBEDDED_SEARCH_SETTINGS))
+init_db(app.config)
+init_es(app.config)
+query_cache = QueryCache.from_config(get_db, app.config)
+search_cache = QueryCache(
+	get_db,
+	max_entries=app.config['SEARCH_CACHE_SIZE'],
+	ttl=app.config['SEARCH_CACHE_TTL'],
+	revision_interval=app.config['CATALOG_REVISION_INTERVAL']
+)
+query_cache.check_revision(force=True)
+suggest_index = RevisionedIndex(get_db, 'Suggest', DATAPATH_IDS_QUERY, SuggestIndex)
+suggest_index.ensure_revision(query_cache.catalog_revision)
+path_index = RevisionedIndex(get_db, 'Path', DATAPATH_IDS_QUERY, PathIndex)
+path_index.ensure_revision(query_cache.catalog_revision)
+embedded_search = None
+if app.config['SEARCH_BACKEND'] == 'embedded':
+	embedded_search = EmbeddedSearch.from_config(get_db, app.config)
+	embedded_search.open_latest()
 from . import views
 
 @app.before_first_request
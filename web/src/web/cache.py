@@ -0,0 +1,282 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Read-through cache of query results.
+Results are kept per process, bounded by entry count (LRU) and age (TTL),
+and dropped whenever the revision changes. The revision is a pair of
+counters in the CatalogRevision collection, re-read at most every
+revision_interval: the catalog revision, which the ETL bumps, and the
+mappings revision, which the mapping write APIs bump.
+RevisionedIndex rebuilds in-memory indexes on catalog revision changes
+only, as mappings are not indexed.
+"""
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from gevent import monkey, get_hub
+
+# app.config key: (environment variable, default)
+CACHE_SETTINGS = {
+    'QUERY_CACHE_SIZE': ('QUERY_CACHE_SIZE', 1024),
+    'QUERY_CACHE_TTL': ('QUERY_CACHE_TTL', 3600.0),
+    'CATALOG_REVISION_INTERVAL': ('CATALOG_REVISION_INTERVAL', 5.0)
+}
+
+CATALOG_REVISION_KEY = 'catalog'
+MAPPINGS_REVISION_KEY = 'mappings'
+# Seconds before a failed index build is retried.
+BUILD_RETRY_INTERVAL = 60.0
+
+def run_in_native_thread(function, *args):
+    """function(*args), in a native thread of the gevent hub once gevent
+    has patched threading, so CPU-bound work doesn't stall the event loop.
+    function must not use the greenlet's database connections.
+    """
+    if monkey.is_module_patched('threading'):
+        return get_hub().threadpool.apply(function, args)
+    return function(*args)
+
+class QueryCache:
+    """LRU/TTL cache of query results keyed by query and bind vars.
+    Cached results are shared between requests and must not be mutated.
+    """
+
+    def __init__(self, get_db, max_entries=1024, ttl=3600.0, revision_interval=5.0):
+        self.get_db = get_db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revision_interval = revision_interval
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # Greenlet local once gevent has patched threading.
+        self.local = threading.local()
+        self.revision = None
+        self.revision_checked = 0.0
+        self.reset_stats()
+
+    @classmethod
+    def from_config(cls, get_db, config):
+        return cls(
+            get_db,
+            max_entries=config['QUERY_CACHE_SIZE'],
+            ttl=config['QUERY_CACHE_TTL'],
+            revision_interval=config['CATALOG_REVISION_INTERVAL']
+        )
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'invalidations': self.invalidations,
+            'revision': self.revision
+        }
+
+    @staticmethod
+    def make_key(*parts):
+        return json.dumps(parts, sort_keys=True, default=str)
+
+    def get_or_compute(self, key, compute):
+        """Return the cached value of key, computing and caching it on a miss."""
+        self.check_revision()
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if now - entry[0] <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self.entries[key]
+                self.expirations += 1
+            self.misses += 1
+            revision = self.revision
+        value = compute()
+        with self.lock:
+            # Don't cache results computed against a stale revision.
+            if revision == self.revision:
+                self.entries[key] = (now, value)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+                    self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+
+    @property
+    def catalog_revision(self):
+        """The revision of the ETL's catalog, without mapping writes."""
+        return self.revision[0] if self.revision else None
+
+    def fetch_revision(self):
+        revision_query = """
+        RETURN [
+            DOCUMENT(CONCAT("CatalogRevision/", @catalog_key)).revision,
+            DOCUMENT(CONCAT("CatalogRevision/", @mappings_key)).revision
+        ]
+        """
+        cursor = self.get_db().aql.execute(
+            revision_query,
+            bind_vars={'catalog_key': CATALOG_REVISION_KEY, 'mappings_key': MAPPINGS_REVISION_KEY}
+        )
+        return next(cursor, None)
+
+    def check_revision(self, force=False):
+        """Clear the cache if the catalog or mappings revision changed."""
+        now = time.time()
+        if not force and now - self.revision_checked < self.revision_interval:
+            return
+        self.revision_checked = now
+        try:
+            revision = self.fetch_revision()
+        except Exception:
+            logging.exception('Unable to check catalog revision, clearing query cache.')
+            self.clear()
+            return
+        if revision != self.revision:
+            with self.lock:
+                self.revision = revision
+            self.clear()
+
+    def bump_revision(self):
+        """Record that the mappings changed, invalidating all query caches
+        but not the indexes of the catalog.
+        Deferred to the end of a deferred_bumps block if in one.
+        """
+        if getattr(self.local, 'deferred', None) is not None:
+            self.local.deferred = True
+            return
+        bump_query = """
+        UPSERT { _key: @key }
+            INSERT { _key: @key, revision: 1, updated: DATE_NOW() }
+            UPDATE { revision: OLD.revision + 1, updated: DATE_NOW() }
+            IN CatalogRevision
+        RETURN NEW.revision
+        """
+        try:
+            cursor = self.get_db().aql.execute(
+                bump_query,
+                bind_vars={'key': MAPPINGS_REVISION_KEY}
+            )
+            revision = next(cursor, None)
+        except Exception:
+            # Other processes will only notice once their entries expire.
+            logging.exception('Unable to bump mappings revision!')
+            revision = None
+        with self.lock:
+            self.revision = [self.catalog_revision, revision]
+            self.revision_checked = time.time()
+        self.clear()
+
+    @contextmanager
+    def deferred_bumps(self):
+        """Collapse the revision bumps of a bulk write in to one."""
+        self.local.deferred = False
+        try:
+            yield
+        finally:
+            bumped = self.local.deferred
+            self.local.deferred = None
+            if bumped:
+                self.bump_revision()
+
+class RevisionedIndex:
+    """An in-memory index, built by build(rows, revision) from the rows of
+    a query, which is rebuilt in the background when the catalog revision
+    changes. The rows are fetched by a greenlet and built in a native
+    thread. The previous index serves meanwhile, and index is None until
+    the first build completes. Subclasses may override load and swap.
+    """
+
+    batch_size = 10000
+
+    def __init__(self, get_db, name, query, build=None):
+        self.get_db = get_db
+        self.name = name
+        self.query = query
+        self.build = build
+        self.index = None
+        self.lock = threading.Lock()
+        # Set once the first build has succeeded or failed.
+        self.attempted = threading.Event()
+        self.building = False
+        self.failed_at = None
+
+    def ensure_revision(self, revision):
+        """Rebuild in the background if the index is of another revision,
+        waiting BUILD_RETRY_INTERVAL after a failed build.
+        """
+        with self.lock:
+            if self.building or (self.index is not None and self.index.revision == revision):
+                return
+            if self.failed_at is not None and time.time() - self.failed_at < BUILD_RETRY_INTERVAL:
+                return
+            self.building = True
+        threading.Thread(target=self.rebuild, args=(revision,), daemon=True).start()
+
+    def iter_rows(self):
+        cursor = self.get_db().aql.execute(self.query, batch_size=self.batch_size, stream=True)
+        try:
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close(ignore_missing=True)
+
+    def load(self, revision):
+        """Build the index of revision."""
+        rows = list(self.iter_rows())
+        return run_in_native_thread(self.build, rows, revision)
+
+    def swap(self, index):
+        """Serve index."""
+        with self.lock:
+            self.index = index
+
+    def rebuild(self, revision):
+        try:
+            start = time.time()
+            index = self.load(revision)
+            self.swap(index)
+            self.failed_at = None
+            logging.info(
+                '%s index of revision %s, %i DataPath(s) in %.1fs.',
+                self.name, revision, len(index), time.time() - start
+            )
+        except Exception:
+            self.failed_at = time.time()
+            logging.exception('Unable to build %s index!', self.name)
+        finally:
+            with self.lock:
+                self.building = False
+            self.attempted.set()
@@ -0,0 +1,132 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Process-wide ArangoDB access.
+A single ArangoClient, and database handle, is shared by every request
+instead of being created per query. Requests go through a bounded pool
+of keep-alive connections which is safe to share between greenlets
+once gevent has patched the standard library.
+"""
+import os
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from arango import ArangoClient
+from arango.http import HTTPClient
+from arango.response import Response
+
+# app.config key: (environment variable, default)
+DB_SETTINGS = {
+    'ARANGO_HOSTS': ('ARANGO_HOSTS', 'http://dbms:8529'),
+    'ARANGO_DATABASE': ('ARANGO_DATABASE', 'tdm'),
+    'ARANGO_USERNAME': ('ARANGO_USERNAME', 'root'),
+    'ARANGO_PASSWORD': ('ARANGO_PASSWORD', 'tdm'),
+    'ARANGO_POOL_SIZE': ('ARANGO_POOL_SIZE', 32),
+    'ARANGO_POOL_BLOCK': ('ARANGO_POOL_BLOCK', True),
+    'ARANGO_CONNECT_TIMEOUT': ('ARANGO_CONNECT_TIMEOUT', 5.0),
+    'ARANGO_READ_TIMEOUT': ('ARANGO_READ_TIMEOUT', 60.0),
+    'ARANGO_RETRIES': ('ARANGO_RETRIES', 1)
+}
+
+_client = None
+_db = None
+
+def config_from_env(settings=DB_SETTINGS):
+    """Settings from the environment, falling back to defaults."""
+    config = {}
+    for config_key, (env_key, default) in settings.items():
+        value = os.environ.get(env_key)
+        if value is None:
+            config[config_key] = default
+        elif isinstance(default, bool):
+            config[config_key] = value.lower() in ('1', 'true', 'yes')
+        else:
+            config[config_key] = type(default)(value)
+    return config
+
+class PooledHTTPClient(HTTPClient):
+    """HTTP client for python-arango with a bounded keep-alive pool.
+    With pool_block, requests beyond pool_size wait for a free connection
+    rather than opening and discarding extra ones.
+    """
+
+    def __init__(self, pool_size=32, pool_block=True, connect_timeout=5.0, read_timeout=60.0, retries=1):
+        self.pool_size = pool_size
+        self.pool_block = pool_block
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+
+    def create_session(self, host):
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_size,
+            pool_block=self.pool_block,
+            max_retries=self.retries
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def send_request(self, session, method, url, params=None, data=None, headers=None, auth=None):
+        response = session.request(
+            method=method,
+            url=url,
+            params=params,
+            data=data,
+            headers=headers,
+            auth=auth,
+            timeout=self.timeout
+        )
+        return Response(
+            method=response.request.method,
+            url=response.url,
+            headers=response.headers,
+            status_code=response.status_code,
+            status_text=response.reason,
+            raw_body=response.text
+        )
+
+def init_db(config):
+    """Create the shared client and database handle from app.config."""
+    global _client, _db
+    hosts = config['ARANGO_HOSTS']
+    if isinstance(hosts, str):
+        hosts = [host.strip() for host in hosts.split(',')]
+    _client = ArangoClient(
+        hosts=hosts if len(hosts) > 1 else hosts[0],
+        http_client=PooledHTTPClient(
+            pool_size=config['ARANGO_POOL_SIZE'],
+            pool_block=config['ARANGO_POOL_BLOCK'],
+            connect_timeout=config['ARANGO_CONNECT_TIMEOUT'],
+            read_timeout=config['ARANGO_READ_TIMEOUT'],
+            retries=config['ARANGO_RETRIES']
+        )
+    )
+    _db = _client.db(
+        config['ARANGO_DATABASE'],
+        username=config['ARANGO_USERNAME'],
+        password=config['ARANGO_PASSWORD']
+    )
+    logging.info(
+        'ArangoDB pool of %i connection(s) to %s.',
+        config['ARANGO_POOL_SIZE'], ', '.join(hosts)
+    )
+    return _db
+
+def get_db():
+    """The shared database handle."""
+    if _db is None:
+        raise RuntimeError('Database not initialized, call init_db first!')
+    return _db
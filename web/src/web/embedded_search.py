@@ -0,0 +1,628 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""In-process DataPath search, an alternative to Elasticsearch for small
+deployments. Reproduces the analysis of the ETL's search index and its
+multi_match most_fields query with BM25 scoring over one document per
+DataPath, and answers in the /api/v1/search/es response shape.
+
+An index is a directory of flat files which are memory-mapped rather than
+read in to the Python heap. Strings are kept in string tables, a file of
+UTF-8 strings and a .offsets file of where each starts, and arrays are uint32:
+    meta.json               format, revision, document count, average field lengths
+    keys                    string table of the dp_key of each document
+    human_ids, machine_ids  string tables of the identifiers of each document
+    flags                   a byte per document, IS_LEAF | IS_CONFIGURABLE
+    <field>.terms           string table of the terms of a field, sorted
+    <field>.postings        start of each term in the arrays below, then their end
+    <field>.docs            document numbers of each term, ascending
+    <field>.freqs           term frequencies, text fields only
+    <field>.lengths         field length per document, text fields only
+    <field>.grams           string table of the trigrams of the terms, sorted,
+                            of path fields, terms shorter than 3 being their own
+    <field>.gram_postings   start of each trigram in the array below, then their end
+    <field>.gram_terms      term numbers of each trigram, ascending
+Indexes are rebuilt from ArangoDB in a native thread when the catalog
+revision of the ETL changes, and swapped in once complete.
+"""
+import os
+import re
+import json
+import math
+import mmap
+import time
+import shutil
+import heapq
+import bisect
+import logging
+from array import array
+from collections import OrderedDict
+from .cache import RevisionedIndex, run_in_native_thread
+
+# app.config key: (environment variable, default)
+EMBEDDED_SEARCH_SETTINGS = {
+    'SEARCH_BACKEND': ('SEARCH_BACKEND', 'elasticsearch'),
+    'SEARCH_EMBEDDED_DIR': ('SEARCH_EMBEDDED_DIR', '/data/search'),
+    'SEARCH_EMBEDDED_WAIT': ('SEARCH_EMBEDDED_WAIT', 10.0)
+}
+
+# Field: boost, as in the multi_match of views.fetch_search_data_paths_es
+TEXT_FIELDS = OrderedDict([
+    ('dp_human_id', 3.0),
+    ('dp_machine_id', 1.0),
+    ('dp_description', 1.0)
+])
+KEYWORD_FIELDS = ('os_release', 'dml_name')
+# Fields searched by the prefix and substring match modes.
+PATH_FIELDS = ('dp_human_id', 'dp_machine_id')
+MAX_EXPANSIONS = 256
+INDEX_FORMAT = 2
+IS_LEAF = 1
+IS_CONFIGURABLE = 2
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Mirrors generic_path_analyzer of the ETL's search.py.
+re_path_split = re.compile(r'[.\-/:\s]')
+re_word_parts = re.compile(r'[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+')
+NETWORK_SYNONYMS = [
+    'optic, transceiver',
+    'intf, interface, if, int',
+    'ucast, unicast',
+    'mcast, multicast',
+    'pkt, packet',
+    'in, inbound'
+]
+SYNONYMS = {}
+for synonym_line in NETWORK_SYNONYMS:
+    synonym_group = tuple(synonym.strip() for synonym in synonym_line.split(','))
+    for synonym in synonym_group:
+        SYNONYMS[synonym] = synonym_group
+
+# Approximates the snowball analyzer used for descriptions.
+re_description_words = re.compile(r'[a-z0-9]+')
+ENGLISH_STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'but', 'by', 'for', 'if', 'in',
+    'into', 'is', 'it', 'no', 'not', 'of', 'on', 'or', 'such', 'that', 'the',
+    'their', 'then', 'there', 'these', 'they', 'this', 'to', 'was', 'will', 'with'
+])
+
+def analyze_path(text):
+    """[(position, term)] of a machine_id or human_id.
+    Splits on . - / : and whitespace then on case changes, numbers and other delimiters,
+    keeping the original token at the position of its first part,
+    lowercases, and expands network_synonym at the same position.
+    """
+    tokens = []
+    position = 0
+    for token in re_path_split.split(text or ''):
+        parts = re_word_parts.findall(token)
+        if not parts:
+            continue
+        terms = [(position + index, part) for index, part in enumerate(parts)]
+        if len(parts) > 1 or parts[0] != token:
+            terms.insert(0, (position, token))
+        for term_position, term in terms:
+            term = term.lower()
+            for synonym in SYNONYMS.get(term, (term,)):
+                tokens.append((term_position, synonym))
+        position += len(parts)
+    return tokens
+
+def stem_english(word):
+    if len(word) > 4 and word.endswith('sses'):
+        return word[:-2]
+    if len(word) > 4 and word.endswith('ies'):
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss') and not word.endswith('us'):
+        return word[:-1]
+    return word
+
+def analyze_description(text):
+    """[(position, term)] of a description, lowercased alphanumeric
+    words without English stop words and with plurals stemmed.
+    """
+    return [
+        (position, stem_english(word))
+        for position, word in enumerate(re_description_words.findall((text or '').lower()))
+        if word not in ENGLISH_STOP_WORDS
+    ]
+
+ANALYZERS = {
+    'dp_human_id': analyze_path,
+    'dp_machine_id': analyze_path,
+    'dp_description': analyze_description
+}
+
+def query_groups(field, filter_str):
+    """The query terms of a field grouped by position. Like ES, terms at
+    the same position are alternatives and every position must match.
+    """
+    groups = OrderedDict()
+    for position, term in ANALYZERS[field](filter_str):
+        groups.setdefault(position, set()).add(term)
+    return list(groups.values())
+
+def query_path_elements(filter_str):
+    """The lowercased path elements of a prefix or substring query."""
+    return [element for element in re_path_split.split(filter_str.lower()) if element]
+
+def write_uint32(file_path, values):
+    with open(file_path, 'wb') as array_fd:
+        array('I', values).tofile(array_fd)
+
+def write_strings(file_path, strings):
+    """Write a string table of strings, None being written as ''."""
+    offsets = array('I', [0])
+    with open(file_path, 'wb') as strings_fd:
+        for string in strings:
+            encoded = (string or '').encode('utf-8')
+            strings_fd.write(encoded)
+            offsets.append(offsets[-1] + len(encoded))
+    write_uint32('%s.offsets' % file_path, offsets)
+
+def map_bytes(file_path):
+    """A read-only view of a file, unmapped once unreferenced."""
+    with open(file_path, 'rb') as mapped_fd:
+        if os.fstat(mapped_fd.fileno()).st_size == 0:
+            return memoryview(b'')
+        mapped = mmap.mmap(mapped_fd.fileno(), 0, access=mmap.ACCESS_READ)
+    return memoryview(mapped)
+
+def map_uint32(file_path):
+    """A read-only uint32 view of a file, unmapped once unreferenced."""
+    mapped = map_bytes(file_path)
+    return mapped.cast('I') if len(mapped) else memoryview(array('I'))
+
+class StringTable:
+    """A memory-mapped string table, written by write_strings."""
+
+    def __init__(self, file_path):
+        self.data = map_bytes(file_path)
+        self.offsets = map_uint32('%s.offsets' % file_path)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, number):
+        return str(self.data[self.offsets[number]:self.offsets[number + 1]], 'utf-8')
+
+    def bisect_left(self, value, low=0):
+        """Where value would be inserted in a sorted table."""
+        high = len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self[middle] < value:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def find(self, value):
+        """The number of value in a sorted table, or None."""
+        number = self.bisect_left(value)
+        if number < len(self) and self[number] == value:
+            return number
+        return None
+
+def term_grams(term):
+    """The trigrams of a term, or the term itself if shorter."""
+    if len(term) < 3:
+        return set([term])
+    return set(term[index:index + 3] for index in range(len(term) - 2))
+
+def contains_sorted(values, value):
+    index = bisect.bisect_left(values, value)
+    return index < len(values) and values[index] == value
+
+def write_postings(index_dir, field, postings, keys_kind, offsets_kind, numbers_kind):
+    """Write {key: [number]} as a sorted string table of keys, the start
+    of the numbers of each key then their end, and the numbers.
+    """
+    keys = sorted(postings)
+    offsets = array('I', [0])
+    numbers = array('I')
+    for key in keys:
+        numbers.extend(postings[key])
+        offsets.append(len(numbers))
+    write_strings(os.path.join(index_dir, '%s.%s' % (field, keys_kind)), keys)
+    write_uint32(os.path.join(index_dir, '%s.%s' % (field, offsets_kind)), offsets)
+    write_uint32(os.path.join(index_dir, '%s.%s' % (field, numbers_kind)), numbers)
+
+def build_index(documents, index_dir, revision=None):
+    """Write an index of the search documents, as produced for ES by the
+    ETL, in to index_dir. Returns the number of documents indexed.
+    """
+    os.makedirs(index_dir, exist_ok=True)
+    identifiers = dict((table, []) for table in ('keys', 'human_ids', 'machine_ids'))
+    flags = bytearray()
+    text_postings = dict((field, {}) for field in TEXT_FIELDS)
+    text_lengths = dict((field, array('I')) for field in TEXT_FIELDS)
+    keyword_postings = dict((field, {}) for field in KEYWORD_FIELDS)
+    for doc_number, document in enumerate(documents):
+        identifiers['keys'].append(document['dp_key'])
+        identifiers['human_ids'].append(document['dp_human_id'])
+        identifiers['machine_ids'].append(document['dp_machine_id'])
+        flags.append(
+            (IS_LEAF if document.get('dp_is_leaf') else 0) |
+            (IS_CONFIGURABLE if document.get('dp_is_configurable') else 0)
+        )
+        for field in TEXT_FIELDS:
+            tokens = ANALYZERS[field](document.get(field))
+            frequencies = {}
+            for _, term in tokens:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, frequency in frequencies.items():
+                text_postings[field].setdefault(term, []).append((doc_number, frequency))
+            # Overlapping tokens don't count towards the length, as in Lucene.
+            text_lengths[field].append(len(set(position for position, _ in tokens)))
+        for field in KEYWORD_FIELDS:
+            for value in set(document.get(field) or []):
+                keyword_postings[field].setdefault(value, []).append(doc_number)
+    doc_count = len(flags)
+    for table, strings in identifiers.items():
+        write_strings(os.path.join(index_dir, table), strings)
+    del identifiers
+    meta = {
+        'format': INDEX_FORMAT,
+        'revision': revision,
+        'doc_count': doc_count,
+        'avg_lengths': {}
+    }
+    for field in TEXT_FIELDS:
+        postings = text_postings.pop(field)
+        terms = sorted(postings)
+        offsets = array('I', [0])
+        doc_numbers = array('I')
+        frequencies = array('I')
+        for term in terms:
+            doc_numbers.extend(doc_number for doc_number, _ in postings[term])
+            frequencies.extend(frequency for _, frequency in postings[term])
+            offsets.append(len(doc_numbers))
+        del postings
+        lengths = text_lengths[field]
+        meta['avg_lengths'][field] = sum(lengths) / len(lengths) if lengths else 0.0
+        write_strings(os.path.join(index_dir, '%s.terms' % field), terms)
+        write_uint32(os.path.join(index_dir, '%s.postings' % field), offsets)
+        write_uint32(os.path.join(index_dir, '%s.docs' % field), doc_numbers)
+        write_uint32(os.path.join(index_dir, '%s.freqs' % field), frequencies)
+        write_uint32(os.path.join(index_dir, '%s.lengths' % field), lengths)
+        if field in PATH_FIELDS:
+            gram_postings = {}
+            for term_number, term in enumerate(terms):
+                for gram in term_grams(term):
+                    gram_postings.setdefault(gram, []).append(term_number)
+            write_postings(index_dir, field, gram_postings, 'grams', 'gram_postings', 'gram_terms')
+    for field in KEYWORD_FIELDS:
+        write_postings(index_dir, field, keyword_postings[field], 'terms', 'postings', 'docs')
+    with open(os.path.join(index_dir, 'flags'), 'wb') as flags_fd:
+        flags_fd.write(flags)
+    # Written last, an index without meta.json is incomplete.
+    with open(os.path.join(index_dir, 'meta.json'), 'w') as meta_fd:
+        json.dump(meta, meta_fd)
+    return doc_count
+
+def build_index_from_spool(spool_path, index_dir, revision=None):
+    """build_index of the documents spooled as JSON lines."""
+    with open(spool_path) as spool_fd:
+        return build_index((json.loads(line) for line in spool_fd), index_dir, revision)
+
+class IndexUnavailable(Exception):
+    """No embedded search index has been built yet."""
+
+class EmbeddedIndex:
+    """A read-only index built by build_index."""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'meta.json')) as meta_fd:
+            meta = json.load(meta_fd)
+        if meta.get('format') != INDEX_FORMAT:
+            raise ValueError('Embedded search index %s is of another format!' % index_dir)
+        self.revision = meta['revision']
+        self.doc_count = meta['doc_count']
+        self.avg_lengths = meta['avg_lengths']
+        self.keys = StringTable(os.path.join(index_dir, 'keys'))
+        self.human_ids = StringTable(os.path.join(index_dir, 'human_ids'))
+        self.machine_ids = StringTable(os.path.join(index_dir, 'machine_ids'))
+        self.flags = map_bytes(os.path.join(index_dir, 'flags'))
+        self.terms = {}
+        self.offsets = {}
+        self.doc_numbers = {}
+        self.frequencies = {}
+        self.lengths = {}
+        self.grams = {}
+        self.gram_offsets = {}
+        self.gram_terms = {}
+        for field in list(TEXT_FIELDS) + list(KEYWORD_FIELDS):
+            self.terms[field] = StringTable(self.path(field, 'terms'))
+            self.offsets[field] = map_uint32(self.path(field, 'postings'))
+            self.doc_numbers[field] = map_uint32(self.path(field, 'docs'))
+        for field in TEXT_FIELDS:
+            self.frequencies[field] = map_uint32(self.path(field, 'freqs'))
+            self.lengths[field] = map_uint32(self.path(field, 'lengths'))
+        for field in PATH_FIELDS:
+            self.grams[field] = StringTable(self.path(field, 'grams'))
+            self.gram_offsets[field] = map_uint32(self.path(field, 'gram_postings'))
+            self.gram_terms[field] = map_uint32(self.path(field, 'gram_terms'))
+
+    def __len__(self):
+        return self.doc_count
+
+    def path(self, field, kind):
+        return os.path.join(self.index_dir, '%s.%s' % (field, kind))
+
+    def postings(self, field, term):
+        """(doc numbers, frequencies) of a term, empty if not indexed."""
+        term_number = self.terms[field].find(term)
+        if term_number is None:
+            offset, end = 0, 0
+        else:
+            offset, end = self.offsets[field][term_number], self.offsets[field][term_number + 1]
+        frequencies = self.frequencies.get(field)
+        return (
+            self.doc_numbers[field][offset:end],
+            frequencies[offset:end] if frequencies is not None else None
+        )
+
+    def keyword_docs(self, field, values):
+        docs = set()
+        for value in values:
+            docs.update(self.postings(field, value)[0])
+        return docs
+
+    def score_field(self, field, groups, boost):
+        """{doc number: BM25 score} of the documents matching every group.
+        Alternatives in a group are scored like one term, Lucene's
+        SynonymQuery, with summed frequencies and the largest df.
+        """
+        if not groups:
+            return {}
+        group_scores = []
+        for group in groups:
+            frequencies = {}
+            doc_freq = 0
+            for term in group:
+                doc_numbers, term_frequencies = self.postings(field, term)
+                doc_freq = max(doc_freq, len(doc_numbers))
+                for doc_number, frequency in zip(doc_numbers, term_frequencies):
+                    frequencies[doc_number] = frequencies.get(doc_number, 0) + frequency
+            if not frequencies:
+                return {}
+            idf = math.log(1 + (self.doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+            group_scores.append((idf, frequencies))
+        group_scores.sort(key=lambda group_score: len(group_score[1]))
+        matches = set(group_scores[0][1])
+        for _, frequencies in group_scores[1:]:
+            matches.intersection_update(frequencies)
+            if not matches:
+                return {}
+        lengths = self.lengths[field]
+        avg_length = self.avg_lengths[field] or 1.0
+        scores = {}
+        for doc_number in matches:
+            length_norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[doc_number] / avg_length)
+            score = 0.0
+            for idf, frequencies in group_scores:
+                frequency = frequencies[doc_number]
+                score += idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+            scores[doc_number] = boost * score
+        return scores
+
+    def prefix_groups(self, field, filter_str):
+        """Each path element of the query expanded to the terms it prefixes."""
+        terms = self.terms[field]
+        groups = []
+        for element in query_path_elements(filter_str):
+            start = terms.bisect_left(element)
+            end = terms.bisect_left(element + '\uffff', start)
+            groups.append(set(terms[number] for number in range(start, min(end, start + MAX_EXPANSIONS))))
+        return groups
+
+    def gram_term_numbers(self, field, gram_number):
+        offsets = self.gram_offsets[field]
+        return self.gram_terms[field][offsets[gram_number]:offsets[gram_number + 1]]
+
+    def candidate_terms(self, field, element):
+        """Ascending numbers of the terms which may contain element: those
+        of every trigram of element, or for elements shorter than a trigram
+        those of the trigrams containing it.
+        """
+        grams = self.grams[field]
+        if len(element) < 3:
+            return heapq.merge(*[
+                self.gram_term_numbers(field, gram_number)
+                for gram_number in range(len(grams)) if element in grams[gram_number]
+            ])
+        gram_terms = []
+        for gram in term_grams(element):
+            gram_number = grams.find(gram)
+            if gram_number is None:
+                return iter(())
+            gram_terms.append(self.gram_term_numbers(field, gram_number))
+        gram_terms.sort(key=len)
+        return (
+            term_number for term_number in gram_terms[0]
+            if all(contains_sorted(other_terms, term_number) for other_terms in gram_terms[1:])
+        )
+
+    def substring_groups(self, field, filter_str):
+        """Each path element of the query expanded to the terms containing it."""
+        terms = self.terms[field]
+        groups = []
+        for element in query_path_elements(filter_str):
+            group = set()
+            for term_number in self.candidate_terms(field, element):
+                term = terms[term_number]
+                if element in term:
+                    group.add(term)
+                    if len(group) == MAX_EXPANSIONS:
+                        break
+            groups.append(group)
+        return groups
+
+    def search(self, filter_os_releases, filter_dmls, filter_str, exclude_config=True, only_leaves=True, num_results=150, match_mode='token'):
+        """Same arguments and result as views.fetch_search_data_paths_es.
+        The prefix and substring match modes work on the indexed terms of
+        the paths rather than on n-grams.
+        """
+        start = time.time()
+        scores = {}
+        for field, boost in TEXT_FIELDS.items():
+            if match_mode == 'token':
+                groups = query_groups(field, filter_str)
+            elif field not in PATH_FIELDS:
+                continue
+            elif match_mode == 'prefix':
+                groups = self.prefix_groups(field, filter_str)
+            else:
+                groups = self.substring_groups(field, filter_str)
+            for doc_number, score in self.score_field(field, groups, boost).items():
+                scores[doc_number] = scores.get(doc_number, 0.0) + score
+        if filter_os_releases:
+            allowed = self.keyword_docs('os_release', [
+                '%s - %s' % (os_name, release_name)
+                for os_name, release_names in filter_os_releases.items()
+                for release_name in release_names
+            ])
+            scores = dict((doc_number, score) for doc_number, score in scores.items() if doc_number in allowed)
+        if filter_dmls:
+            allowed = self.keyword_docs('dml_name', filter_dmls)
+            scores = dict((doc_number, score) for doc_number, score in scores.items() if doc_number in allowed)
+        if filter_os_releases or filter_dmls or exclude_config or only_leaves:
+            flags = self.flags
+            leaf_flag = IS_LEAF if only_leaves else 0
+            scores = dict(
+                (doc_number, score) for doc_number, score in scores.items()
+                if (flags[doc_number] & IS_LEAF) == leaf_flag
+                and not (exclude_config and flags[doc_number] & IS_CONFIGURABLE)
+            )
+        results = OrderedDict()
+        results['took'] = 0
+        results['hits'] = len(scores)
+        results['human_id'] = OrderedDict()
+        keys = self.keys
+        for doc_number in sorted(scores, key=lambda doc_number: (-scores[doc_number], keys[doc_number])):
+            human_id = self.human_ids[doc_number]
+            if human_id not in results['human_id']:
+                if len(results['human_id']) == num_results:
+                    break
+                results['human_id'][human_id] = {
+                    'relevance': scores[doc_number],
+                    'machine_id': {}
+                }
+            results['human_id'][human_id]['machine_id'][keys[doc_number]] = self.machine_ids[doc_number]
+        results['took'] = int(1000 * (time.time() - start))
+        return results
+
+class EmbeddedSearch(RevisionedIndex):
+    """Keeps the newest EmbeddedIndex of index_dir open and rebuilds it
+    from ArangoDB when the catalog revision of the ETL changes. Documents
+    are spooled to disk by the rebuilding greenlet, which owns the database
+    connection, and indexed in a native thread off the event loop.
+    """
+
+    documents_query = """
+    FOR dp IN DataPath
+        LET dms = (
+            FOR dm IN 1..1 INBOUND dp DataPathFromDataModel
+                RETURN dm
+        )
+        LET dml_names = UNIQUE(
+            FOR dml_dm IN dms
+                FOR dml IN 1..1 INBOUND dml_dm OfDataModelLanguage
+                    RETURN dml.name
+        )
+        FILTER LENGTH(dml_names) != 0
+        RETURN {
+            "dp_key": dp._key,
+            "dp_machine_id": dp.machine_id,
+            "dp_human_id": dp.human_id,
+            "dp_description": dp.description,
+            "dp_is_leaf": dp.is_leaf,
+            "dp_is_configurable": dp.is_configurable,
+            "dml_name": dml_names,
+            "os_release": UNIQUE(
+                FOR release_dm IN dms
+                    FOR release IN 1..1 INBOUND release_dm ReleaseHasDataModel
+                        FOR os IN 1..1 INBOUND release OSHasRelease
+                            RETURN CONCAT_SEPARATOR(" - ", os.name, release.name)
+            )
+        }
+    """
+
+    batch_size = 1000
+
+    def __init__(self, get_db, index_dir, wait_timeout=10.0):
+        super().__init__(get_db, 'Embedded search', self.documents_query)
+        self.index_dir = index_dir
+        self.wait_timeout = wait_timeout
+
+    @classmethod
+    def from_config(cls, get_db, config):
+        return cls(get_db, config['SEARCH_EMBEDDED_DIR'], config['SEARCH_EMBEDDED_WAIT'])
+
+    def open_latest(self):
+        """Open the newest complete index of index_dir, if any."""
+        if not os.path.isdir(self.index_dir):
+            return
+        index_dirs = sorted(
+            os.path.join(self.index_dir, name) for name in os.listdir(self.index_dir)
+            if name.startswith('index-') and os.path.exists(os.path.join(self.index_dir, name, 'meta.json'))
+        )
+        if index_dirs:
+            try:
+                self.swap(EmbeddedIndex(index_dirs[-1]))
+            except ValueError:
+                logging.warning('Ignoring %s, it will be rebuilt.', index_dirs[-1])
+
+    def load(self, revision):
+        """Spool the documents to disk, index them in a native thread and
+        open the index once complete.
+        """
+        index_dir = os.path.join(self.index_dir, 'index-%s' % time.strftime('%Y%m%d%H%M%S'))
+        building_dir = index_dir + '.building'
+        shutil.rmtree(building_dir, ignore_errors=True)
+        os.makedirs(building_dir)
+        spool_path = os.path.join(building_dir, 'documents.jsonl')
+        with open(spool_path, 'w') as spool_fd:
+            for document in self.iter_rows():
+                spool_fd.write(json.dumps(document))
+                spool_fd.write('\n')
+        run_in_native_thread(build_index_from_spool, spool_path, building_dir, revision)
+        os.remove(spool_path)
+        os.rename(building_dir, index_dir)
+        return EmbeddedIndex(index_dir)
+
+    def swap(self, index):
+        """Serve index, and remove the ones it replaces. Their files stay
+        mapped until in-flight searches release the old index.
+        """
+        super().swap(index)
+        for name in os.listdir(self.index_dir):
+            old_dir = os.path.join(self.index_dir, name)
+            if name.startswith('index-') and old_dir != index.index_dir and not name.endswith('.building'):
+                shutil.rmtree(old_dir, ignore_errors=True)
+
+    def search(self, *args, **kwargs):
+        """EmbeddedIndex.search, waiting up to wait_timeout for the first
+        build. Raises IndexUnavailable if there is still no index.
+        """
+        index = self.index
+        if index is None:
+            self.attempted.wait(self.wait_timeout)
+            index = self.index
+            if index is None:
+                raise IndexUnavailable('Embedded search index is being built, retry shortly!')
+        return index.search(*args, **kwargs)
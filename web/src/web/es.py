@@ -0,0 +1,64 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Process-wide Elasticsearch access.
+A single Elasticsearch client, with its own pool of keep-alive
+connections, is shared by every request like the ArangoDB handle in db.py.
+"""
+import logging
+from elasticsearch import Elasticsearch
+
+# app.config key: (environment variable, default)
+SEARCH_SETTINGS = {
+    'SEARCH_HOSTS': ('SEARCH_HOSTS', 'http://search:9200'),
+    'SEARCH_INDEX': ('SEARCH_INDEX', 'datapath'),
+    'SEARCH_POOL_SIZE': ('SEARCH_POOL_SIZE', 32),
+    'SEARCH_TIMEOUT': ('SEARCH_TIMEOUT', 30.0),
+    'SEARCH_RETRIES': ('SEARCH_RETRIES', 1),
+    'SEARCH_CACHE_SIZE': ('SEARCH_CACHE_SIZE', 256),
+    'SEARCH_CACHE_TTL': ('SEARCH_CACHE_TTL', 300.0)
+}
+
+_es = None
+_index = None
+
+def init_es(config):
+    """Create the shared Elasticsearch client from app.config."""
+    global _es, _index
+    hosts = config['SEARCH_HOSTS']
+    if isinstance(hosts, str):
+        hosts = [host.strip() for host in hosts.split(',')]
+    _es = Elasticsearch(
+        hosts,
+        maxsize=config['SEARCH_POOL_SIZE'],
+        timeout=config['SEARCH_TIMEOUT'],
+        max_retries=config['SEARCH_RETRIES'],
+        retry_on_timeout=config['SEARCH_RETRIES'] > 0
+    )
+    _index = config['SEARCH_INDEX']
+    logging.info(
+        'Elasticsearch pool of %i connection(s) to %s.',
+        config['SEARCH_POOL_SIZE'], ', '.join(hosts)
+    )
+    return _es
+
+def get_es():
+    """The shared Elasticsearch client."""
+    if _es is None:
+        raise RuntimeError('Elasticsearch not initialized, call init_es first!')
+    return _es
+
+def get_search_index():
+    """The index, or alias, DataPaths are searched in."""
+    return _index
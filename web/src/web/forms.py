@@ -13,7 +13,7 @@ See the License for the specific language governing permissions and
 limitations under the License.
 """
 from flask_wtf import FlaskForm
-from wtforms import TextAreaField, SubmitField, SelectMultipleField, StringField, IntegerField, BooleanField, HiddenField
+from wtforms import TextAreaField, SubmitField, SelectMultipleField, SelectField, StringField, IntegerField, BooleanField, HiddenField
 from wtforms.widgets import ListWidget, CheckboxInput
 from wtforms.validators import InputRequired, Required, Optional, Email, NumberRange
 from wtforms.fields.html5 import EmailField, IntegerField
@@ -56,4 +56,9 @@ class SearchFormES(FlaskForm):
     exclude_config = BooleanField('Exclude Config', validators=[Optional()], default=True)
     only_leaves = BooleanField('Leaf Nodes', validators=[Optional()], default=True)
     num_results = IntegerField('Result Limit', validators=[Required()], default=150)
+    match_mode = SelectField('Match', choices=[
+        ('token', 'Whole Words'),
+        ('prefix', 'Word Prefixes'),
+        ('substring', 'Substrings')
+    ], validators=[Optional()], default='token')
     submit = SubmitField('Search')
@@ -0,0 +1,233 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Set-based import of DataPathMatch mappings and Calculations.
+Every DataPath referenced by an import is resolved in one query, existing
+mappings are found in one query, and new documents and edges are inserted
+in batches. Each row gets an entry in the returned report, in input order:
+    {'row': index, 'status': 'inserted' | 'failed', 'message': str | None}
+"""
+import time
+from .db import get_db
+from . import query_cache
+
+INSERT_BATCH_SIZE = 1000
+MAPPING_KEYS = ('_from', '_to', 'author')
+CALCULATION_KEYS = ('name', 'description', 'equation', 'author', 'InCalculation', 'CalculationResult')
+
+def import_mappings(mappings, db=None):
+    """Import DataPathMatch rows of the native dump format,
+    i.e. dicts with _from, _to, author, annotation and optional
+    timestamp, validated, weight, needs_human.
+    """
+    db = db or get_db()
+    report = [new_report_row(index) for index in range(len(mappings))]
+    valid_rows = validate_rows(mappings, MAPPING_KEYS, report)
+    resolved = resolve_datapaths(
+        set(mappings[index]['_from'] for index in valid_rows) | set(mappings[index]['_to'] for index in valid_rows),
+        db
+    )
+    pending = []
+    for index in valid_rows:
+        mapping = mappings[index]
+        dp_one_id, dp_one_error = resolved[mapping['_from']]
+        dp_two_id, dp_two_error = resolved[mapping['_to']]
+        if dp_one_id is None or dp_two_id is None:
+            fail_row(report, index, ' '.join(error for error in (dp_one_error, dp_two_error) if error))
+            continue
+        pending.append((index, dp_one_id, dp_two_id))
+    existing_pairs = fetch_existing_pairs(
+        'DataPathMatch',
+        set(dp_id for _, dp_one_id, dp_two_id in pending for dp_id in (dp_one_id, dp_two_id)),
+        db
+    )
+    new_edges = []
+    for index, dp_one_id, dp_two_id in pending:
+        pair = frozenset((dp_one_id, dp_two_id))
+        if pair in existing_pairs:
+            fail_row(report, index, 'Mapping already exists!')
+            continue
+        existing_pairs.add(pair)
+        mapping = mappings[index]
+        annotation = mapping.get('annotation')
+        needs_human = mapping.get('needs_human', True)
+        new_edges.append({
+            '_from': dp_one_id,
+            '_to': dp_two_id,
+            'timestamp': mapping.get('timestamp') or time.time(),
+            'author': mapping['author'],
+            'validated': mapping.get('validated', False),
+            'weight': mapping.get('weight', 0),
+            'annotation': annotation,
+            'needs_human': needs_human or True if annotation else False
+        })
+        report[index]['status'] = 'inserted'
+    insert_documents('DataPathMatch', new_edges, db)
+    if new_edges:
+        query_cache.bump_revision()
+    return report
+
+def import_calculations(calculations, db=None):
+    """Import Calculation rows of the native dump format, i.e. dicts with
+    name, description, equation, author, InCalculation and CalculationResult.
+    """
+    db = db or get_db()
+    report = [new_report_row(index) for index in range(len(calculations))]
+    valid_rows = validate_rows(calculations, CALCULATION_KEYS, report)
+    identifiers = set()
+    for index in valid_rows:
+        identifiers.update(calculations[index]['InCalculation'])
+        identifiers.update(calculations[index]['CalculationResult'])
+    resolved = resolve_datapaths(identifiers, db)
+    existing_names = set(execute(
+        """
+        FOR calc IN Calculation
+            FILTER calc.name IN @names
+            RETURN calc.name
+        """,
+        {'names': list(set(calculations[index]['name'] for index in valid_rows))},
+        db
+    ))
+    new_calculations = []
+    new_calculation_edges = []
+    for index in valid_rows:
+        calculation = calculations[index]
+        name = calculation['name']
+        if name in existing_names:
+            fail_row(report, index, 'Calculation of name %s already exists!' % name)
+            continue
+        errors = [
+            resolved[identifier][1]
+            for identifier in calculation['InCalculation'] + calculation['CalculationResult']
+            if resolved[identifier][0] is None
+        ]
+        if errors:
+            fail_row(report, index, ' '.join(errors))
+            continue
+        existing_names.add(name)
+        new_calculations.append({
+            'name': name,
+            'description': calculation['description'],
+            'equation': calculation['equation'],
+            'author': calculation['author']
+        })
+        new_calculation_edges.append((
+            set(resolved[identifier][0] for identifier in calculation['InCalculation']),
+            set(resolved[identifier][0] for identifier in calculation['CalculationResult'])
+        ))
+        report[index]['status'] = 'inserted'
+    calc_ids = insert_documents('Calculation', new_calculations, db)
+    in_calculation_edges = []
+    calculation_result_edges = []
+    for calc_id, (in_calculation_ids, calculation_result_ids) in zip(calc_ids, new_calculation_edges):
+        for dp_id in in_calculation_ids:
+            in_calculation_edges.append({'_from': dp_id, '_to': calc_id})
+        for dp_id in calculation_result_ids:
+            calculation_result_edges.append({'_from': calc_id, '_to': dp_id})
+    insert_documents('InCalculation', in_calculation_edges, db)
+    insert_documents('CalculationResult', calculation_result_edges, db)
+    if calc_ids:
+        query_cache.bump_revision()
+    return report
+
+def resolve_datapaths(identifiers, db=None):
+    """{identifier: (DataPath _id, None) | (None, error message)}
+    An identifier resolves by machine_id first, then by human_id
+    if it is the human_id of exactly one DataPath.
+    """
+    db = db or get_db()
+    identifiers = list(identifiers)
+    resolve_query = """
+    FOR match IN UNION(
+        (FOR dp_machine IN DataPath
+            FILTER dp_machine.machine_id IN @identifiers
+            RETURN [dp_machine.machine_id, dp_machine._id, "machine_id"]),
+        (FOR dp_human IN DataPath
+            FILTER dp_human.human_id IN @identifiers
+            RETURN [dp_human.human_id, dp_human._id, "human_id"])
+    )
+        RETURN match
+    """
+    by_machine_id = {}
+    by_human_id = {}
+    for identifier, dp_id, field in execute(resolve_query, {'identifiers': identifiers}, db):
+        if field == 'machine_id':
+            by_machine_id[identifier] = dp_id
+        else:
+            by_human_id.setdefault(identifier, []).append(dp_id)
+    resolved = {}
+    for identifier in identifiers:
+        if identifier in by_machine_id:
+            resolved[identifier] = (by_machine_id[identifier], None)
+        elif len(by_human_id.get(identifier, [])) == 1:
+            resolved[identifier] = (by_human_id[identifier][0], None)
+        elif identifier in by_human_id:
+            resolved[identifier] = (None, 'More than one DataPath exists for %s!' % identifier)
+        else:
+            resolved[identifier] = (None, 'Could not find %s!' % identifier)
+    return resolved
+
+def fetch_existing_pairs(edge_collection, vertex_ids, db=None):
+    """Set of frozenset({_from, _to}) of the edges touching vertex_ids,
+    so that membership tests ignore direction.
+    """
+    db = db or get_db()
+    existing_query = """
+    FOR edge IN UNION_DISTINCT(
+        (FOR edge_from IN @@edge_collection
+            FILTER edge_from._from IN @vertex_ids
+            RETURN [edge_from._from, edge_from._to]),
+        (FOR edge_to IN @@edge_collection
+            FILTER edge_to._to IN @vertex_ids
+            RETURN [edge_to._from, edge_to._to])
+    )
+        RETURN edge
+    """
+    bind_vars = {'@edge_collection': edge_collection, 'vertex_ids': list(vertex_ids)}
+    return set(frozenset(edge) for edge in execute(existing_query, bind_vars, db))
+
+def insert_documents(collection, documents, db=None):
+    """Insert documents in batches, returning their _ids in order."""
+    db = db or get_db()
+    insert_query = """
+    FOR doc IN @batch
+        INSERT doc INTO @@collection
+        RETURN NEW._id
+    """
+    inserted_ids = []
+    for start in range(0, len(documents), INSERT_BATCH_SIZE):
+        bind_vars = {'batch': documents[start:start + INSERT_BATCH_SIZE], '@collection': collection}
+        inserted_ids.extend(execute(insert_query, bind_vars, db))
+    return inserted_ids
+
+def execute(query, bind_vars, db):
+    return list(db.aql.execute(query, bind_vars=bind_vars, batch_size=INSERT_BATCH_SIZE))
+
+def validate_rows(rows, required_keys, report):
+    """Indexes of the rows which have all required keys, failing the others."""
+    valid_rows = []
+    for index, row in enumerate(rows):
+        missing_keys = [key for key in required_keys if not isinstance(row, dict) or key not in row]
+        if missing_keys:
+            fail_row(report, index, 'Missing %s!' % ', '.join(missing_keys))
+            continue
+        valid_rows.append(index)
+    return valid_rows
+
+def new_report_row(index):
+    return {'row': index, 'status': 'failed', 'message': None}
+
+def fail_row(report, index, message):
+    report[index]['status'] = 'failed'
+    report[index]['message'] = message
@@ -0,0 +1,172 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Resolution of paths as seen on the wire to DataPaths.
+YANG machine_ids, /module:prefix:name/..., are indexed by their element
+names alone, e.g. /interfaces/interface/state. A given path has its list
+keys stripped and its elements split in to qualifier and name, in any
+of the forms machine_id_extract_xpath produces or gNMI uses, and is
+looked up by its names. Candidates are then narrowed by the module or
+prefix qualifiers the path states. Anything which isn't a path, e.g.
+an OID, is looked up exactly by machine_id and then human_id.
+
+match_type is one of
+    exact       the path is a machine_id
+    normalized  the path resolved to a single machine_id once normalized
+    human_id    the path is the human_id of a single DataPath
+    ambiguous   several DataPaths match, listed in candidates
+    not_found
+"""
+import re
+
+re_list_keys = re.compile(r'\[[^\]]*\]')
+MAX_CANDIDATES = 10
+
+def split_element(element):
+    """(qualifier, name) of a path element. The qualifier is
+    (module, prefix) in machine_ids, a module or prefix otherwise.
+    """
+    parts = element.split(':')
+    if len(parts) == 1:
+        return None, element
+    if len(parts) == 3:
+        return (parts[0], parts[1]), parts[2]
+    return parts[0], parts[-1]
+
+def parse_xpath(path):
+    """[(qualifier, name)] of an XPath-like path, or None if not a path.
+    A leading / is optional and list keys may contain /.
+    """
+    if '[' in path:
+        path = re_list_keys.sub('', path)
+    if '/' not in path and ':' not in path:
+        return None
+    return [split_element(element) for element in path.strip('/').split('/') if element]
+
+def parse_gnmi(path):
+    """[(qualifier, name)] of a gNMI Path in its JSON form,
+    {"elem": [{"name": ..., "key": {...}}, ...]}, keys being ignored.
+    """
+    elements = []
+    for elem in path.get('elem') or []:
+        name = elem.get('name') if isinstance(elem, dict) else None
+        if not name:
+            return None
+        elements.append(split_element(name))
+    return elements or None
+
+def qualifier_matches(given, qualifier):
+    """Whether a given qualifier agrees with the (module, prefix) indexed."""
+    if isinstance(given, tuple):
+        return given == qualifier
+    return given in qualifier
+
+class PathIndex:
+    """machine_ids by their element names, and exact lookups."""
+
+    def __init__(self, datapaths, revision=None):
+        """datapaths is an iterable of [_key, human_id, machine_id]."""
+        self.revision = revision
+        self.count = 0
+        self.by_names = {}
+        self.by_machine_id = {}
+        self.by_human_id = {}
+        for _key, human_id, machine_id in datapaths:
+            self.count += 1
+            if machine_id:
+                self.by_machine_id[machine_id] = _key
+                if machine_id.startswith('/'):
+                    elements = [split_element(element) for element in machine_id[1:].split('/')]
+                    names = '/'.join(name for _, name in elements)
+                    qualifiers = tuple(qualifier for qualifier, _ in elements)
+                    self.by_names.setdefault(names, []).append((_key, machine_id, qualifiers))
+            if human_id:
+                # None marks a human_id shared by several DataPaths.
+                self.by_human_id[human_id] = None if human_id in self.by_human_id else (_key, machine_id)
+
+    def __len__(self):
+        return self.count
+
+    def resolve(self, path):
+        """{_key, machine_id, match_type} of a path string or gNMI Path."""
+        if isinstance(path, dict):
+            elements = parse_gnmi(path)
+            return self.resolve_elements(elements) if elements else resolution(None, None, 'not_found')
+        if not isinstance(path, str):
+            return resolution(None, None, 'not_found')
+        path = path.strip()
+        _key = self.by_machine_id.get(path)
+        if _key is not None:
+            return resolution(_key, path, 'exact')
+        elements = parse_xpath(path)
+        if elements:
+            result = self.resolve_elements(elements)
+            if result['match_type'] != 'not_found':
+                return result
+        return self.resolve_identifier(path)
+
+    def resolve_elements(self, elements):
+        candidates = self.by_names.get('/'.join(name for _, name in elements))
+        if not candidates:
+            return resolution(None, None, 'not_found')
+        if any(qualifier is not None for qualifier, _ in elements):
+            candidates = self.narrow(elements, candidates)
+            if not candidates:
+                return resolution(None, None, 'not_found')
+        if len(candidates) > 1:
+            result = resolution(None, None, 'ambiguous')
+            result['candidates'] = [machine_id for _, machine_id, _ in candidates[:MAX_CANDIDATES]]
+            return result
+        _key, machine_id, _ = candidates[0]
+        return resolution(_key, machine_id, 'normalized')
+
+    def narrow(self, elements, candidates):
+        """The candidates agreeing with the qualifiers stated in elements
+        which agree best with the qualifiers inherited by the elements
+        following them, as machine_id_extract_xpath elides repeated ones.
+        """
+        scored = []
+        for _key, machine_id, qualifiers in candidates:
+            score = 0
+            inherited = None
+            for (given, _), qualifier in zip(elements, qualifiers):
+                if given is None:
+                    if inherited is not None and qualifier_matches(inherited, qualifier):
+                        score += 1
+                elif qualifier_matches(given, qualifier):
+                    inherited = given
+                else:
+                    break
+            else:
+                scored.append((score, (_key, machine_id, qualifiers)))
+        if not scored:
+            return []
+        best = max(score for score, _ in scored)
+        return [candidate for score, candidate in scored if score == best]
+
+    def resolve_identifier(self, identifier):
+        """Exact lookup of a non-path, e.g. an OID with or without a leading dot."""
+        for machine_id in (identifier, identifier.lstrip('.')):
+            _key = self.by_machine_id.get(machine_id)
+            if _key is not None:
+                return resolution(_key, machine_id, 'exact')
+        if identifier in self.by_human_id:
+            datapath = self.by_human_id[identifier]
+            if datapath is None:
+                return resolution(None, None, 'ambiguous')
+            return resolution(datapath[0], datapath[1], 'human_id')
+        return resolution(None, None, 'not_found')
+
+def resolution(_key, machine_id, match_type):
+    return {'_key': _key, 'machine_id': machine_id, 'match_type': match_type}
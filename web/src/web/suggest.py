@@ -0,0 +1,80 @@
+"""Copyright 2018 Cisco Systems
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+"""Typeahead of DataPath identifiers.
+The lowercased human_id and machine_id of every DataPath are kept in a
+sorted array which is binary searched for the first match of a prefix,
+matches then being contiguous. Built from ArangoDB at startup and rebuilt
+in the background when the ETL's catalog revision changes.
+"""
+import bisect
+from array import array
+
+HUMAN_ID = 0
+MACHINE_ID = 1
+MATCHED_FIELDS = ('human_id', 'machine_id')
+
+# Rows of SuggestIndex and resolve.PathIndex, see cache.RevisionedIndex.
+DATAPATH_IDS_QUERY = """
+FOR dp IN DataPath
+    RETURN [dp._key, dp.human_id, dp.machine_id]
+"""
+
+class SuggestIndex:
+    """Sorted prefix index over the identifiers of DataPaths."""
+
+    def __init__(self, datapaths, revision=None):
+        """datapaths is an iterable of [_key, human_id, machine_id]."""
+        self.revision = revision
+        self.datapaths = []
+        entries = []
+        for datapath in datapaths:
+            dp_number = len(self.datapaths)
+            self.datapaths.append(tuple(datapath))
+            for field in (HUMAN_ID, MACHINE_ID):
+                identifier = datapath[field + 1]
+                if identifier:
+                    entries.append((identifier.lower(), dp_number, field))
+        entries.sort()
+        self.identifiers = [identifier for identifier, _, _ in entries]
+        self.dp_numbers = array('I', (dp_number for _, dp_number, _ in entries))
+        self.fields = bytes(field for _, _, field in entries)
+
+    def __len__(self):
+        return len(self.datapaths)
+
+    def suggest(self, prefix, limit=10):
+        """Up to limit DataPaths with a human_id or machine_id starting
+        with prefix, case insensitively, in identifier order.
+        """
+        prefix = prefix.lower()
+        identifiers = self.identifiers
+        suggestions = []
+        seen = set()
+        position = bisect.bisect_left(identifiers, prefix)
+        while position < len(identifiers) and len(suggestions) < limit:
+            if not identifiers[position].startswith(prefix):
+                break
+            dp_number = self.dp_numbers[position]
+            if dp_number not in seen:
+                seen.add(dp_number)
+                _key, human_id, machine_id = self.datapaths[dp_number]
+                suggestions.append({
+                    '_key': _key,
+                    'human_id': human_id,
+                    'machine_id': machine_id,
+                    'matched': MATCHED_FIELDS[self.fields[position]]
+                })
+            position += 1
+        return suggestions
@@ -16,16 +16,17 @@ import json
 import csv
 import time
 import io
+import zlib
 from collections import OrderedDict
+from itertools import islice
 import flask
-from itertools import chain
-from arango import ArangoClient
-from elasticsearch import Elasticsearch
 from werkzeug.utils import secure_filename
 from . import forms
-from . import app
-
-ARANGO_PORT = 8529
+from . import app, query_cache, search_cache, embedded_search, suggest_index, path_index
+from .db import get_db
+from .es import get_es, get_search_index
+from .embedded_search import IndexUnavailable
+from .mapping_import import import_mappings, import_calculations
 
 @app.route('/')
 def index():
@@ -54,7 +55,7 @@ def fetch_all_matches():
         }
     )
     """
-    return query_db(all_matches_query)
+    return query_db(all_matches_query, cache=True)
 
 @app.route('/matchmaker')
 def matchmaker():
@@ -84,36 +85,153 @@ def datapath_match(_key):
 @app.route('/datapath/view/<int:_key>')
 def datapath_details(_key):
     match_form = forms.DataPathMatchForm()
+    details = fetch_datapath_details(_key)
+    if not details:
+        flask.abort(404)
     datapath_oses = set()
-    for dp_graph in fetch_datapath_os_graph(_key):
-        dp_os = dp_graph['os_name']
-        if dp_os:
-            if dp_graph['os_release']:
-                dp_os = '%s - %s' % (dp_os, dp_graph['os_release'])
-            datapath_oses.add(dp_os)
     datapath_dmls = set()
     datapath_models = {}
-    for dp_graph in fetch_datapath_dml_graph(_key):
-        dml_name = dp_graph['dml_name']
-        if dml_name:
-            datapath_dmls.add(dml_name)
-        datamodel_name = dp_graph['datamodel_name']
-        if datamodel_name:
-            if datamodel_name not in datapath_models.keys():
-                datapath_models[datamodel_name] = []
-            datapath_models[datamodel_name].append({'revision': dp_graph['datamodel_revision'] or '', 'dml': dml_name})
+    for datamodel in details['models']:
+        for dp_release in datamodel['releases']:
+            dp_os = dp_release['os_name']
+            if dp_os:
+                if dp_release['os_release']:
+                    dp_os = '%s - %s' % (dp_os, dp_release['os_release'])
+                datapath_oses.add(dp_os)
+        for dml_name in datamodel['dmls']:
+            if dml_name:
+                datapath_dmls.add(dml_name)
+            datamodel_name = datamodel['name']
+            if datamodel_name:
+                if datamodel_name not in datapath_models.keys():
+                    datapath_models[datamodel_name] = []
+                datapath_models[datamodel_name].append({'revision': datamodel['revision'] or '', 'dml': dml_name})
     return flask.render_template('datapath.html',
-        datapath=fetch_datapath(_key),
+        datapath=details['datapath'],
         datapath_models=datapath_models,
         datapath_oses=datapath_oses,
         datapath_dmls=datapath_dmls,
-        datapath_parent=fetch_datapath_parent(_key),
-        datapath_children=fetch_datapath_children(_key),
-        datapath_datatypes=fetch_datapath_datatype(_key),
-        datapath_mappings=fetch_datapath_mappings(_key),
+        datapath_parent=details['parents'],
+        datapath_children=details['children'],
+        datapath_datatypes=details['datatypes'],
+        datapath_mappings=details['mappings'],
         match_form=match_form
     )
 
+@app.route('/api/v1/datapath/<int:_key>')
+def api_datapath_details(_key):
+    details = fetch_datapath_details(_key)
+    if not details:
+        return flask.jsonify({'error': 'DataPath not found!'}), 404
+    return flask.jsonify(details)
+
+SUGGEST_MAX_LIMIT = 50
+
+@app.route('/api/v1/datapath/suggest')
+def api_datapath_suggest():
+    prefix = flask.request.args.get('q', '').strip()
+    limit = max(1, min(flask.request.args.get('limit', 10, type=int), SUGGEST_MAX_LIMIT))
+    suggestions = []
+    if prefix:
+        query_cache.check_revision()
+        suggest_index.ensure_revision(query_cache.catalog_revision)
+        index = suggest_index.index
+        if index is None:
+            return flask.jsonify({'error': 'Suggest index is being built, retry shortly!'}), 503
+        suggestions = index.suggest(prefix, limit)
+    return flask.jsonify({'query': prefix, 'suggestions': suggestions})
+
+RESOLVE_MAX_PATHS = 100000
+
+@app.route('/api/v1/resolve/batch', methods=['POST'])
+def api_resolve_batch():
+    """Resolve {"paths": [...]} of XPaths, gNMI Paths, OIDs or human_ids
+    to DataPaths, see resolve.py. Results are in the order of paths.
+    """
+    api_req = flask.request.get_json(silent=True)
+    paths = api_req.get('paths') if isinstance(api_req, dict) else None
+    if not isinstance(paths, list):
+        return flask.jsonify({'error': 'Expected {"paths": [...]}!'}), 400
+    if len(paths) > RESOLVE_MAX_PATHS:
+        return flask.jsonify({'error': 'At most %i paths per batch!' % RESOLVE_MAX_PATHS}), 400
+    query_cache.check_revision()
+    path_index.ensure_revision(query_cache.catalog_revision)
+    index = path_index.index
+    if index is None:
+        return flask.jsonify({'error': 'Path index is being built, retry shortly!'}), 503
+    results = []
+    for path in paths:
+        result = index.resolve(path)
+        result['path'] = path
+        results.append(result)
+    return flask.jsonify({'revision': index.revision, 'results': results})
+
+def fetch_datapath_details(_key):
+    """Everything the DataPath view displays in a single round trip.
+    Each part is a 1 step traversal which is served by the edge indexes.
+    """
+    datapath_details_query = """
+    LET dp_id = CONCAT("DataPath/", @key)
+    LET datapath = DOCUMENT(dp_id)
+    FILTER datapath != null
+    RETURN {
+        "datapath": datapath,
+        "models": (
+            FOR dm IN 1..1 INBOUND dp_id DataPathFromDataModel
+                SORT dm._id
+                RETURN {
+                    "name": dm.name,
+                    "revision": dm.revision,
+                    "dmls": (
+                        FOR dml IN 1..1 INBOUND dm OfDataModelLanguage
+                            RETURN dml.name
+                    ),
+                    "releases": (
+                        FOR release IN 1..1 INBOUND dm ReleaseHasDataModel
+                            FOR os IN 1..1 INBOUND release OSHasRelease
+                                RETURN {
+                                    "os_name": os.name,
+                                    "os_release": release.name
+                                }
+                    )
+                }
+        ),
+        "parents": (
+            FOR dp_parent IN 1..1 OUTBOUND dp_id DataPathParent
+                SORT dp_parent._id
+                RETURN {
+                    "_key": dp_parent._key,
+                    "human_id": dp_parent.human_id
+                }
+        ),
+        "children": (
+            FOR dp_child IN 1..1 OUTBOUND dp_id DataPathChild
+                SORT dp_child._id
+                RETURN {
+                    "_key": dp_child._key,
+                    "human_id": dp_child.human_id
+                }
+        ),
+        "datatypes": (
+            FOR dt IN 1..1 OUTBOUND dp_id OfDataType
+                RETURN {
+                    "_key": dt._key,
+                    "name": dt.name
+                }
+        ),
+        "mappings": (
+            FOR dp IN 1..1 ANY dp_id DataPathMatch
+                RETURN {
+                    "_key": dp._key,
+                    "human_id": dp.human_id
+                }
+        )
+    }
+    """
+    bind_vars = {'key': _key}
+    details = query_db(datapath_details_query, bind_vars, unlist=False, cache=True)
+    return details[0] if details else None
+
 def fetch_datapath_os_graph(_key):
     datapath_os_graph_query = """
     LET datapath = DOCUMENT(CONCAT('DataPath/', @key))
@@ -173,8 +291,10 @@ def datapath_direct():
 
 def fetch_datapath_arbitrary_id(path):
     datapath_arbitrary_id_query = """
-        FOR dp IN DataPath
-            FILTER dp.human_id == @path || dp.machine_id == @path
+        FOR dp IN UNION_DISTINCT(
+            (FOR dp_machine IN DataPath FILTER dp_machine.machine_id == @path RETURN dp_machine),
+            (FOR dp_human IN DataPath FILTER dp_human.human_id == @path RETURN dp_human)
+        )
             RETURN {
                 '_key': dp._key,
                 'machine_id': dp.machine_id
@@ -250,8 +370,10 @@ def fetch_datapath(_key):
 def fetch_matches(given_dps):
     match_query = """
     LET given_dps = @given_dps
-    FOR dp IN DataPath
-        FILTER dp.human_id IN @given_dps || dp.machine_id IN @given_dps
+    FOR dp IN UNION_DISTINCT(
+        (FOR dp_machine IN DataPath FILTER dp_machine.machine_id IN given_dps RETURN dp_machine),
+        (FOR dp_human IN DataPath FILTER dp_human.human_id IN given_dps RETURN dp_human)
+    )
         LET result = {
             "_key": dp._key,
             "human_id": dp.human_id,
@@ -290,8 +412,10 @@ def fetch_calculations(given_dps):
     calculations_query = """
     WITH DataPath, Calculation
     LET given_dps = @given_dps
-    FOR dp IN DataPath
-    FILTER dp.human_id IN given_dps || dp.machine_id IN given_dps
+    FOR dp IN UNION_DISTINCT(
+        (FOR dp_machine IN DataPath FILTER dp_machine.machine_id IN given_dps RETURN dp_machine),
+        (FOR dp_human IN DataPath FILTER dp_human.human_id IN given_dps RETURN dp_human)
+    )
     LET result = {
         "_key": dp._key,
         "human_id": dp.human_id,
@@ -363,8 +487,10 @@ def fetch_calculations_as_result(given_dps):
     calculations_query = """
     WITH DataPath, Calculation
     LET given_dps = @given_dps
-    FOR dp IN DataPath
-    FILTER dp.human_id IN given_dps || dp.machine_id IN given_dps
+    FOR dp IN UNION_DISTINCT(
+        (FOR dp_machine IN DataPath FILTER dp_machine.machine_id IN given_dps RETURN dp_machine),
+        (FOR dp_human IN DataPath FILTER dp_human.human_id IN given_dps RETURN dp_human)
+    )
     LET result = {
         "_key": dp._key,
         "human_id": dp.human_id,
@@ -400,8 +526,10 @@ def fetch_calculations_as_factor(given_dps):
     calculations_query = """
     WITH DataPath, Calculation
     LET given_dps = @given_dps
-    FOR dp IN DataPath
-    FILTER dp.human_id IN given_dps || dp.machine_id IN given_dps
+    FOR dp IN UNION_DISTINCT(
+        (FOR dp_machine IN DataPath FILTER dp_machine.machine_id IN given_dps RETURN dp_machine),
+        (FOR dp_human IN DataPath FILTER dp_human.human_id IN given_dps RETURN dp_human)
+    )
     LET result = {
         "_key": dp._key,
         "human_id": dp.human_id,
@@ -487,7 +615,15 @@ def fetch_collection_counts(given_collections):
     )
     """
     bind_vars = {'given_collections': given_collections}
-    return query_db(collection_count_query, bind_vars)
+    return query_db(collection_count_query, bind_vars, cache=True)
+
+@app.route('/api/v1/cache/stats')
+def api_cache_stats():
+    return flask.jsonify(query_cache.stats())
+
+@app.route('/api/v1/cache/search/stats')
+def api_search_cache_stats():
+    return flask.jsonify(search_cache.stats())
 
 @app.route('/collection-counts', methods=['POST'])
 def collection_counts():
@@ -550,32 +686,48 @@ def search_deep_api():
     num_results = int(search_form.num_results.data)
     exclude_config = search_form.exclude_config.data
     only_leaves = search_form.only_leaves.data
-    search_query_return = fetch_search_data_paths_es(
-        filter_os_releases, filter_dmls, filter_str,
-        exclude_config, only_leaves, num_results
-    )
-    return_dict = OrderedDict()
-    return_dict['took'] = search_query_return['took']
-    return_dict['hits'] = search_query_return['hits']['total']
-    return_dict['human_id'] = OrderedDict()
-    sorted_human_ids = sorted(search_query_return['aggregations']['human_id']['buckets'], key=lambda k: k['relevance']['value'], reverse=True)
-    for human_id in sorted_human_ids:
-        curr_human_id = return_dict['human_id'][human_id['key']] = {}
-        curr_human_id['relevance'] = human_id['relevance']['value']
-        curr_human_id['machine_id'] = {}
-        for _key in human_id['dp_key']['buckets']:
-            curr_human_id['machine_id'][_key['key']] = _key['machine_id']['buckets'][0]['key']
+    match_mode = search_form.match_mode.data or 'token'
+    try:
+        search_query_return = fetch_search_data_paths_es(
+            filter_os_releases, filter_dmls, filter_str,
+            exclude_config, only_leaves, num_results, match_mode
+        )
+    except IndexUnavailable as e:
+        return flask.jsonify({'error': str(e)}), 503
     # Flask sorts JSON output to improve cacheability, we have disabled this in __init__
     # We should actually restructure this response with relevance as a key instead of relying on ordering
     # in something which is explicitly designated as not requiring ordering (JSON).
-    return flask.jsonify(return_dict)
+    return flask.jsonify(search_query_return)
 
-def fetch_search_data_paths_es(filter_os_releases, filter_dmls, filter_str, exclude_config=True, only_leaves=True, num_results=150):
+# match_mode: fields searched by the multi_match
+SEARCH_MATCH_FIELDS = {
+    'token': ['dp_human_id^3', 'dp_machine_id', 'dp_description'],
+    'prefix': ['dp_human_id.prefix^3', 'dp_machine_id.prefix'],
+    'substring': ['dp_human_id.trigram^3', 'dp_machine_id.trigram']
+}
+
+def fetch_search_data_paths_es(filter_os_releases, filter_dmls, filter_str, exclude_config=True, only_leaves=True, num_results=150, match_mode='token'):
+    """Search the DataPath documents, one per DataPath, and group the
+    hits by human_id in order of relevance until num_results human_ids
+    are found. Pages are fetched with search_after on (_score, dp_key).
+    match_mode token matches whole path elements, prefix the beginnings
+    of path elements, and substring any part of the path.
+    Served in-process instead if the embedded search backend is configured.
+    """
+    if embedded_search is not None:
+        query_cache.check_revision()
+        embedded_search.ensure_revision(query_cache.catalog_revision)
+        return embedded_search.search(
+            filter_os_releases, filter_dmls, filter_str,
+            exclude_config, only_leaves, num_results, match_mode
+        )
     search_body = {
-        'size': 0,
+        'size': num_results,
         'sort': [
-            '_score'
+            {'_score': 'desc'},
+            {'dp_key': 'asc'}
         ],
+        '_source': ['dp_key', 'dp_human_id', 'dp_machine_id'],
         'query': {
             'bool': {
                 'must': [
@@ -584,229 +736,112 @@ def fetch_search_data_paths_es(filter_os_releases, filter_dmls, filter_str, excl
                             'query': filter_str,
                             'operator': 'and',
                             'type': 'most_fields',
-                            'fields': ['dp_human_id^3', 'dp_machine_id', 'dp_description']
+                            'fields': SEARCH_MATCH_FIELDS[match_mode]
                         }
                     }
                 ],
                 'filter': []
             }
-        },
-        'aggs': {
-            'human_id': {
-                'terms': {
-                    'field': 'dp_human_id.keyword',
-                    'size': num_results,
-                    'order': {
-                        'relevance': 'desc'
-                    }
-                },
-                'aggs': {
-                    'relevance': {
-                        'max': {
-                            'script': '_score'
-                        }
-                    },
-                    'dp_key': {
-                        'terms': {
-                            'field': 'dp_key'
-                        },
-                        'aggs': {
-                            'machine_id': {
-                                'terms': {
-                                    'field': 'dp_machine_id.keyword'
-                                }
-                            }
-                        }
-                    }
-                }
-            }
         }
     }
-    def gen_multi_choice_filter(term, choices):
-        return {
-            'bool': {
-                'minimum_should_match': 1,
-                'should': [
-                    {
-                        'match_phrase': {
-                            term: choice
-                        }
-                    } for choice in choices
-                ]
-            }
-        }
-    def gen_boolean_filter(term, state):
-        return {
-            'match_phrase': {
-                term: {
-                    'query': state
-                }
-            }
-        }
+    query_filter = search_body['query']['bool']['filter']
+    # Exact term filters are cached by the ES node query cache.
+    if filter_os_releases:
+        query_filter.append({'terms': {'os_release': sorted(
+            '%s - %s' % (os_name, release_name)
+            for os_name, release_names in filter_os_releases.items()
+            for release_name in release_names
+        )}})
+    if filter_dmls:
+        query_filter.append({'terms': {'dml_name': sorted(filter_dmls)}})
+    if exclude_config:
+        query_filter.append({'term': {'dp_is_configurable': False}})
     if filter_os_releases or filter_dmls or exclude_config or only_leaves:
-        query_filter = search_body['query']['bool']['filter']
-        if filter_os_releases:
-            query_filter.append(
-                gen_multi_choice_filter(
-                    'os_name',
-                    filter_os_releases.keys()
-                )
-            )
-            query_filter.append(
-                gen_multi_choice_filter(
-                    'release_name',
-                    set(
-                        chain.from_iterable(
-                            filter_os_releases.values()
-                        )
-                    )
-                )
-            )
-        if filter_dmls:
-            query_filter.append(
-                gen_multi_choice_filter(
-                    'dml_name',
-                    filter_dmls
-                )
-            )
-        if exclude_config:
-            query_filter.append(
-                gen_boolean_filter('dp_is_configurable', False)
-            )
-        if only_leaves:
-            query_filter.append(
-                gen_boolean_filter('dp_is_leaf', True)
-            )
-        else:
-            query_filter.append(
-                gen_boolean_filter('dp_is_leaf', False)
-            )
-    client = Elasticsearch('http://search:9200')
-    response = client.search(
-        index='datapath',
-        body=search_body
+        query_filter.append({'term': {'dp_is_leaf': bool(only_leaves)}})
+    index = get_search_index()
+    def search_es():
+        results = OrderedDict()
+        results['took'] = 0
+        results['hits'] = 0
+        results['human_id'] = OrderedDict()
+        page_body = dict(search_body)
+        while True:
+            response = get_es().search(index=index, body=page_body)
+            results['took'] += response['took']
+            results['hits'] = response['hits']['total']
+            hits = response['hits']['hits']
+            for hit in hits:
+                human_id = hit['_source']['dp_human_id']
+                if human_id not in results['human_id']:
+                    if len(results['human_id']) == num_results:
+                        return results
+                    # Hits are in descending _score so the first is the max.
+                    results['human_id'][human_id] = {
+                        'relevance': hit['_score'],
+                        'machine_id': {}
+                    }
+                results['human_id'][human_id]['machine_id'][hit['_source']['dp_key']] = hit['_source']['dp_machine_id']
+            if len(hits) < num_results:
+                return results
+            page_body['search_after'] = hits[-1]['sort']
+    return search_cache.get_or_compute(
+        search_cache.make_key('search_es', index, search_body),
+        search_es
     )
-    return response
 
 def fetch_search_data_paths(filter_os_releases, filter_dmls, filter_str, exclude_config=True, only_leaves=True, start_index=0, max_return_count=10):
+    """Search the SearchCatalog materialized by the ETL.
+    The page of start_index and max_return_count is over the whole result,
+    nested in to OS -> Release -> DataModelLanguage -> DataModel -> DataPaths.
+    Rows are scanned in order from the persistent index on the filters and
+    sort, the text match being a lookup in the _keys of the fulltext
+    matches, so documents are only read for the rows of the page.
+    """
     search_data_paths_query = """
-    LET given_os_releases = @filter_os_releases
-    LET given_dmls = @filter_dmls
     LET filter_str = CONCAT_SEPARATOR(",", UNIQUE(SPLIT(SUBSTITUTE(@filter_str, [" ", "-", "/", ":"], ","), ",")))
-
-    LET dml_ids = FLATTEN(
-        FOR dml IN DataModelLanguage
-            FILTER dml.name IN given_dmls
-            RETURN dml._id
-    )
-
-    LET dml_dm_ids = FLATTEN(
-        FOR dml_dm IN OfDataModelLanguage
-            FILTER dml_dm._from IN dml_ids
-            RETURN dml_dm._to
-    )
-
-    LET dml_dm_dp_ids = FLATTEN(
-        FOR dm_dp IN DataPathFromDataModel
-            FILTER dm_dp._from IN dml_dm_ids
-            RETURN dm_dp._to
-    )
-
-    LET filtered_dml_dm_dp_human_ids = FLATTEN(
-        FOR dp IN FULLTEXT(DataPath, "human_id", filter_str)
-            FILTER dp._id IN dml_dm_dp_ids
-            RETURN dp._id
-    )
-
-    LET filtered_dml_dm_dp_machine_ids = FLATTEN(
-        FOR dp IN FULLTEXT(DataPath, "machine_id", filter_str)
-            FILTER dp._id IN dml_dm_dp_ids
-            RETURN dp._id
-    )
-
-    LET filtered_dml_dm_dp_ids = UNION_DISTINCT(filtered_dml_dm_dp_human_ids, filtered_dml_dm_dp_machine_ids)
-
-    LET filtered_dml_dp_dm_ids = FLATTEN(
-        FOR dm_dp IN DataPathFromDataModel
-            FILTER dm_dp._to IN filtered_dml_dm_dp_ids
-            RETURN dm_dp._from
-    )
-
-    RETURN MERGE(
-        FOR os IN OS
-            FILTER os.name IN ATTRIBUTES(given_os_releases)
-            SORT os.name
-            RETURN {
-                [ os.name ]: MERGE(
-                    LET os_releases = FLATTEN(
-                        FOR os_release IN OSHasRelease
-                            FILTER os_release._from == os._id
-                            RETURN os_release._to
-                    )
-                    FOR release IN Release
-                        FILTER release._id IN os_releases
-                        FILTER release.name IN TRANSLATE(os.name, given_os_releases)
-                        SORT release.name
-                        RETURN {
-                            [ release.name ]: MERGE(
-                                LET filtered_release_dms = FLATTEN(
-                                    FOR release_dm IN ReleaseHasDataModel
-                                        FILTER release_dm._from == release._id
-                                        FILTER release_dm._to IN filtered_dml_dp_dm_ids
-                                        RETURN release_dm._to
-                                )
-                                FOR dml IN DataModelLanguage
-                                    FILTER dml._id IN dml_ids
-                                    RETURN {
-                                        [ dml.name ]: MERGE(
-                                            LET filtered_release_dml_dms = FLATTEN(
-                                                FOR dml_dm IN OfDataModelLanguage
-                                                    FILTER dml_dm._from == dml._id
-                                                    FILTER dml_dm._to IN filtered_release_dms
-                                                    RETURN dml_dm._to
-                                            )
-                                            FOR dm IN DataModel
-                                                FILTER dm._id IN filtered_release_dml_dms
-                                                RETURN {
-                                                    [ dm.name ]: FLATTEN(
-                                                        LET filtered_release_dml_dm_dps = FLATTEN(
-                                                            FOR dm_dp IN DataPathFromDataModel
-                                                                FILTER dm_dp._from IN filtered_release_dml_dms
-                                                                FILTER dm_dp._from == dm._id
-                                                                RETURN dm_dp._to
-                                                        )
-                                                        FOR dp IN DataPath
-                                                            FILTER dp._id IN filtered_release_dml_dm_dps
-                                                            FILTER dp._id IN filtered_dml_dm_dp_ids
-                                                            %s
-                                                            %s
-                                                            SORT dp.human_id
-                                                            LIMIT @start_index, @max_return_count
-                                                            RETURN {
-                                                                "_key": dp._key,
-                                                                "human_id": dp.human_id
-                                                            }
-                                                    )
-                                                }
-                                        )
-                                    }
-                            )
-                        }
-                )
-            }
+    LET matched_keys = UNION_DISTINCT(
+        (FOR row_human IN FULLTEXT(SearchCatalog, "human_id", filter_str) RETURN row_human._key),
+        (FOR row_machine IN FULLTEXT(SearchCatalog, "machine_id", filter_str) RETURN row_machine._key)
     )
+    FOR row IN SearchCatalog
+        FILTER row.os_release IN @os_releases
+        FILTER row.dml_name IN @filter_dmls
+        %s
+        %s
+        FILTER row._key IN matched_keys
+        SORT row.os_release, row.dml_name, row.dm_name, row.human_id
+        LIMIT @start_index, @max_return_count
+        RETURN [row.os_name, row.release_name, row.dml_name, row.dm_name, row.dp_key, row.human_id]
     """ % (
-        'FILTER dp.is_configurable == False' if exclude_config else '',
-        'FILTER dp.is_leaf == True' if only_leaves else ''
+        'FILTER row.is_configurable == False' if exclude_config else '',
+        'FILTER row.is_leaf == True' if only_leaves else ''
     )
     bind_vars = {
-        'filter_os_releases': filter_os_releases,
-        'filter_dmls': filter_dmls,
+        'os_releases': sorted(
+            '%s - %s' % (os_name, release_name)
+            for os_name, release_names in filter_os_releases.items()
+            for release_name in release_names
+        ),
+        'filter_dmls': sorted(filter_dmls),
         'filter_str': filter_str,
         'start_index': start_index,
         'max_return_count': max_return_count
     }
-    return query_db(search_data_paths_query, bind_vars)
+    search_results = OrderedDict()
+    for os_name, release_name, dml_name, dm_name, dp_key, human_id in query_db(search_data_paths_query, bind_vars, unlist=False):
+        search_results.setdefault(
+            os_name, OrderedDict()
+        ).setdefault(
+            release_name, OrderedDict()
+        ).setdefault(
+            dml_name, OrderedDict()
+        ).setdefault(
+            dm_name, []
+        ).append({
+            '_key': dp_key,
+            'human_id': human_id
+        })
+    return search_results
 
 def construct_search_form(es=False):
     search_form = None
@@ -828,7 +863,7 @@ def fetch_os_releases():
             SORT os.name ASC, release.name DESC
             RETURN CONCAT_SEPARATOR(" - ", os.name, release.name)
     """
-    return query_db(os_releases_query)
+    return query_db(os_releases_query, cache=True)
 
 def fetch_dmls():
     dmls_query = """
@@ -836,7 +871,7 @@ def fetch_dmls():
         SORT dml.name
         RETURN dml.name
     """
-    return query_db(dmls_query)
+    return query_db(dmls_query, cache=True)
 
 @app.route('/map-bulk', methods=['GET'])
 def html_map_bulk():
@@ -867,7 +902,8 @@ def api_datapath_from_arbitrary_id():
 
 @app.route('/api/v1/map/datapath/bulk', methods=['POST'])
 def api_map_bulk():
-    """Expects CSV with columns _from and _to.
+    """Expects CSV with the columns of the CSV dump,
+    First DataPath, Second DataPath, Author and Annotation.
     """
     mappings_file = None
     if not flask.request.files:
@@ -884,15 +920,27 @@ def api_map_bulk():
         return 'File type is not allowed!', 400
     elif not allowed_file(secure_filename(mappings_file.filename)):
         return 'File appears insecure and not allowed!', 400
-    bulk_results = {'success': [], 'fail': []}
-    with open(mappings_file.save()) as bulk_fd:
-        bulk_csv = csv.DictReader(bulk_fd)
-        for row in bulk_csv:
-            try:
-                map_datapath_single(row['First DataPath'], row['Second DataPath'], row['Author'], row['Annotation'])
-                bulk_results['success'] += [[row['_from'], row['_to']]]
-            except Exception:
-                bulk_results['fail'] += [[row['_from'], row['_to']]]
+    bulk_csv = csv.DictReader(io.TextIOWrapper(mappings_file.stream, encoding='utf-8', newline=''))
+    required_columns = ['First DataPath', 'Second DataPath', 'Author', 'Annotation']
+    if not set(required_columns).issubset(set(bulk_csv.fieldnames or [])):
+        return 'Expected columns %s!' % ', '.join(required_columns), 400
+    mappings = []
+    for row in bulk_csv:
+        mappings.append(
+            {
+                '_from': row['First DataPath'],
+                '_to': row['Second DataPath'],
+                'author': row['Author'],
+                'annotation': row['Annotation']
+            }
+        )
+    report = import_mappings(mappings)
+    bulk_results = {'success': [], 'fail': [], 'report': report}
+    for mapping, row_report in zip(mappings, report):
+        if row_report['status'] == 'inserted':
+            bulk_results['success'] += [[mapping['_from'], mapping['_to']]]
+        else:
+            bulk_results['fail'] += [[mapping['_from'], mapping['_to']]]
     return flask.jsonify(bulk_results)
 
 def allowed_file(filename):
@@ -920,67 +968,30 @@ def api_map_load_native():
         'DataPathMatch': [],
         'Calculation': []
     }
-    for mapping in mappings_json['DataPathMatch']:
-        status = True
-        try:
-            # TODO: JSON key validations
-            map_datapath_single(**mapping)
-        except Exception as e:
+    with query_cache.deferred_bumps():
+        mapping_report = import_mappings(mappings_json.get('DataPathMatch', []))
+        calculation_report = import_calculations(mappings_json.get('Calculation', []))
+    for mapping, row_report in zip(mappings_json.get('DataPathMatch', []), mapping_report):
+        if row_report['status'] == 'failed':
             failures['DataPathMatch'].append(
                 {
-                    '_from': mapping['_from'],
-                    '_to': mapping['_to'],
-                    'message': str(e)
+                    '_from': mapping.get('_from'),
+                    '_to': mapping.get('_to'),
+                    'message': row_report['message']
                 }
             )
-    for calculation in mappings_json['Calculation']:
-        status = True
-        try:
-            # TODO: JSON key validations
-            map_datapath_calculation_single(**calculation)
-        except Exception as e:
+    for calculation, row_report in zip(mappings_json.get('Calculation', []), calculation_report):
+        if row_report['status'] == 'failed':
             failures['Calculation'].append(
                 {
-                    'name': calculation['name'],
-                    'InCalculation': calculation['InCalculation'],
-                    'CalculationResult': calculation['CalculationResult'],
-                    'message': str(e)
+                    'name': calculation.get('name'),
+                    'InCalculation': calculation.get('InCalculation'),
+                    'CalculationResult': calculation.get('CalculationResult'),
+                    'message': row_report['message']
                 }
             )
     return flask.jsonify(failures)
 
-def map_datapath_calculation_single(name, description, equation, author, InCalculation, CalculationResult):
-    in_calculation_ids = set()
-    calculation_result_ids = set()
-    check_fields = ['machine_id', 'human_id']
-    for in_calc in InCalculation:
-        in_calc_doc = check_collection_fields('DataPath', check_fields, in_calc)
-        if in_calc_doc is not None:
-            in_calculation_ids.add(in_calc_doc.next()['_id'])
-    for calc_result in CalculationResult:
-        calc_result_doc = check_collection_fields('DataPath', check_fields, calc_result)
-        if calc_result_doc is not None:
-            calculation_result_ids.add(calc_result_doc.next()['_id'])
-    client = ArangoClient(hosts='http://dbms:{}'.format(ARANGO_PORT))
-    db = client.db('tdm', username='root', password='tdm')
-    calculation_collection = db.collection('Calculation')
-    calculation_exists = calculation_collection.find({'name': name})
-    if calculation_exists.count() > 0:
-        raise Exception('Calculation of name %s already exists!' % name)
-    app.logger.debug('Adding calculation %s', name)
-    calc_doc = calculation_collection.insert(
-        {
-            'name': name,
-            'description': description,
-            'equation': equation,
-            'author': author
-        }
-    )
-    for dp_id in in_calculation_ids:
-        add_mapping('InCalculation', dp_id, calc_doc['_id'])
-    for dp_id in calculation_result_ids:
-        add_mapping('CalculationResult', calc_doc['_id'], dp_id)
-
 def map_datapath_single(_from, _to, author, annotation, timestamp=None, validated=False, weight=0, needs_human=True):
     dp_one_id = None
     dp_two_id = None
@@ -1034,8 +1045,7 @@ def map_datapath_single_by_key(basepath_key, matchpath_key, author, weight, anno
     matchpath = fetch_datapath(matchpath_key)
     if not matchpath:
         raise Exception('Specified matching DataPath not found!')
-    client = ArangoClient(hosts='http://dbms:{}'.format(ARANGO_PORT))
-    db = client.db('tdm', username='root', password='tdm')
+    db = get_db()
     datapath_matches = db.collection('DataPathMatch')
     datapath_match_exist = datapath_matches.find({'_from': basepath['_id'], '_to': matchpath['_id']})
     if datapath_match_exist.count() != 0:
@@ -1056,11 +1066,11 @@ def map_datapath_single_by_key(basepath_key, matchpath_key, author, weight, anno
             'needs_human': False if not annotation or weight == 100 else True
         }
     )
+    query_cache.bump_revision()
 
 def check_collection_fields(collection, fields, value, return_single=True, db=None):
     if db is None:
-        client = ArangoClient(hosts='http://dbms:{}'.format(ARANGO_PORT))
-        db = client.db('tdm', username='root', password='tdm')
+        db = get_db()
     collection_ref = db.collection(collection)
     return_val = None
     exception_messages = []
@@ -1079,8 +1089,7 @@ def check_collection_fields(collection, fields, value, return_single=True, db=No
 
 def add_mapping(edge_collection, from_id, to_id, body=None, check_bidirectional=True, db=None):
     if db is None:
-        client = ArangoClient(hosts='http://dbms:{}'.format(ARANGO_PORT))
-        db = client.db('tdm', username='root', password='tdm')
+        db = get_db()
     collection_ref = db.collection(edge_collection)
     mapping = collection_ref.find({'_from': from_id, '_to': to_id})
     if mapping.count() != 0:
@@ -1094,6 +1103,7 @@ def add_mapping(edge_collection, from_id, to_id, body=None, check_bidirectional=
     body['_from'] = from_id
     body['_to'] = to_id
     collection_ref.insert(body)
+    query_cache.bump_revision()
 
 def map_datapath_single(_from, _to, author, annotation, timestamp=None, validated=False, weight=0, needs_human=True):
     dp_one_id = None
@@ -1125,113 +1135,191 @@ def map_datapath_single(_from, _to, author, annotation, timestamp=None, validate
 
 @app.route('/api/v1/map/dump/csv')
 def api_dump_mappings_csv():
-    mappings = fetch_dump_mappings()
-    output_csv = io.StringIO()
-    csv_writer = csv.DictWriter(
-        output_csv,
-        fieldnames=['First DataPath', 'Second DataPath', 'Author', 'Annotation']
+    def iter_pretty_mappings():
+        for mapping in fetch_dump_mappings():
+            yield {
+                'First DataPath': mapping['first_dp'],
+                'Second DataPath': mapping['second_dp'],
+                'Author': mapping['author'],
+                'Annotation': mapping['annotation']
+            }
+    return send_stream(
+        iter_csv(['First DataPath', 'Second DataPath', 'Author', 'Annotation'], iter_pretty_mappings()),
+        'text/csv',
+        'tdm_mappings.csv'
     )
-    csv_writer.writeheader()
-    for mapping in mappings:
-        pretty_mapping = {
-            'First DataPath': mapping['first_dp'],
-            'Second DataPath': mapping['second_dp'],
-            'Author': mapping['author'],
-            'Annotation': mapping['annotation']
-        }
-        csv_writer.writerow(pretty_mapping)
-    return send_stringio(output_csv, 'text/csv', 'tdm_mappings.csv')
 
 @app.route('/api/v1/map/dump/native')
 def api_dump_mappings_native():
-    mappings = fetch_dump_mappings_native()
-    output_json = io.StringIO()
-    json.dump(
-        mappings,
-        output_json
-    )
-    return send_stringio(output_json, 'application/json', 'tdm_mappings.json')
-
-def send_stringio(stringio_obj, mimetype, filename):
-    """We typically use StringIO but send_file requires BytesIO. Errorless.
-    Wrap it.
+    def iter_native_json():
+        yield '{"DataPathMatch": ['
+        yield from iter_json_array(fetch_dump_mappings_native())
+        yield '], "Calculation": ['
+        yield from iter_json_array(fetch_dump_calculations_native())
+        yield ']}'
+    return send_stream(iter_native_json(), 'application/json', 'tdm_mappings.json')
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+def iter_csv(fieldnames, rows):
+    """Render dict rows as CSV text in chunks."""
+    buffer = io.StringIO()
+    csv_writer = csv.DictWriter(buffer, fieldnames=fieldnames)
+    csv_writer.writeheader()
+    for row in rows:
+        csv_writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def iter_json_array(elements):
+    """Render the elements of a JSON array, without brackets, one at a time."""
+    separator = ''
+    for element in elements:
+        yield separator
+        yield json.dumps(element)
+        separator = ', '
+
+def send_stream(text_chunks, mimetype, filename):
+    """Send text chunks as a chunked attachment, gzipped if the client accepts it.
+    Chunks are coalesced so that each write is STREAM_CHUNK_SIZE or so.
     """
-    stringio_obj.flush()
-    stringio_obj.seek(0)
-    output_buffer = io.BytesIO(stringio_obj.getvalue().encode())
-    output_buffer.flush()
-    stringio_obj.close()
-    output_buffer.seek(0)
-    return flask.send_file(
-        output_buffer,
+    use_gzip = 'gzip' in flask.request.accept_encodings
+    def iter_body():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS) if use_gzip else None
+        pending = []
+        pending_size = 0
+        for text_chunk in text_chunks:
+            pending.append(text_chunk)
+            pending_size += len(text_chunk)
+            if pending_size < STREAM_CHUNK_SIZE:
+                continue
+            body_chunk = ''.join(pending).encode()
+            pending = []
+            pending_size = 0
+            if compressor:
+                body_chunk = compressor.compress(body_chunk)
+            if body_chunk:
+                yield body_chunk
+        body_chunk = ''.join(pending).encode()
+        if compressor:
+            body_chunk = compressor.compress(body_chunk) + compressor.flush()
+        if body_chunk:
+            yield body_chunk
+    headers = {
+        'Content-Disposition': 'attachment; filename=%s' % filename,
+        'Cache-Control': 'no-cache'
+    }
+    if use_gzip:
+        headers['Content-Encoding'] = 'gzip'
+        headers['Vary'] = 'Accept-Encoding'
+    return flask.Response(
+        flask.stream_with_context(iter_body()),
         mimetype=mimetype,
-        attachment_filename=filename,
-        as_attachment=True,
-        cache_timeout=-1
+        headers=headers
     )
 
 def fetch_dump_mappings_native():
     dump_aql = """
-    RETURN {
-        "DataPathMatch": (
-            FOR dpm IN DataPathMatch
-            RETURN {
-                "_from": DOCUMENT(dpm._from).machine_id,
-                "_to": DOCUMENT(dpm._to).machine_id,
-                "author": dpm.author,
-                "annotation": dpm.annotation,
-                "timestamp": dpm.timestamp,
-                "validated": dpm.validated,
-                "weight": dpm.weight,
-                "needs_human": dpm.needs_human
-            }
-        ),
-        "Calculation": (
-            FOR calc IN Calculation
-            RETURN {
-                "name": calc.name,
-                "description": calc.description,
-                "equation": calc.equation,
-                "author": calc.author,
-                "InCalculation": FLATTEN(
-                FOR incalc IN InCalculation
-                    FILTER incalc._to == calc._id
-                    RETURN DOCUMENT(incalc._from).machine_id
-                ),
-                "CalculationResult": FLATTEN(
-                FOR calcresult IN CalculationResult
-                    FILTER calcresult._from == calc._id
-                    RETURN DOCUMENT(calcresult._to).machine_id
-                )
-            }
-        )
-    }
+    FOR dpm IN DataPathMatch
+        RETURN {
+            "_from": dpm._from,
+            "_to": dpm._to,
+            "author": dpm.author,
+            "annotation": dpm.annotation,
+            "timestamp": dpm.timestamp,
+            "validated": dpm.validated,
+            "weight": dpm.weight,
+            "needs_human": dpm.needs_human
+        }
+    """
+    return iter_join_machine_ids(query_db(dump_aql, stream=True), ('_from', '_to'))
+
+def fetch_dump_calculations_native():
+    dump_aql = """
+    FOR calc IN Calculation
+        RETURN {
+            "name": calc.name,
+            "description": calc.description,
+            "equation": calc.equation,
+            "author": calc.author,
+            "InCalculation": (
+                FOR dp IN 1..1 INBOUND calc InCalculation
+                    RETURN dp.machine_id
+            ),
+            "CalculationResult": (
+                FOR dp IN 1..1 OUTBOUND calc CalculationResult
+                    RETURN dp.machine_id
+            )
+        }
     """
-    return query_db(dump_aql)
+    return query_db(dump_aql, stream=True)
 
 def fetch_dump_mappings():
     dump_aql = """
     FOR dpm IN DataPathMatch
         RETURN {
-            "first_dp": DOCUMENT(dpm._from).machine_id,
-            "second_dp": DOCUMENT(dpm._to).machine_id,
+            "first_dp": dpm._from,
+            "second_dp": dpm._to,
             "author": dpm.author,
             "annotation": dpm.annotation
         }
     """
-    return query_db(dump_aql)
-
-def query_db(query, bind_vars=None, unlist=True):
-    """Generically query database."""
-    client = ArangoClient(hosts='http://dbms:{}'.format(ARANGO_PORT))
-    db = client.db('tdm', username='root',password='tdm')
-    cursor = db.aql.execute(query, bind_vars=bind_vars)
-    # TODO: Pass as generator instead of fill array
+    return iter_join_machine_ids(query_db(dump_aql, stream=True), ('first_dp', 'second_dp'))
+
+def iter_join_machine_ids(rows, fields, batch_size=1000):
+    """Replace the DataPath _ids in fields of streamed rows by their
+    machine_ids, looked up by the primary index a batch of rows at a time
+    instead of with a DOCUMENT() per row.
+    """
+    machine_id_query = """
+    FOR dp IN DataPath
+        FILTER dp._id IN @dp_ids
+        RETURN [dp._id, dp.machine_id]
+    """
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        dp_ids = list({row[field] for row in batch for field in fields})
+        machine_ids = dict(query_db(machine_id_query, {'dp_ids': dp_ids}, unlist=False))
+        for row in batch:
+            for field in fields:
+                row[field] = machine_ids.get(row[field])
+            yield row
+
+def query_db(query, bind_vars=None, unlist=True, cache=False, stream=False, batch_size=1000):
+    """Generically query database.
+    cache serves the result from the query cache, only for results which
+    change with the catalog revision and are not mutated by the caller.
+    stream returns a generator over a server-side streaming cursor,
+    fetched batch_size elements at a time, instead of a list.
+    """
+    if stream:
+        return iter_query_db(query, bind_vars, batch_size)
+    if cache:
+        return query_cache.get_or_compute(
+            query_cache.make_key(query, bind_vars, unlist),
+            lambda: query_db(query, bind_vars, unlist)
+        )
+    cursor = get_db().aql.execute(query, bind_vars=bind_vars)
     return_elements = [element for element in cursor]
     if unlist and len(return_elements) == 1:
         return_elements = return_elements[0]
     return return_elements
 
+def iter_query_db(query, bind_vars=None, batch_size=1000):
+    """Generator over the results of a streaming cursor."""
+    cursor = get_db().aql.execute(query, bind_vars=bind_vars, batch_size=batch_size, stream=True)
+    try:
+        for element in cursor:
+            yield element
+    finally:
+        cursor.close(ignore_missing=True)
+
 """Ugly Jinja2 bandaid for XPath issues."""
 
 def machine_id_to_prefixed(machine_id):